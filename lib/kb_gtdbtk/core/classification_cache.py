@@ -0,0 +1,137 @@
+'''
+A persistent, content addressed cache of per genome GTDB-tk results.
+'''
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+# bump if the format of the cached entries changes
+CACHE_FORMAT_VERSION = '1'
+
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def get_file_sha256(path: Path) -> str:
+    '''
+    Get the SHA-256 digest of a file's contents.
+
+    :param path: the path to the file.
+    :returns: the hex digest.
+    '''
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class ClassificationCache:
+    '''
+    An on disk cache of the GTDB-tk summary and marker table rows for individual genomes.
+
+    Entries are keyed by a hash of the genome FASTA file contents plus the GTDB-tk parameters
+    that affect the result, so a genome only needs to be classified once no matter which
+    object or set it was downloaded from. Entries are stored as small JSON files, and the least
+    recently used entries are removed when the total size of the cache exceeds the size limit.
+    The cache may be shared between jobs running concurrently on the same host.
+    '''
+
+    def __init__(self, cache_dir: Path, max_bytes: int):
+        '''
+        Create the cache.
+
+        :param cache_dir: the directory in which to store the cache. Created if missing.
+        :param max_bytes: the maximum size of the cache in bytes.
+        '''
+        if max_bytes < 1:
+            raise ValueError('max_bytes must be > 0')
+        self._cache_dir = Path(cache_dir)
+        self._max_bytes = max_bytes
+        self._cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def get_key(self, fasta_path: Path, db_ver: int, min_perc_aa: float) -> str:
+        '''
+        Get the cache key for a genome.
+
+        :param fasta_path: the path to the genome FASTA file.
+        :param db_ver: the GTDB version.
+        :param min_perc_aa: the minimum sequence alignment in percent.
+        :returns: the key.
+        '''
+        h = hashlib.sha256()
+        h.update(get_file_sha256(fasta_path).encode('utf-8'))
+        h.update('\t'.join([CACHE_FORMAT_VERSION,
+                            os.environ.get('GTDBTK_VERSION', ''),
+                            str(db_ver),
+                            str(float(min_perc_aa))]).encode('utf-8'))
+        return h.hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, List[List[str]]]]:
+        '''
+        Get the cached table rows for a genome.
+
+        :param key: the cache key for the genome.
+        :returns: a mapping from GTDB-tk table file name to a list containing the table header
+            and the row for the genome, or None if the genome is not in the cache.
+        '''
+        path = self._get_path(key)
+        try:
+            with open(path, 'r') as entry_h:
+                entry = json.load(entry_h)
+            # mark as recently used
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return entry
+
+    def put(self, key: str, entry: Dict[str, List[List[str]]]) -> None:
+        '''
+        Add the table rows for a genome to the cache. Call evict() after adding entries to
+        keep the cache within its size limit.
+
+        :param key: the cache key for the genome.
+        :param entry: a mapping from GTDB-tk table file name to a list containing the table
+            header and the row for the genome.
+        '''
+        path = self._get_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # write then rename so concurrent jobs never see a partial entry
+        with tempfile.NamedTemporaryFile(
+                mode='w', dir=path.parent, suffix='.tmp', delete=False) as tf:
+            json.dump(entry, tf)
+        os.replace(tf.name, path)
+
+    def evict(self) -> None:
+        '''
+        Remove the least recently used entries until the cache is within its size limit.
+        '''
+        entries = []
+        total_bytes = 0
+        for path in self._cache_dir.glob('*/*.json'):
+            try:
+                st = path.stat()
+            except OSError:  # removed by another job
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total_bytes += st.st_size
+        if total_bytes <= self._max_bytes:
+            return
+        for (mtime, size, path) in sorted(entries):
+            try:
+                path.unlink()
+            except OSError:
+                pass
+            total_bytes -= size
+            if total_bytes <= self._max_bytes:
+                break
+        logging.info(f'Evicted classification cache entries, size now {total_bytes} bytes')
+
+    def _get_path(self, key):
+        return self._cache_dir / key[:2] / (key + '.json')
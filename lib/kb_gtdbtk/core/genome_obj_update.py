@@ -3,22 +3,42 @@ Downloads sequence data from KBase services.
 '''
 
 from typing import Dict
+import functools
 import os
 import json
 import re
 import time
 import gzip
+import html
 import pandas as pd
 import subprocess
-import ete3
+
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore
 
 from kb_gtdbtk.core.kb_client_set import KBClients
+from kb_gtdbtk.core.classification_cache import get_file_sha256
+from kb_gtdbtk.core.parallel import map_ordered
+from kb_gtdbtk.core.gtdbtk_runner import CACHED_ID_MAP_FILE
+from kb_gtdbtk.core.gtdb_metadata import get_gtdb_metadata
+from kb_gtdbtk.core.genome_upa_index import GenomeUpaIndex, get_genome_upa_index_path, has_current_genome_upa_index
+from kb_gtdbtk.core.tree_cache import get_ladderized_leaf_ancestors, get_ladderized_leaf_names, get_ladderized_newick, get_tree_leaf_names
+from kb_gtdbtk.core.tree_discovery import discover_trees, get_partial_tree_notes
 
 
 # global indices for KBase obj info list
 [OBJID_I, NAME_I, TYPE_I, SAVE_DATE_I, VERSION_I, SAVED_BY_I, WSID_I,
  WORKSPACE_I, CHSUM_I, SIZE_I, META_I] = range(11)  # object_info tuple    
 
+# max number of objects to fetch or save in one workspace call when updating the lineage of
+# the genomes and assemblies in a set
+SAVE_BATCH_SIZE = 50
+
+# object fields holding handles to Shock nodes
+HANDLE_FIELDS = { 'genome': ['genbank_handle_ref', 'gff_handle_ref'],
+                  'assembly': ['reads_handle_ref', 'fasta_handle_ref']
+                }
+
 
 # get_obj_info ()
 def get_obj_info (
@@ -54,7 +74,7 @@ def get_obj_type(
     :param upa: string with KBase obj ref
     :returns: string with obj type
     '''
-    obj_info = clients.ws().get_object_info3({'objects': [{'ref':upa}]})['infos'][0]
+    obj_info = clients.object_info().get_info(upa)
     obj_type = obj_info[TYPE_I].split('-')[0]
     return obj_type
 
@@ -71,7 +91,7 @@ def get_obj_name(
     :param upa: string with KBase obj ref
     :returns: string with obj type
     '''
-    obj_info = clients.ws().get_object_info3({'objects': [{'ref':upa}]})['infos'][0]
+    obj_info = clients.object_info().get_info(upa)
     obj_name = obj_info[NAME_I]
     return obj_name
 
@@ -133,8 +153,8 @@ def check_obj_type_assembly(
 #
 def get_names_list_from_upas_list (upas_list, clients):
     obj_names_list = []
-    for upa in upas_list:
-        obj_name = get_obj_name(upa,clients)
+    for obj_info in clients.object_info().get_infos(upas_list):
+        obj_name = obj_info[NAME_I]
         obj_names_list.append(obj_name)
 
     return obj_names_list
@@ -183,52 +203,80 @@ def _format_gtdbtk_tree_to_itol (in_tree_path):
     
 # _trim_tree()
 #
-def _trim_tree (in_tree_path, leaflist_file, leaflist_outfile, lineage_outfile, db_ver):
+def _trim_tree (in_tree_path, leaflist_file, leaflist_outfile, lineage_outfile, db_ver, trim_slots=None):
     print ("trimming tree "+str(in_tree_path))
     trim_bin = os.path.join ('/kb', 'module', 'bin', 'trim_tree_to_target_leaves.py')
-    
+    metadata_args = ['--archaea_metadata_file', str('/data/r'+str(db_ver)+'/ar53_metadata_r'+str(db_ver)+'.tsv'),
+                     '--bacteria_metadata_file', str('/data/r'+str(db_ver)+'/bac120_metadata_r'+str(db_ver)+'.tsv')
+                     ]
+
     out_tree_paths = []
+    trim_cmds = []
     
-    # just proximal sp rep hits
+    # just proximal sp rep hits.  Gets its own target leaf file so it can run alongside the
+    # sister context trim, which writes leaflist_outfile
     #out_tree_path = str(in_tree_path).replace('.tree','-proximals.tree')
     out_tree_path = re.sub('.tree$', '-proximals.tree', str(in_tree_path))
     out_tree_paths.append(out_tree_path)
-    trim_cmd = [trim_bin,
-                '--intree', str(in_tree_path),
-                '--outtree', str(out_tree_path),
-                '--leaflist', str(leaflist_file),
-                '--targetleafoutfile', str(leaflist_outfile),
-                '--archaea_metadata_file', str('/data/r'+str(db_ver)+'/ar53_metadata_r'+str(db_ver)+'.tsv'),
-                '--bacteria_metadata_file', str('/data/r'+str(db_ver)+'/bac120_metadata_r'+str(db_ver)+'.tsv')
-                ]
-    print ("RUNNING: "+" ".join(trim_cmd))
-    env = dict(os.environ)
-    subprocess.run(trim_cmd, check=True, env=env)
-    #pause(600, 10, [out_tree_path, leaflist_outfile])
+    proximals_leaflist_outfile = re.sub('.map$', '-proximals.map', str(leaflist_outfile))
+    trim_cmds.append([trim_bin,
+                      '--intree', str(in_tree_path),
+                      '--outtree', str(out_tree_path),
+                      '--leaflist', str(leaflist_file),
+                      '--targetleafoutfile', proximals_leaflist_outfile
+                      ] + metadata_args)
 
-    
     # with sister context branches.  Note that leaflist_outfile is updated with context sp reps
     #out_tree_path = str(in_tree_path).replace('.tree','-trimmed.tree')
     out_tree_path = re.sub('.tree$', '-trimmed.tree', str(in_tree_path))
     out_tree_paths.append(out_tree_path)
-    trim_cmd = [trim_bin,
-                '--intree', str(in_tree_path),
-                '--outtree', str(out_tree_path),
-                '--leaflist', str(leaflist_file),
-                '--targetleafoutfile', str(leaflist_outfile),
-                '--gtdblineageoutfile', str(lineage_outfile),
-                '--archaea_metadata_file', str('/data/r'+str(db_ver)+'/ar53_metadata_r'+str(db_ver)+'.tsv'),
-                '--bacteria_metadata_file', str('/data/r'+str(db_ver)+'/bac120_metadata_r'+str(db_ver)+'.tsv')
-                ]
-    trim_cmd.append('--sisters')
-    print ("RUNNING: "+" ".join(trim_cmd))
+    trim_cmds.append([trim_bin,
+                      '--intree', str(in_tree_path),
+                      '--outtree', str(out_tree_path),
+                      '--leaflist', str(leaflist_file),
+                      '--targetleafoutfile', str(leaflist_outfile),
+                      '--gtdblineageoutfile', str(lineage_outfile)
+                      ] + metadata_args + ['--sisters'])
+
+    # the two trims are independent, so each parses the tree and metadata at the same time
+    # rather than one after the other.  Every trim process takes a slot, shared by all the
+    # trees being processed at once.  Only the first slot is waited for, the second trim runs
+    # alongside the first if a slot is free and after it otherwise, so trees can't deadlock
+    # holding one slot each
+    if trim_slots is None:
+        trim_slots = BoundedSemaphore(len(trim_cmds))
     env = dict(os.environ)
-    subprocess.run(trim_cmd, check=True, env=env)
-    #pause(600, 10, [out_tree_path, leaflist_outfile, lineage_outfile])
+    with trim_slots:
+        trim_procs = []
+        extra_slots = 0
+        for trim_cmd in trim_cmds:
+            if trim_procs:
+                if trim_slots.acquire(blocking=False):
+                    extra_slots += 1
+                else:
+                    _wait_trims(trim_procs)
+                    trim_procs = []
+            print ("RUNNING: "+" ".join(trim_cmd))
+            trim_procs.append((trim_cmd, subprocess.Popen(trim_cmd, env=env)))
+        try:
+            _wait_trims(trim_procs)
+        finally:
+            for _ in range(extra_slots):
+                trim_slots.release()
     
     return out_tree_paths
 
 
+def _wait_trims(trim_procs):
+    # wait for all the processes before raising, so none are left running
+    failed = None
+    for trim_cmd, trim_proc in trim_procs:
+        if trim_proc.wait() != 0 and not failed:
+            failed = subprocess.CalledProcessError(trim_proc.returncode, trim_cmd)
+    if failed:
+        raise failed
+
+
 # _write_tree_image_file()
 #
 def _write_tree_image_file (trimmed_tree_path, query_leaflist_file, leaflist_file, lineage_file):
@@ -262,7 +310,7 @@ def _write_tree_image_file (trimmed_tree_path, query_leaflist_file, leaflist_fil
 
 # _write_gtdb_tree_html_file ()
 #
-def _write_gtdb_tree_html_file (out_dir, files_for_html):
+def _write_gtdb_tree_html_file (out_dir, files_for_html, cached_names=None):
     tree_html_path = os.path.join (out_dir, 'gtdb_trees.html')  # if updated, the index.html file should also be updated accordingly
 
     tax_order = ['p', 'c', 'o', 'f', 'g']  # not handling domain or species
@@ -274,7 +322,12 @@ def _write_gtdb_tree_html_file (out_dir, files_for_html):
         tree_png_file = file_for_html['png_file']
         taxon_colors_path = file_for_html['taxon_colors_path']
         lineage_path = file_for_html['lineage_path']
-        
+        partial_note = file_for_html.get('partial_note')
+
+        # label trees that only hold some of the queries
+        if partial_note:
+            table_buf += ['<tr><td colspan=6 align=left><b>{}</b>: {}</td></tr>'.format(html.escape(os.path.basename(str(tree_newick_path))), html.escape(partial_note))]
+
         # add tree image
         tree_img_width = 500
         tree_img_height = 500
@@ -296,16 +349,14 @@ def _write_gtdb_tree_html_file (out_dir, files_for_html):
         
         # determine lineage structure
         lineages = dict()
-        tree = ete3.Tree(tree_newick_path, quoted_node_names=True, format=1)
-        tree.ladderize()
-        for leaf_node in tree.get_leaves():
+        for (leaf_name, ancestor_names) in get_ladderized_leaf_ancestors(tree_newick_path):
             """
             #last_taxon = None
             #for ancestor_node in reversed(leaf_node.get_ancestors()):  # phylum -> genus
             """
-            for ancestor_node in leaf_node.get_ancestors():  # genus -> phylum
-                if ancestor_node.name:
-                    taxon = ancestor_node.name
+            for ancestor_name in ancestor_names:  # genus -> phylum
+                if ancestor_name:
+                    taxon = ancestor_name
                     if taxon not in parents:  # handle phylum
                         lineages[taxon] = dict()
                     else:
@@ -328,8 +379,8 @@ def _write_gtdb_tree_html_file (out_dir, files_for_html):
                     if last_taxon:
                         if last_taxon not in lineages:
                             lineages[last_taxon] = dict()
-                        lineages[last_taxon][ancestor_node.name] = True
-                    last_taxon = ancestor_node.name
+                        lineages[last_taxon][ancestor_name] = True
+                    last_taxon = ancestor_name
                     """
                     
         # build key
@@ -361,7 +412,13 @@ def _write_gtdb_tree_html_file (out_dir, files_for_html):
         
     # build html
     html_buf += ['<html><head><title>GTDB-Tk Trees</title></head>']
-    html_buf += ['<body><table border=0>']
+    html_buf += ['<body>']
+    # genomes classified from the cache weren't run through GTDB-Tk, so weren't placed
+    if cached_names:
+        html_buf += ['<p>The classifications of {} genome(s) were taken from the cache of earlier runs, so they are not placed in the trees: {}</p>'.format(len(cached_names), html.escape(', '.join(cached_names)))]
+        if not files_for_html:
+            html_buf += ['<p>No genomes were run through GTDB-Tk, so there are no trees.</p>']
+    html_buf += ['<table border=0>']
     html_buf += table_buf
     html_buf += ['</table></body></html>']
     with open (tree_html_path, 'w') as tree_h:
@@ -430,9 +487,7 @@ def get_sp_rep_hits (summary_tables, query_assembly_to_genome_name):
 def get_query_ids_from_tree (in_tree_path, id_map):
     query_ids = []
 
-    tree = ete3.Tree (in_tree_path, quoted_node_names=True, format=1)
-
-    for leaf_name in tree.get_leaf_names():
+    for leaf_name in get_tree_leaf_names (in_tree_path):
         if leaf_name.startswith('id'):
             query_ids.append(id_map[leaf_name])
             
@@ -524,6 +579,159 @@ def add_tree_key_row (taxon, lineages, taxon_color, indent_cnt, key_box_size, ke
     return key_buf
 
 
+# get_sp_rep_id_map_lines()
+#
+def get_sp_rep_id_map_lines (sp_rep_ids, gtdb_metadata):
+    '''
+    Make the id map lines for species rep leaves, in the same id, name, lineage form as the
+    query lines
+
+    :param sp_rep_ids: list of GTDB genome ids of the species reps
+    :param gtdb_metadata: GtdbMetadata store for the GTDB version, or None if it isn't built,
+        in which case the lines have no lineage
+    :returns: list of tab separated id map lines, sorted by genome id
+    '''
+    lines = []
+    for sp_rep_id in sorted(sp_rep_ids):
+        if gtdb_metadata is None:
+            lines.append("\t".join([sp_rep_id,sp_rep_id]))
+            continue
+        lineage = gtdb_metadata.get_value(sp_rep_id, 'gtdb_taxonomy') or '-'
+        lines.append("\t".join([sp_rep_id,sp_rep_id,lineage]))
+    return lines
+
+
+# _process_tree_file()
+#
+def _process_tree_file (tree_file,
+                        out_dir,
+                        id_map_buf,
+                        id_map,
+                        sp_reps_by_query,
+                        new_id_map_path,
+                        db_ver,
+                        dendrogram_report,
+                        trim_slots=None,
+                        partial_note=None):
+    # the work for a single tree.  Trees holding only some of the queries say so everywhere
+    # they're shown
+    desc_note = ' ('+partial_note+')' if partial_note else ''
+    itol_upload_files = []
+    upload_files = []
+    files_for_html = []
+
+    # make itol format file
+    in_tree_path = out_dir / tree_file
+    itol_tree_path = _format_gtdbtk_tree_to_itol (in_tree_path)
+    itol_tree_file = os.path.basename(itol_tree_path)
+    itol_upload_files.append({ 'path': str(in_tree_path),
+                               'name': str(tree_file),
+                               'description': str(tree_file)+' - whole tree GTDB formatted Newick'+desc_note})
+    itol_upload_files.append({ 'path': str(itol_tree_path),
+                               'name': str(itol_tree_file),
+                               'description': str(itol_tree_file)+' - whole tree ITOL formatted Newick'+desc_note})
+
+    # trim tree file and make tree image files
+    in_tree_path = os.path.join (out_dir, tree_file)
+
+    # add sp rep hits, separate for each tree so no overlaps without query across trees
+    this_tree_id_map_buf = []
+    this_tree_id_map_buf.extend(id_map_buf)
+    this_tree_query_ids = get_query_ids_from_tree (in_tree_path, id_map)
+    this_tree_sp_rep_ids = get_sp_reps_for_query_ids (this_tree_query_ids, sp_reps_by_query)
+    this_tree_id_map_buf.extend(get_sp_rep_id_map_lines (this_tree_sp_rep_ids, get_gtdb_metadata(db_ver)))
+    id_map_with_sp_rep_hits_path = re.sub('.tree$', '.id_to_name-with_proximal_sp_reps.map', str(in_tree_path))
+    with open(id_map_with_sp_rep_hits_path, 'w') as id_map_h:
+        id_map_h.write("\n".join(this_tree_id_map_buf)+"\n")
+
+
+    #new_id_map_with_sp_rep_hits_path = str(in_tree_path).replace('.tree', '.id_to_name-with_all_sp_reps-newleafnames.map')
+    new_id_map_with_sp_rep_hits_path = re.sub('.tree$', '.id_to_name-with_proximal_sp_reps-newleafnames.map', str(in_tree_path))
+    lineage_path = re.sub('.tree$', '-lineages.map', str(in_tree_path))
+
+    trimmed_tree_paths = _trim_tree (in_tree_path, id_map_with_sp_rep_hits_path, new_id_map_with_sp_rep_hits_path, lineage_path, db_ver, trim_slots)
+
+    for trimmed_tree_path in trimmed_tree_paths:
+
+        trimmed_tree_file = os.path.basename (trimmed_tree_path)
+        upload_files.append({ 'path': trimmed_tree_path,
+                              'name': trimmed_tree_file,
+                              'description': trimmed_tree_file+' - Newick'+desc_note
+                            })
+
+        # proximals failing.  fix later
+        if 'proximals' in trimmed_tree_path:
+            continue
+
+        lineage_file = os.path.basename (lineage_path)
+        upload_files.append({ 'path': lineage_path,
+                              'name': lineage_file,
+                              'description': lineage_file+' - GTDB lineage'+desc_note
+                            })
+
+        trimmed_tree_image_paths = _write_tree_image_file (trimmed_tree_path,
+                                                           new_id_map_path,
+                                                           new_id_map_with_sp_rep_hits_path,
+                                                           lineage_path)
+
+        for trimmed_tree_image_path in trimmed_tree_image_paths:
+            trimmed_tree_image_file = os.path.basename (trimmed_tree_image_path)
+            upload_files.append({ 'path': trimmed_tree_image_path,
+                                  'name': trimmed_tree_image_file,
+                                  'description': trimmed_tree_file+' - Image'+desc_note
+                                })
+
+            html_tree_target = '-circle.PNG'
+            if dendrogram_report:
+                html_tree_target = '-circle-ultrametric.PNG'
+
+            if '-trimmed.tree'+html_tree_target in trimmed_tree_image_file:
+                taxon_colors_path = str(trimmed_tree_image_path).replace(html_tree_target,'-taxon_colors.map')
+                files_for_html.append({'newick_path': trimmed_tree_path,
+                                       'png_file': trimmed_tree_image_file,
+                                       'taxon_colors_path': taxon_colors_path,
+                                       'lineage_path': lineage_path,
+                                       'partial_note': partial_note})
+
+    return (itol_upload_files, upload_files, files_for_html)
+
+
+# _upload_files_to_shock()
+#
+def _upload_files_to_shock (upload_files, clients, threads=1, retries=0):
+    '''
+    Upload files for report file links, each distinct file only once
+
+    :param upload_files: list of dicts with path, name and description of each file
+    :param clients: KBClients
+    :param threads: int with max number of concurrent uploads
+    :param retries: int with number of times to retry a failed upload
+    :returns: list of file links with shock_id, name and description, in upload_files order
+    '''
+    # the same file, or files with the same content, get the same shock node
+    path_to_key = dict()
+    key_to_path = dict()
+    for f in upload_files:
+        path = os.path.realpath(f['path'])
+        if path not in path_to_key:
+            path_to_key[path] = get_file_sha256 (path)
+            key_to_path.setdefault(path_to_key[path], path)
+    keys = list(key_to_path.keys())
+
+    def upload (key):
+        return clients.dfu().file_to_shock({'file_path': key_to_path[key],
+                                            'make_handle': 0})['shock_id']
+
+    key_to_shock_id = dict(zip(keys, map_ordered(upload, keys, threads, retries=retries)))
+
+    file_links = []
+    for f in upload_files:
+        file_links.append({'shock_id': key_to_shock_id[path_to_key[os.path.realpath(f['path'])]],
+                           'name': f['name'],
+                           'description': f['description']})
+    return file_links
+
+
 # process_tree_files()
 #
 def process_tree_files (top_upa,
@@ -532,17 +740,15 @@ def process_tree_files (top_upa,
                         classification,
                         db_ver,
                         dendrogram_report,
-                        clients):
+                        clients,
+                        tree_threads=1,
+                        upload_threads=1,
+                        upload_retries=0):
     upload_files = []
     file_links = []
 
     id_map_path = os.path.join(out_dir, 'id_to_name.map')
-    tree_files = ['gtdbtk.ar53.classify.tree',
-                  'gtdbtk.bac120.classify.tree']
-    extra_bac_tree_files = ['gtdbtk.backbone.bac120.classify.tree']
-    for i in range(10000):
-        subtree_file = 'gtdbtk.bac120.classify.tree.'+str(i)+'.tree'
-        extra_bac_tree_files.append(subtree_file)
+    trees = discover_trees(out_dir)
 
     # add species hits to id_map
     top_obj = clients.dfu().get_objects({'object_refs': [top_upa]})['data'][0]
@@ -568,100 +774,44 @@ def process_tree_files (top_upa,
         id_map_h.write("\n".join(id_map_buf)+"\n")
             
 
-    # make itol format files
-    for tree_file in tree_files + extra_bac_tree_files:
-        in_tree_path = out_dir / tree_file
-        if os.path.isfile(in_tree_path):
-            itol_tree_path = _format_gtdbtk_tree_to_itol (in_tree_path)
-            itol_tree_file = os.path.basename(itol_tree_path)
-            upload_files.append({ 'path': str(in_tree_path),
-                                  'name': str(tree_file),
-                                  'description': str(tree_file)+' - whole tree GTDB formatted Newick'})
-            upload_files.append({ 'path': str(itol_tree_path),
-                                  'name': str(itol_tree_file),
-                                  'description': str(itol_tree_file)+' - whole tree ITOL formatted Newick'})
+    # make itol format files, trim tree files and make tree image files.  The trees are
+    # independent, so process them in threads.  The heavy lifting is in subprocesses, and
+    # threads share the parsed trees in the tree cache.  tree_threads limits both the number
+    # of trees in progress and the number of trim processes across all of them
+    trim_slots = BoundedSemaphore(max(int(tree_threads), 1))
+    partial_notes = get_partial_tree_notes(trees)
+    tree_args = [(tree.name, out_dir, id_map_buf, id_map, sp_reps_by_query, new_id_map_path,
+                  db_ver, dendrogram_report, trim_slots, partial_notes.get(tree.name))
+                 for tree in trees]
+    if int(tree_threads) > 1 and len(tree_args) > 1:
+        with ThreadPoolExecutor(max_workers=min(int(tree_threads), len(tree_args))) as executor:
+            tree_results = list(executor.map(_process_tree_file, *zip(*tree_args)))
+    else:
+        tree_results = [_process_tree_file(*args) for args in tree_args]
 
-            
-    # trim tree files and make tree image files
+    # same order as processing the trees one at a time: the whole trees for every tree first
     files_for_html = []
-    for tree_file in tree_files + extra_bac_tree_files:
-        in_tree_path = os.path.join (out_dir, tree_file)
-        if os.path.isfile(in_tree_path):
-
-            # add sp rep hits, separate for each tree so no overlaps without query across trees
-            this_tree_id_map_buf = []
-            this_tree_id_map_buf.extend(id_map_buf)
-            this_tree_query_ids = get_query_ids_from_tree (in_tree_path, id_map)
-            this_tree_sp_rep_ids = get_sp_reps_for_query_ids (this_tree_query_ids, sp_reps_by_query)
-            for sp_rep_id in sorted(this_tree_sp_rep_ids):
-                this_tree_id_map_buf.append("\t".join([sp_rep_id,sp_rep_id]))
-            id_map_with_sp_rep_hits_path = re.sub('.tree$', '.id_to_name-with_proximal_sp_reps.map', str(in_tree_path))
-            with open(id_map_with_sp_rep_hits_path, 'w') as id_map_h:
-                id_map_h.write("\n".join(this_tree_id_map_buf)+"\n")
-
-            
-            #new_id_map_with_sp_rep_hits_path = str(in_tree_path).replace('.tree', '.id_to_name-with_all_sp_reps-newleafnames.map')
-            new_id_map_with_sp_rep_hits_path = re.sub('.tree$', '.id_to_name-with_proximal_sp_reps-newleafnames.map', str(in_tree_path))
-            lineage_path = re.sub('.tree$', '-lineages.map', str(in_tree_path))
-            
-            trimmed_tree_paths = _trim_tree (in_tree_path, id_map_with_sp_rep_hits_path, new_id_map_with_sp_rep_hits_path, lineage_path, db_ver)
-
-            for trimmed_tree_path in trimmed_tree_paths:
-
-                trimmed_tree_file = os.path.basename (trimmed_tree_path)
-                upload_files.append({ 'path': trimmed_tree_path,
-                                      'name': trimmed_tree_file,
-                                      'description': trimmed_tree_file+' - Newick'
-                                    })
+    for (itol_upload_files, trimmed_upload_files, tree_files_for_html) in tree_results:
+        upload_files.extend(itol_upload_files)
+    for (itol_upload_files, trimmed_upload_files, tree_files_for_html) in tree_results:
+        upload_files.extend(trimmed_upload_files)
+        files_for_html.extend(tree_files_for_html)
 
-                # proximals failing.  fix later
-                if 'proximals' in trimmed_tree_path:
-                    continue
-
-                lineage_file = os.path.basename (lineage_path)
-                upload_files.append({ 'path': lineage_path,
-                                      'name': lineage_file,
-                                      'description': lineage_file+' - GTDB lineage'
-                                    })
-
-                trimmed_tree_image_paths = _write_tree_image_file (trimmed_tree_path,
-                                                                   new_id_map_path,
-                                                                   new_id_map_with_sp_rep_hits_path,
-                                                                   lineage_path)
-
-                for trimmed_tree_image_path in trimmed_tree_image_paths:
-                    trimmed_tree_image_file = os.path.basename (trimmed_tree_image_path)
-                    upload_files.append({ 'path': trimmed_tree_image_path,
-                                          'name': trimmed_tree_image_file,
-                                          'description': trimmed_tree_file+' - Image'
-                                        })
-
-                    html_tree_target = '-circle.PNG'
-                    if dendrogram_report:
-                        html_tree_target = '-circle-ultrametric.PNG'
-                        
-                    if '-trimmed.tree'+html_tree_target in trimmed_tree_image_file:
-                        taxon_colors_path = str(trimmed_tree_image_path).replace(html_tree_target,'-taxon_colors.map')
-                        files_for_html.append({'newick_path': trimmed_tree_path,
-                                               'png_file': trimmed_tree_image_file,
-                                               'taxon_colors_path': taxon_colors_path,
-                                               'lineage_path': lineage_path})
-
-                        
     # upload files and make file links for report
     #
-    file_links = []
-    for f in upload_files:
-        upload_ret = clients.dfu().file_to_shock({'file_path': f['path'],
-                                                  'make_handle': 0})
-        file_links.append({'shock_id': upload_ret['shock_id'],
-                           'name': f['name'],
-                           'description': f['description']})
+    file_links = _upload_files_to_shock (upload_files, clients, upload_threads, upload_retries)
 
 
     # Make GTDB Tree html to go in html report
     #
-    tree_html_file = _write_gtdb_tree_html_file (out_dir, files_for_html)
+    cached_names = []
+    cached_id_map_path = os.path.join(out_dir, CACHED_ID_MAP_FILE)
+    if os.path.isfile(cached_id_map_path):
+        with open(cached_id_map_path, 'r') as cached_id_map_h:
+            for line in cached_id_map_h:
+                qid = line.rstrip().split("\t")[0]
+                cached_names.append(id_map.get(qid, qid))
+    tree_html_file = _write_gtdb_tree_html_file (out_dir, files_for_html, cached_names)
         
         
     return file_links
@@ -669,7 +819,18 @@ def process_tree_files (top_upa,
 
 # get_genome_id_to_upa_map()
 #
+@functools.lru_cache(maxsize=None)
 def get_genome_id_to_upa_map (genome_upas_map_file):
+    '''
+    Get the GTDB genome id to UPA map, loaded once per process.
+
+    :param genome_upas_map_file: string with path to tab separated genome id to UPA file
+    :returns: read only mapping from genome id to UPA.  Backed by the memory mapped index
+        built with the image if it is present, otherwise read from the file
+    '''
+    if has_current_genome_upa_index (genome_upas_map_file):
+        return GenomeUpaIndex (get_genome_upa_index_path (genome_upas_map_file))
+
     genome_id_to_upa_map = dict()
     this_file = genome_upas_map_file
     if this_file.lower().endswith('.gz'):
@@ -694,23 +855,21 @@ def  _save_tree_obj_and_copy_genomes(this_tree_path,
                                      top_upa,
                                      workspace_id,
                                      genome_id_to_upa_map,
-                                     clients):
+                                     clients,
+                                     copy_threads=1,
+                                     copy_retries=0):
 
     print ("SAVING TREE OBJ {}".format(obj_name))
 
     new_objects_created = []
     tree_full_desc = tree_name+' '+tree_short_desc
     
-    # load tree and get leaf naems and genome ids
-    tree = ete3.Tree (this_tree_path, quoted_node_names=True, format=1)
-    tree.ladderize()
-    newick_buf = tree.write()
-    if not newick_buf.endswith(';'):
-        newick_buf += ';'
+    # load tree and get leaf naems and genome ids.  The trimmed tree was already read for the report
+    newick_buf = get_ladderized_newick (this_tree_path)
     leaf_list = []
     genome_ids = []
     #print ("DEBUGGING TREE GENOMES===============================================")  # DEBUG
-    for leaf_name in tree.get_leaf_names():
+    for leaf_name in get_ladderized_leaf_names (this_tree_path):
         genome_id = leaf_name.split(' ')[0]
         leaf_list.append(leaf_name)
         genome_ids.append(genome_id)
@@ -728,7 +887,7 @@ def  _save_tree_obj_and_copy_genomes(this_tree_path,
         query_upas[query_name] = query_upas_list[query_i]
     
     # make local copies of genomes
-    copied_genome_refs = copy_gtdb_genome_objs (genome_ids, genome_id_to_upa_map, 'GTDB_SP_REP-', workspace_id, clients)
+    copied_genome_refs = copy_gtdb_genome_objs (genome_ids, genome_id_to_upa_map, 'GTDB_SP_REP-', workspace_id, clients, copy_threads, copy_retries)
     # DEBUG
     #for genome_id in sorted (copied_genome_refs.keys()):
     #    print ("COPIED GENOME_ID -> REF: {} -> {}".format(genome_id, copied_genome_refs[genome_id]))
@@ -795,7 +954,9 @@ def save_gtdb_tree_objs (workspace_id,
                          out_dir,
                          output_tree_basename,
                          genome_upas_map_file,
-                         clients):
+                         clients,
+                         copy_threads=1,
+                         copy_retries=0):
     new_objects_created = []
 
     print ("SAVING GTDB TREE OBJECTS")
@@ -804,47 +965,51 @@ def save_gtdb_tree_objs (workspace_id,
     genome_id_to_upa_map = get_genome_id_to_upa_map (genome_upas_map_file)
 
     # read trees and collect contained genomes
-    tree_files = ['gtdbtk.ar53.classify.tree',
-                  'gtdbtk.bac120.classify.tree']
-    extra_bac_tree_files = ['gtdbtk.backbone.bac120.classify.tree']
-    for i in range(10000):
-        subtree_file = 'gtdbtk.bac120.classify.tree.'+str(i)+'.tree'
-        extra_bac_tree_files.append(subtree_file)
-
-    for tree_file in tree_files + extra_bac_tree_files:
+    trees = discover_trees(out_dir)
+    partial_notes = get_partial_tree_notes(trees)
+
+    for tree in trees:
+        tree_file = tree.name
         in_tree_path = out_dir / tree_file
-        if os.path.isfile(in_tree_path):
-
-            # proximal tree
-            #proximal_tree_path = str(in_tree_path).replace('.tree', '-proximal.tree')
-            proximal_tree_path = re.sub('.tree$', '-proximals.tree', str(in_tree_path))
-            tree_name = tree_file+'-proximals.tree'
-            obj_name = output_tree_basename+'.'+tree_name
-            tree_short_desc = 'with proximal GTDB species reps'
-
-            new_objects_created.extend(_save_tree_obj_and_copy_genomes(proximal_tree_path,
-                                                                       tree_name,
-                                                                       obj_name,
-                                                                       tree_short_desc,
-                                                                       top_upa,
-                                                                       workspace_id,
-                                                                       genome_id_to_upa_map,
-                                                                       clients))
-            # trimed tree
-            #trimmed_tree_path = str(in_tree_path).replace('.tree', '-trimmed.tree')
-            trimmed_tree_path = re.sub('.tree$', '-trimmed.tree', str(in_tree_path))
-            tree_name = tree_file+'-trimmed.tree'
-            obj_name = output_tree_basename+'.'+tree_name
-            tree_short_desc = 'trimmed with sister context'
-
-            new_objects_created.extend(_save_tree_obj_and_copy_genomes(trimmed_tree_path,
-                                                                       tree_name,
-                                                                       obj_name,
-                                                                       tree_short_desc,
-                                                                       top_upa,
-                                                                       workspace_id,
-                                                                       genome_id_to_upa_map,
-                                                                       clients))
+
+        # proximal tree
+        #proximal_tree_path = str(in_tree_path).replace('.tree', '-proximal.tree')
+        proximal_tree_path = re.sub('.tree$', '-proximals.tree', str(in_tree_path))
+        tree_name = tree_file+'-proximals.tree'
+        obj_name = output_tree_basename+'.'+tree_name
+        tree_short_desc = 'with proximal GTDB species reps'
+        if tree_file in partial_notes:
+            tree_short_desc += ' ('+partial_notes[tree_file]+')'
+
+        new_objects_created.extend(_save_tree_obj_and_copy_genomes(proximal_tree_path,
+                                                                   tree_name,
+                                                                   obj_name,
+                                                                   tree_short_desc,
+                                                                   top_upa,
+                                                                   workspace_id,
+                                                                   genome_id_to_upa_map,
+                                                                   clients,
+                                                                   copy_threads,
+                                                                   copy_retries))
+        # trimed tree
+        #trimmed_tree_path = str(in_tree_path).replace('.tree', '-trimmed.tree')
+        trimmed_tree_path = re.sub('.tree$', '-trimmed.tree', str(in_tree_path))
+        tree_name = tree_file+'-trimmed.tree'
+        obj_name = output_tree_basename+'.'+tree_name
+        tree_short_desc = 'trimmed with sister context'
+        if tree_file in partial_notes:
+            tree_short_desc += ' ('+partial_notes[tree_file]+')'
+
+        new_objects_created.extend(_save_tree_obj_and_copy_genomes(trimmed_tree_path,
+                                                                   tree_name,
+                                                                   obj_name,
+                                                                   tree_short_desc,
+                                                                   top_upa,
+                                                                   workspace_id,
+                                                                   genome_id_to_upa_map,
+                                                                   clients,
+                                                                   copy_threads,
+                                                                   copy_retries))
 
     return new_objects_created
 
@@ -859,6 +1024,7 @@ def update_genome_assembly_objs_class(
         gtdb_ver: str,
         taxon_assignment_field: str,
         clients: KBClients,
+        save_batch_size: int = SAVE_BATCH_SIZE,
         ):
     '''
     Adjust taxon_assignments field of Genome objects for Genome or GenomeSet
@@ -875,6 +1041,7 @@ def update_genome_assembly_objs_class(
         downloaded.
     :param classification: a dict with name key to GTDB classification
     :param clients: The KBase clients to use for the download operation.
+    :param save_batch_size: the maximum number of objects to fetch or save in one workspace call.
     :returns: null
     '''
 
@@ -894,7 +1061,7 @@ def update_genome_assembly_objs_class(
         else:
             raise ValueError(f'{obj_type} type is not supported')
 
-        return process_genome_objs(primary_wsid, top_obj, upa, upas, classification, overwrite_tax, gtdb_ver, taxon_assignment_field, clients)
+        return process_genome_objs(primary_wsid, top_obj, upa, upas, classification, overwrite_tax, gtdb_ver, taxon_assignment_field, clients, save_batch_size)
 
     elif check_obj_type_assembly (obj_type):
         if 'KBaseSets.AssemblySet' == obj_type:
@@ -904,7 +1071,7 @@ def update_genome_assembly_objs_class(
         else:
             raise ValueError(f'{obj_type} type is not supported')
 
-        return process_assembly_objs(primary_wsid, top_obj, upa, upas, classification, overwrite_tax, gtdb_ver, taxon_assignment_field, clients)
+        return process_assembly_objs(primary_wsid, top_obj, upa, upas, classification, overwrite_tax, gtdb_ver, taxon_assignment_field, clients, save_batch_size)
 
     else:
         raise ValueError(f'{obj_type} type is not supported')
@@ -912,7 +1079,7 @@ def update_genome_assembly_objs_class(
 
 # process_genome_objs()
 #
-def process_genome_objs(primary_wsid, top_obj, upa, upas, classification, overwrite_tax, gtdb_ver, taxon_assignment_field, clients):
+def process_genome_objs(primary_wsid, top_obj, upa, upas, classification, overwrite_tax, gtdb_ver, taxon_assignment_field, clients, save_batch_size=SAVE_BATCH_SIZE):
     objects_created = []
     updated_genome_refs = dict()
     genomeset_query = False
@@ -925,66 +1092,113 @@ def process_genome_objs(primary_wsid, top_obj, upa, upas, classification, overwr
     else:
         upas = [upa]
 
-    for genome_upa in upas:
-        original_upa = genome_upa
+    # fetch, update and save the genomes a batch at a time, so there are a few workspace
+    # calls per batch rather than per genome, and only a batch of genomes is held in memory
+    for batch_start in range(0, len(upas), save_batch_size):
+        batch_upas = upas[batch_start:batch_start + save_batch_size]
 
         if not genomeset_query:
-            genome_obj = top_obj
+            genome_objs = [top_obj]
         else:
-            genome_obj = clients.dfu().get_objects({'object_refs': [genome_upa]})['data'][0]
-        genome_name = genome_obj['info'][NAME_I]
-        assembly_upa = genome_obj['data'].get('contigset_ref') or genome_obj['data'].get('assembly_ref')
-        assembly_obj = clients.dfu().get_objects({'object_refs': [assembly_upa]})['data'][0]
-        assembly_name = assembly_obj['info'][NAME_I]
-
-        if assembly_name not in classification:
-            print ("missing classification for "+assembly_name)
-            updated_genome_refs[genome_upa] = genome_upa
+            genome_objs = clients.dfu().get_objects({'object_refs': batch_upas})['data']
+        assembly_upas = [genome_obj['data'].get('contigset_ref') or genome_obj['data'].get('assembly_ref')
+                         for genome_obj in genome_objs]
+        assembly_objs = clients.dfu().get_objects({'object_refs': assembly_upas})['data']
+
+        update_upas = []
+        update_genome_objs = []
+        update_assembly_objs = []
+        update_std_lineages = []
+        for genome_upa, genome_obj, assembly_obj in zip(batch_upas, genome_objs, assembly_objs):
+            assembly_name = assembly_obj['info'][NAME_I]
+
+            if assembly_name not in classification:
+                print ("missing classification for "+assembly_name)
+                updated_genome_refs[genome_upa] = genome_upa
+                continue
+
+            # set std_lineage GTDB field in genome and assembly objs
+            this_classification = classification[assembly_name]
+            this_taxon_id = get_taxon_id (this_classification)
+            std_lineages = get_std_lineages (this_classification, gtdb_ver, this_taxon_id)
+
+            # don't save a new version of a genome that already has this classification
+            if is_gtdb_lineage_current (assembly_obj['data'], std_lineages) \
+               and is_gtdb_lineage_current (genome_obj['data'], std_lineages) \
+               and (genome_obj['data'].get('taxon_assignments') or {}).get(taxon_assignment_field) == this_classification \
+               and not taxonomy_needs_update (genome_obj['data'], this_classification, overwrite_tax):
+                print ("GTDB classification already current for "+genome_obj['info'][NAME_I])
+                updated_genome_refs[genome_upa] = genome_upa
+                continue
+
+            update_upas.append(genome_upa)
+            update_genome_objs.append(genome_obj)
+            update_assembly_objs.append(assembly_obj)
+            update_std_lineages.append(std_lineages)
+
+        if not update_upas:
             continue
-        
-        # set std_lineage GTDB field in genome and assembly objs
-        this_classification = classification[assembly_name]
-        this_taxon_id = get_taxon_id (this_classification)
-        std_lineages = get_std_lineages (this_classification, gtdb_ver, this_taxon_id)
-
-        # update and save assembly and give genome obj new assembly upa
-        new_assembly_ref = update_and_save_assembly (primary_wsid, assembly_obj, std_lineages, clients)
-
-        # update genome obj with std_lineages and new assembly obj ref
-        genome_obj['data']['assembly_ref'] = new_assembly_ref
-        genome_obj['data']['std_lineages'] = std_lineages
-        any_genome_updated = True
-        
-        # set taxon_assignments
-        if not genome_obj['data'].get('taxon_assignments'):
-            genome_obj['data']['taxon_assignments'] = {taxon_assignment_field: classification[assembly_name]}
-        else:
-            genome_obj['data']['taxon_assignments'][taxon_assignment_field] = classification[assembly_name]
-            
-        # set taxonomy (if missing or force overwrite)
-        this_genome_tax_written = False
-        if overwrite_tax == 1 \
-           or not genome_obj['data'].get('taxonomy') \
-           or genome_obj['data']['taxonomy'].startswith('Unconfirmed') \
-           or genome_obj['data']['taxonomy'].startswith('Unknown'):
-            this_genome_tax_written = True
+
+        # only the assemblies that don't have the lineage yet are saved
+        save_assembly_indices = [i for i, (assembly_obj, std_lineages)
+                                 in enumerate(zip(update_assembly_objs, update_std_lineages))
+                                 if not is_gtdb_lineage_current (assembly_obj['data'], std_lineages)]
+
+        # take ownership of the genome and assembly Shock nodes for the batch at once
+        clients.handle_owner().own_handles(
+            get_handle_ids ('genome', [genome_obj['data'] for genome_obj in update_genome_objs]) +
+            get_handle_ids ('assembly', [update_assembly_objs[i]['data'] for i in save_assembly_indices]))
+
+        # update and save assemblies and give genome objs new assembly upas
+        new_assembly_refs = update_and_save_assemblies (primary_wsid,
+                                                        [update_assembly_objs[i] for i in save_assembly_indices],
+                                                        [update_std_lineages[i] for i in save_assembly_indices],
+                                                        clients,
+                                                        save_batch_size)
+        new_assembly_refs = dict(zip(save_assembly_indices, new_assembly_refs))
+
+        genome_taxonomy_written = []
+        for i, (genome_obj, assembly_obj, std_lineages) in enumerate(zip(update_genome_objs,
+                                                                         update_assembly_objs,
+                                                                         update_std_lineages)):
+            assembly_name = assembly_obj['info'][NAME_I]
+
+            # update genome obj with std_lineages and new assembly obj ref
+            if i in new_assembly_refs:
+                genome_obj['data']['assembly_ref'] = new_assembly_refs[i]
+            genome_obj['data']['std_lineages'] = std_lineages
             any_genome_updated = True
-            genome_obj['data']['taxonomy'] = classification[assembly_name]
-
-        # save updated genome obj
-        #this_wsid = genome_obj['info'][WSID_I]
-        #if genomeset_query:
-        #    this_wsid = top_wsid
-        new_ref = save_genome_obj (primary_wsid, genome_name, genome_obj['data'], clients)
-        updated_genome_refs[original_upa] = new_ref
-        desc = 'Taxonomy unchanged, taxon_assignment added GTDB'
-        if this_genome_tax_written:
-            desc = 'Taxonomy and taxon_assignment updated with GTDB'
-        objects_created.append({'ref': new_ref, 'description': desc})
+
+            # set taxon_assignments
+            if not genome_obj['data'].get('taxon_assignments'):
+                genome_obj['data']['taxon_assignments'] = {taxon_assignment_field: classification[assembly_name]}
+            else:
+                genome_obj['data']['taxon_assignments'][taxon_assignment_field] = classification[assembly_name]
+
+            # set taxonomy (if missing or force overwrite)
+            this_genome_tax_written = False
+            if taxonomy_needs_update (genome_obj['data'], classification[assembly_name], overwrite_tax):
+                this_genome_tax_written = True
+                any_genome_updated = True
+                genome_obj['data']['taxonomy'] = classification[assembly_name]
+            genome_taxonomy_written.append(this_genome_tax_written)
+
+        # save updated genome objs
+        new_refs = save_genome_objs (primary_wsid,
+                                     [genome_obj['info'][NAME_I] for genome_obj in update_genome_objs],
+                                     [genome_obj['data'] for genome_obj in update_genome_objs],
+                                     clients,
+                                     save_batch_size)
+        for original_upa, new_ref, this_genome_tax_written in zip(update_upas, new_refs, genome_taxonomy_written):
+            updated_genome_refs[original_upa] = new_ref
+            desc = 'Taxonomy unchanged, taxon_assignment added GTDB'
+            if this_genome_tax_written:
+                desc = 'Taxonomy and taxon_assignment updated with GTDB'
+            objects_created.append({'ref': new_ref, 'description': desc})
         
         
-    # update refs in genomeset
-    if genomeset_query:
+    # update refs in genomeset, unless no genome changed
+    if genomeset_query and any_genome_updated:
         new_genomeset_ref = update_and_save_genomeset (primary_wsid, genomeset_obj, updated_genome_refs, clients)
         desc = 'Taxonomy unchanged, taxon_assignment added GTDB'
         if any_genome_updated:
@@ -996,7 +1210,7 @@ def process_genome_objs(primary_wsid, top_obj, upa, upas, classification, overwr
 
 # process_assembly_objs()
 #
-def process_assembly_objs(primary_wsid, top_obj, upa, upas, classification, overwrite_tax, gtdb_ver, taxon_assignment_field, clients):
+def process_assembly_objs(primary_wsid, top_obj, upa, upas, classification, overwrite_tax, gtdb_ver, taxon_assignment_field, clients, save_batch_size=SAVE_BATCH_SIZE):
     objects_created = []
     updated_assembly_refs = dict()
     assemblyset_query = False
@@ -1009,33 +1223,55 @@ def process_assembly_objs(primary_wsid, top_obj, upa, upas, classification, over
     else:
         upas = [upa]
     
-    for assembly_upa in upas:
-        original_upa = assembly_upa
-        
+    # fetch, update and save the assemblies a batch at a time
+    for batch_start in range(0, len(upas), save_batch_size):
+        batch_upas = upas[batch_start:batch_start + save_batch_size]
+
         if not assemblyset_query:
-            assembly_obj = top_obj
+            assembly_objs = [top_obj]
         else:
-            assembly_obj = clients.dfu().get_objects({'object_refs': [assembly_upa]})['data'][0]
-        assembly_name = assembly_obj['info'][NAME_I]
+            assembly_objs = clients.dfu().get_objects({'object_refs': batch_upas})['data']
 
-        if assembly_name not in classification:
-            print ("missing classification for "+assembly_name)
-            updated_assembly_refs[assembly_upa] = assembly_upa
-            continue
-        else:
+        update_upas = []
+        update_assembly_objs = []
+        update_std_lineages = []
+        for assembly_upa, assembly_obj in zip(batch_upas, assembly_objs):
+            assembly_name = assembly_obj['info'][NAME_I]
+
+            if assembly_name not in classification:
+                print ("missing classification for "+assembly_name)
+                updated_assembly_refs[assembly_upa] = assembly_upa
+                continue
+
+            # set std_lineage GTDB field in assembly obj
+            this_classification = classification[assembly_name]
+            this_taxon_id = get_taxon_id (this_classification)
+            std_lineages = get_std_lineages (this_classification, gtdb_ver, this_taxon_id)
+
+            # don't save a new version of an assembly that already has this lineage
+            if is_gtdb_lineage_current (assembly_obj['data'], std_lineages):
+                print ("GTDB lineage already current for "+assembly_name)
+                updated_assembly_refs[assembly_upa] = assembly_upa
+                continue
             any_assembly_updated = True
 
-            
-        # set std_lineage GTDB field in assembly obj
-        this_classification = classification[assembly_name]
-        this_taxon_id = get_taxon_id (this_classification)
-        std_lineages = get_std_lineages (this_classification, gtdb_ver, this_taxon_id)
-
-        # update and save assembly
-        new_assembly_ref = update_and_save_assembly (primary_wsid, assembly_obj, std_lineages, clients)
-        updated_assembly_refs[original_upa] = new_assembly_ref
-        desc = 'Added GTDB lineage'
-        objects_created.append({'ref': new_assembly_ref, 'description': desc})
+            update_upas.append(assembly_upa)
+            update_assembly_objs.append(assembly_obj)
+            update_std_lineages.append(std_lineages)
+
+        if not update_upas:
+            continue
+
+        # update and save assemblies
+        new_assembly_refs = update_and_save_assemblies (primary_wsid,
+                                                        update_assembly_objs,
+                                                        update_std_lineages,
+                                                        clients,
+                                                        save_batch_size)
+        for original_upa, new_assembly_ref in zip(update_upas, new_assembly_refs):
+            updated_assembly_refs[original_upa] = new_assembly_ref
+            desc = 'Added GTDB lineage'
+            objects_created.append({'ref': new_assembly_ref, 'description': desc})
         
         
     # update refs in assemblyset
@@ -1084,18 +1320,38 @@ def get_std_lineages (this_classification, gtdb_ver, this_taxon_id):
     }
 
 
+# is_gtdb_lineage_current ()
+#
+def is_gtdb_lineage_current (obj_data, std_lineages):
+    return (obj_data.get('std_lineages') or {}).get('gtdb') == std_lineages['gtdb']
+
+
+# taxonomy_needs_update ()
+#
+def taxonomy_needs_update (genome_obj_data, this_classification, overwrite_tax):
+    # set taxonomy if missing or force overwrite, unless it's already this classification
+    taxonomy = genome_obj_data.get('taxonomy')
+    if taxonomy == this_classification:
+        return False
+    return overwrite_tax == 1 \
+        or not taxonomy \
+        or taxonomy.startswith('Unconfirmed') \
+        or taxonomy.startswith('Unknown')
+
+
 # copy_gtdb_genome_objs ()
 #
-def copy_gtdb_genome_objs (genome_ids, genome_id_to_upa_map, new_obj_name_prefix, dst_ws_id, clients):
+def copy_gtdb_genome_objs (genome_ids, genome_id_to_upa_map, new_obj_name_prefix, dst_ws_id, clients, copy_threads=1, copy_retries=0):
     genome_refs = dict()
 
-    # DEBUG
-    #print ("READING GENOME IDS in copy_gtdb_genome_objs() ==========================")  # DEBUG
-    for genome_i,genome_id in enumerate(sorted(genome_id_to_upa_map.keys())):
-        if genome_i > 10:
-            break
-        #print ("GENOME_MAP ID -> UPA: '{}' -> '{}'".format(genome_id,genome_id_to_upa_map[genome_id]))
+    # look up the source genome names in batches rather than one at a time below
+    clients.object_info().get_infos([genome_id_to_upa_map[genome_id] for genome_id in genome_ids
+                                     if genome_id in genome_id_to_upa_map])
 
+    # the objects already in the destination workspace, listed once for the job
+    name_index = clients.name_index (dst_ws_id, new_obj_name_prefix or '')
+    dst_obj_names = dict()
+    src_upas_to_copy = dict()
 
     for genome_id in genome_ids:
         #print ("GENOME ID: '{}'".format(genome_id))  # DEBUG
@@ -1108,51 +1364,85 @@ def copy_gtdb_genome_objs (genome_ids, genome_id_to_upa_map, new_obj_name_prefix
         if new_obj_name_prefix:
             dst_obj_name = new_obj_name_prefix+dst_obj_name
             
-        existing_obj_info = get_obj_info (dst_ws_id, dst_obj_name, clients)
-        if existing_obj_info:
-            genome_obj_info = existing_obj_info
-        else:
-            genome_obj_info = _copy_genome_obj(src_upa,
-                                               dst_ws_id,
-                                               dst_obj_name,
-                                               clients)
-        genome_refs[genome_id] = upa_from_info(genome_obj_info)
+        dst_obj_names[genome_id] = dst_obj_name
+        if not name_index.get_info (dst_obj_name):
+            src_upas_to_copy[dst_obj_name] = src_upa
+
+    # copy the genomes that aren't already in the workspace concurrently
+    copied_obj_infos = map_ordered (lambda dst_obj_name: _copy_genome_obj(src_upas_to_copy[dst_obj_name],
+                                                                          dst_ws_id,
+                                                                          dst_obj_name,
+                                                                          clients),
+                                    list(src_upas_to_copy.keys()),
+                                    copy_threads,
+                                    copy_retries)
+    for genome_obj_info in copied_obj_infos:
+        name_index.add (genome_obj_info)
+
+    for genome_id, dst_obj_name in dst_obj_names.items():
+        genome_refs[genome_id] = upa_from_info(name_index.get_info (dst_obj_name))
 
     return genome_refs
 
             
-# save_genome_obj ()
+# save_objs_in_batches ()
+#
+def save_objs_in_batches (primary_wsid, objects, clients, batch_size=SAVE_BATCH_SIZE):
+    '''
+    Save objects to a workspace with as few save_objects calls as possible.
+
+    :param primary_wsid: the ID of the workspace to save to.
+    :param objects: the object save specs, dicts with 'type', 'name' and 'data' keys.
+    :param clients: the KBase clients.
+    :param batch_size: the maximum number of objects to save in one call.
+    :returns: the UPAs of the saved objects in the same order as the objects.
+    '''
+    new_refs = []
+    batch = []
+    batch_names = set()
+    for obj in objects + [None]:
+        # an object saved twice under the same name goes in the next call, so its versions
+        # are saved in order
+        if batch and (obj is None or len(batch) >= batch_size or obj['name'] in batch_names):
+            obj_infos = clients.dfu().save_objects({'id': primary_wsid, 'objects': batch})
+            new_refs.extend(upa_from_info(obj_info) for obj_info in obj_infos)
+            batch = []
+            batch_names = set()
+        if obj is not None:
+            batch.append(obj)
+            batch_names.add(obj['name'])
+    return new_refs
+
+
+# save_genome_objs ()
 #
-def save_genome_obj (primary_wsid, genome_name, genome_obj_data, clients):
+def save_genome_objs (primary_wsid, genome_names, genome_objs_data, clients, batch_size=SAVE_BATCH_SIZE):
 
-    genome_obj_data = fix_unowned_shock_handles ('genome', genome_obj_data, clients)
+    genome_objs_data = fix_unowned_shock_handles ('genome', genome_objs_data, clients)
 
-    updated_obj_info = clients.dfu().save_objects(
-        { 'id': primary_wsid,
-          'objects': [{ 'type': 'KBaseGenomes.Genome',
-                        'name': genome_name,
-                        'data': genome_obj_data
-          }]})[0]
-    new_ref = upa_from_info(updated_obj_info)
-    return new_ref
+    return save_objs_in_batches (primary_wsid,
+                                 [{ 'type': 'KBaseGenomes.Genome',
+                                    'name': genome_name,
+                                    'data': genome_obj_data
+                                  } for genome_name, genome_obj_data in zip(genome_names, genome_objs_data)],
+                                 clients,
+                                 batch_size)
 
 
-# update_and_save_assembly ()
+# update_and_save_assemblies ()
 #
-def update_and_save_assembly (primary_wsid, assembly_obj, std_lineages, clients):
-    assembly_obj['data']['std_lineages'] = std_lineages
-    #this_wsid = assembly_obj['info'][WSID_I]
-    assembly_name = assembly_obj['info'][NAME_I]
+def update_and_save_assemblies (primary_wsid, assembly_objs, std_lineages_list, clients, batch_size=SAVE_BATCH_SIZE):
+    for assembly_obj, std_lineages in zip(assembly_objs, std_lineages_list):
+        assembly_obj['data']['std_lineages'] = std_lineages
+    fix_unowned_shock_handles ('assembly', [assembly_obj['data'] for assembly_obj in assembly_objs], clients)
 
-    assembly_obj['data'] = fix_unowned_shock_handles ('assembly', assembly_obj['data'], clients)
-    
-    updated_assembly_obj_info = clients.dfu().save_objects({ 'id': primary_wsid,
-                                                             'objects': [{ 'type': 'KBaseGenomeAnnotations.Assembly',
-                                                                           'name': assembly_name,
-                                                                           'data': assembly_obj['data']
-                                                             }]})[0]
-    new_assembly_ref = upa_from_info(updated_assembly_obj_info)
-    return new_assembly_ref
+    return save_objs_in_batches (primary_wsid,
+                                 [{ 'type': 'KBaseGenomeAnnotations.Assembly',
+                                    'name': assembly_obj['info'][NAME_I],
+                                    'data': assembly_obj['data']
+                                  } for assembly_obj in assembly_objs],
+                                 clients,
+                                 batch_size)
 
 
 # update_and_save_genomeset ()
@@ -1278,13 +1568,16 @@ def get_query_assembly_to_genome_name (top_obj, clients):
     if check_obj_type_genome (obj_type):
         upas = get_upas_from_set (top_obj)
 
-        for query_upa in upas:
-            (this_wsid_str, this_objid_str, this_ver) = query_upa.split('/')
-            query_genome_obj = clients.ws().get_objects2({'objects': [{'wsid':int(this_wsid_str),'objid':int(this_objid_str)}]})['data'][0]
-            genome_name = query_genome_obj['info'][NAME_I]
-            genome_upa = upa_from_info (query_genome_obj['info'])
-            assembly_upa = query_genome_obj['data'].get('contigset_ref') or query_genome_obj['data'].get('assembly_ref')
-            assembly_info = clients.ws().get_object_info3({'objects': [{'ref':assembly_upa}]})['infos'][0]
+        # only the assembly reference is needed from each genome
+        genome_names = []
+        assembly_upas = []
+        query_genome_objs = clients.ws().get_objects2({'objects': [{'ref':'/'.join(query_upa.split('/')[:2]),
+                                                                    'included':['/contigset_ref', '/assembly_ref']}
+                                                                   for query_upa in upas]})['data']
+        for query_genome_obj in query_genome_objs:
+            genome_names.append(query_genome_obj['info'][NAME_I])
+            assembly_upas.append(query_genome_obj['data'].get('contigset_ref') or query_genome_obj['data'].get('assembly_ref'))
+        for genome_name, assembly_info in zip(genome_names, clients.object_info().get_infos(assembly_upas)):
             assembly_name = assembly_info[NAME_I]
             query_assembly_to_genome_name[assembly_name] = genome_name
 
@@ -1307,7 +1600,7 @@ def _copy_genome_obj(src_upa,
 
 # copy_gtdb_species_reps()
 #
-def copy_gtdb_species_reps (primary_wsid, top_upa, genome_upas_map_file, summary_tables, clients):
+def copy_gtdb_species_reps (primary_wsid, top_upa, genome_upas_map_file, summary_tables, clients, copy_threads=1, copy_retries=0):
     new_objects_created = []
 
     # get upas by genome id
@@ -1326,36 +1619,33 @@ def copy_gtdb_species_reps (primary_wsid, top_upa, genome_upas_map_file, summary
     (all_sp_reps, sp_reps_by_query) = get_sp_rep_hits(summary_tables, query_assembly_to_genome_name)
 
     
-    # copy over genome objs
+    # copy over genome objs, checking names against the objects already in the workspace
+    name_index = clients.name_index (primary_wsid, 'GTDB_SP_REP-')
     sp_rep_dst_upa = dict()
+    sp_rep_copies = []
     for sp_rep_id in sorted(all_sp_reps.keys()):
         sp_rep_src_upa = genome_id_to_upa_map[sp_rep_id]
-        (src_wsid_str, src_objid_str, src_ver) = sp_rep_src_upa.split('/')
 
-        dst_obj_name = 'GTDB_SP_REP-'+sp_rep_id+'.Genome'
-        found_free_name = False
-        try:
-            existing_obj = clients.ws().get_object_info3({'objects':[{'wsid':primary_wsid,'name':dst_obj_name}]})
-            for extra_char in range(10):
-                dst_obj_name = 'GTDB_SP_REP-'+sp_rep_id+'-'+str(extra_char)+'.Genome'
-                try:
-                    existing_obj = clients.ws().get_object_info3({'objects':[{'wsid':primary_wsid,'name':dst_obj_name}]})
-                except:
-                    found_free_name = True
-                    break
-        except:
-            found_free_name = True
-
-        if not found_free_name:
-            raise ValueError ("unable to find available object name for GTDB Species Rep {}".format(sp_rep_id))
+        # the name, or the first of ten numbered alternatives, that isn't already taken
+        dst_obj_name = name_index.get_free_name (
+            ['GTDB_SP_REP-'+sp_rep_id+'.Genome'] +
+            ['GTDB_SP_REP-'+sp_rep_id+'-'+str(extra_char)+'.Genome' for extra_char in range(10)])
 
-        # copy the object, using newest version (or does copy_object barf on assembly handle too?)
-        dst_genome_obj_info =  _copy_genome_obj(sp_rep_src_upa,
-                                                primary_wsid,
-                                                dst_obj_name,
-                                                clients)
-        #dst_genome_obj_info = clients.ws().copy_object({'from':{'wsid':int(src_wsid_str), 'objid':int(src_objid_str)}, 'to':{'wsid':primary_wsid,'name':dst_obj_name}})
+        if not dst_obj_name:
+            raise ValueError ("unable to find available object name for GTDB Species Rep {}".format(sp_rep_id))
 
+        sp_rep_copies.append((sp_rep_id, sp_rep_src_upa, dst_obj_name))
+
+    # copy the objects concurrently, using newest version (or does copy_object barf on assembly handle too?)
+    dst_genome_obj_infos = map_ordered (lambda sp_rep_copy: _copy_genome_obj(sp_rep_copy[1],
+                                                                             primary_wsid,
+                                                                             sp_rep_copy[2],
+                                                                             clients),
+                                        sp_rep_copies,
+                                        copy_threads,
+                                        copy_retries)
+    for (sp_rep_id, sp_rep_src_upa, dst_obj_name), dst_genome_obj_info in zip(sp_rep_copies, dst_genome_obj_infos):
+        name_index.add (dst_genome_obj_info)
         sp_rep_dst_upa[sp_rep_id] = upa_from_info (dst_genome_obj_info)
 
 
@@ -1363,9 +1653,9 @@ def copy_gtdb_species_reps (primary_wsid, top_upa, genome_upas_map_file, summary
     #
     all_genomeset_elements = dict()
     per_query_genomeset_elements = dict()
-    for query_upa in upas:
-        (this_wsid_str, this_objid_str, this_ver) = query_upa.split('/')
-        genome_obj_info = clients.ws().get_object_info3({'objects': [{'wsid':int(this_wsid_str),'objid':int(this_objid_str)}]})['infos'][0]
+    # latest versions, since the lineage update may have saved new ones
+    query_infos = clients.object_info().get_infos(['/'.join(query_upa.split('/')[:2]) for query_upa in upas])
+    for genome_obj_info in query_infos:
         genome_name = genome_obj_info[NAME_I]
         genome_upa = upa_from_info (genome_obj_info)
         #query_names[genome_upa] = genome_name
@@ -1424,22 +1714,25 @@ def copy_gtdb_species_reps (primary_wsid, top_upa, genome_upas_map_file, summary
 
 # fix_unowned_shock_handles ()
 #
-def fix_unowned_shock_handles (obj_type, obj_data, clients):
-    handle_fields = { 'genome': ['genbank_handle_ref', 'gff_handle_ref'],
-                      'assembly': ['reads_handle_ref', 'fasta_handle_ref']
-                    }
-
-    for h_field in handle_fields[obj_type]:
-
-        if obj_data.get(h_field):
-            h_id = obj_data[h_field]
-            s_id = clients.hs().hids_to_handles ([h_id])[0]['id']
-            own_node_output = clients.dfu().own_shock_node({'shock_id': s_id, 'make_handle': 1})
-            new_s_id = own_node_output['shock_id']
-            new_h_id = own_node_output['handle']['hid']
-            obj_data[h_field] = new_h_id
-
-    return obj_data
+def fix_unowned_shock_handles (obj_type, objs_data, clients):
+    # all the handles are resolved in one batch, and each node is only owned once per job
+    new_hids = clients.handle_owner().own_handles(get_handle_ids (obj_type, objs_data))
+
+    for obj_data in objs_data:
+        for h_field in HANDLE_FIELDS[obj_type]:
+            if obj_data.get(h_field):
+                obj_data[h_field] = new_hids[obj_data[h_field]]
+
+    return objs_data
+
+
+# get_handle_ids ()
+#
+def get_handle_ids (obj_type, objs_data):
+    return [obj_data[h_field]
+            for obj_data in objs_data
+            for h_field in HANDLE_FIELDS[obj_type]
+            if obj_data.get(h_field)]
 
 
 # upa_from_info ()
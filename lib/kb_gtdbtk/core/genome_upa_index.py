@@ -0,0 +1,96 @@
+'''
+A prebuilt, memory mapped index from GTDB genome accession to the UPA of the KBase copy of the
+genome, built from the Genome_UPAs TSV files in data/ when the image is built.
+'''
+
+import gzip
+import os
+
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Iterator, Union
+
+from kb_gtdbtk.core.mmap_table import MmapTable, write_mmap_table
+
+
+_UPA_COLUMN = 'upa'
+
+
+# get_genome_upa_index_path()
+#
+def get_genome_upa_index_path(genome_upas_map_file: Union[str, Path]) -> Path:
+    '''
+    Get the path of the index for a genome UPAs map file.
+
+    :param genome_upas_map_file: the path to the tab separated genome id to UPA file.
+    :returns: the path to the index, next to the map file.
+    '''
+    return Path(str(genome_upas_map_file) + '.idx')
+
+
+# build_genome_upa_index()
+#
+def build_genome_upa_index(genome_upas_map_file: Union[str, Path]) -> Path:
+    '''
+    Build the index for a genome UPAs map file. The genomes are stored sorted by id.
+
+    :param genome_upas_map_file: the path to the tab separated genome id to UPA file, optionally
+        gzipped.
+    :returns: the path to the index.
+    '''
+    if str(genome_upas_map_file).lower().endswith('.gz'):
+        f = gzip.open(genome_upas_map_file, 'rt')
+    else:
+        f = open(genome_upas_map_file, 'r')
+    with f:
+        rows = []
+        for line in f:
+            line = line.rstrip()
+            if not line:
+                continue
+            (genome_id, upa) = line.split("\t")
+            rows.append((genome_id, [upa]))
+    index_path = get_genome_upa_index_path(genome_upas_map_file)
+    write_mmap_table(index_path, [_UPA_COLUMN], sorted(rows, key=lambda r: r[0]))
+    return index_path
+
+
+# has_current_genome_upa_index()
+#
+def has_current_genome_upa_index(genome_upas_map_file: Union[str, Path]) -> bool:
+    '''
+    Check whether a genome UPAs map file has an index at least as new as the file.
+
+    :param genome_upas_map_file: the path to the genome id to UPA file.
+    :returns: True if the index exists and is up to date.
+    '''
+    index_path = get_genome_upa_index_path(genome_upas_map_file)
+    return (os.path.isfile(index_path)
+            and os.path.getmtime(index_path) >= os.path.getmtime(genome_upas_map_file))
+
+
+class GenomeUpaIndex(Mapping):
+    '''
+    A read only mapping from genome id to UPA backed by an index built by
+    build_genome_upa_index.
+    '''
+
+    def __init__(self, index_path: Union[str, Path]):
+        '''
+        Open the index.
+
+        :param index_path: the path to the index.
+        '''
+        self._table = MmapTable(Path(index_path))
+
+    def __getitem__(self, genome_id: str) -> str:
+        return self._table[genome_id][0]
+
+    def __contains__(self, genome_id) -> bool:
+        return genome_id in self._table
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._table)
+
+    def __len__(self) -> int:
+        return len(self._table)
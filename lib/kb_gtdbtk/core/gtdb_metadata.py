@@ -0,0 +1,141 @@
+'''
+Indexed lookups into the GTDB archaeal and bacterial metadata tables.
+
+The metadata TSVs in /data/r<ver> are hundreds of MB, so rather than reading them for each
+lookup they are converted once, during refdata initialization, into a memory mapped table
+(see kb_gtdbtk.core.mmap_table) holding just the columns we use.
+'''
+
+import functools
+import os
+
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from kb_gtdbtk.core.mmap_table import MmapTable, write_mmap_table
+
+
+# the metadata columns kept in the store
+METADATA_COLUMNS = ['gtdb_taxonomy',
+                    'gtdb_representative',
+                    'gtdb_genome_representative',
+                    'ncbi_organism_name',
+                    'ncbi_taxonomy'
+                    ]
+
+# GTDB prefixes accessions with the NCBI source database, GTDB-tk output does not
+_ACCESSION_PREFIXES = ('RS_', 'GB_')
+
+
+# get_gtdb_metadata_store_path()
+#
+def get_gtdb_metadata_store_path(db_ver: int, data_dir: Path = Path('/data')) -> Path:
+    '''
+    Get the path of the metadata store for a GTDB version.
+
+    :param db_ver: the GTDB version.
+    :param data_dir: the reference data directory.
+    :returns: the path.
+    '''
+    return Path(data_dir) / ('r' + str(db_ver)) / ('gtdb_metadata_r' + str(db_ver) + '.idx')
+
+
+# build_gtdb_metadata_store()
+#
+def build_gtdb_metadata_store(
+        metadata_files: Iterable[Path],
+        out_path: Path,
+        columns: Sequence[str] = METADATA_COLUMNS) -> None:
+    '''
+    Build the metadata store from the GTDB metadata TSV files.
+
+    :param metadata_files: the ar53 and bac120 metadata files.
+    :param out_path: the path of the store to write.
+    :param columns: the metadata columns to keep.
+    '''
+    write_mmap_table(out_path, columns, _read_metadata_rows(metadata_files, columns))
+
+
+def _read_metadata_rows(metadata_files, columns):
+    for metadata_file in metadata_files:
+        with open(metadata_file, 'r', encoding='utf-8') as f:
+            header = f.readline().rstrip('\r\n').split('\t')
+            missing = [c for c in ['accession'] + list(columns) if c not in header]
+            if missing:
+                raise ValueError(f'{metadata_file} is missing columns {missing}')
+            col_idxs = [header.index(c) for c in columns]
+            accession_i = header.index('accession')
+            for line in f:
+                fields = line.rstrip('\r\n').split('\t')
+                yield (_strip_accession_prefix(fields[accession_i]),
+                       [fields[i] for i in col_idxs])
+
+
+def _strip_accession_prefix(accession):
+    if accession.startswith(_ACCESSION_PREFIXES):
+        return accession[3:]
+    return accession
+
+
+class GtdbMetadata:
+    '''
+    Lookups into the GTDB metadata store for a GTDB version.
+    '''
+
+    def __init__(self, path: Path):
+        '''
+        Open the store.
+
+        :param path: the path to the store built by build_gtdb_metadata_store.
+        '''
+        self._table = MmapTable(path)
+
+    @property
+    def columns(self) -> List[str]:
+        ''' The metadata columns in the store. '''
+        return self._table.columns
+
+    def get(self, accession: str) -> Optional[Dict[str, str]]:
+        '''
+        Get the metadata for a genome.
+
+        :param accession: the genome accession, with or without the RS_ or GB_ prefix.
+        :returns: a mapping from column name to value, or None if the genome is not in GTDB.
+        '''
+        row = self._table.get(_strip_accession_prefix(accession))
+        if row is None:
+            return None
+        return dict(zip(self._table.columns, row))
+
+    def get_value(self, accession: str, column: str) -> Optional[str]:
+        '''
+        Get a single metadata value for a genome.
+
+        :param accession: the genome accession, with or without the RS_ or GB_ prefix.
+        :param column: the metadata column.
+        :returns: the value, or None if the genome is not in GTDB.
+        '''
+        return self._table.get_value(_strip_accession_prefix(accession), column)
+
+    def __contains__(self, accession) -> bool:
+        return isinstance(accession, str) and _strip_accession_prefix(accession) in self._table
+
+    def __len__(self) -> int:
+        return len(self._table)
+
+
+# get_gtdb_metadata()
+#
+@functools.lru_cache(maxsize=None)
+def get_gtdb_metadata(db_ver: int, data_dir: Path = Path('/data')) -> Optional[GtdbMetadata]:
+    '''
+    Get the metadata store for a GTDB version, opened once per process.
+
+    :param db_ver: the GTDB version.
+    :param data_dir: the reference data directory.
+    :returns: the store, or None if it has not been built for this version.
+    '''
+    path = get_gtdb_metadata_store_path(db_ver, data_dir)
+    if not os.path.isfile(path):
+        return None
+    return GtdbMetadata(path)
@@ -2,18 +2,70 @@
 Run GTDB-tk against a set of sequence files.
 '''
 
+import errno
+import hashlib
 import logging
 import json
 import os
 import sys
 import shutil
-import pandas as pd
+import re
 import tempfile
+import threading
 
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 from shutil import copyfile,copytree,rmtree
-from typing import Dict, List, Callable
+from typing import Dict, List, Callable, NamedTuple, Optional, Set
+
+from kb_gtdbtk.core.classification_cache import ClassificationCache, get_file_sha256
+from kb_gtdbtk.core.tree_discovery import (
+    SKIP_ANI_SOURCE, discover_trees, get_tagged_tree_file_name)
+
+
+# smallest number of queries worth starting another classify_wf process for
+MIN_GENOMES_PER_SHARD = 50
+
+# per-shard tables that are merged back into a single classify_wf output layout
+SHARDED_TABLE_FILES = {'gtdbtk.ar53.summary.tsv': 'classify',
+                       'gtdbtk.bac120.summary.tsv': 'classify',
+                       'gtdbtk.bac120.tree.mapping.tsv': 'classify',
+                       'gtdbtk.ar53.markers_summary.tsv': 'identify',
+                       'gtdbtk.bac120.markers_summary.tsv': 'identify'
+                       }
+
+# per genome tables that are stored in the classification cache
+CACHED_TABLE_FILES = ['gtdbtk.ar53.summary.tsv',
+                      'gtdbtk.bac120.summary.tsv',
+                      'gtdbtk.ar53.markers_summary.tsv',
+                      'gtdbtk.bac120.markers_summary.tsv'
+                      ]
+
+# how the GTDB-tk output is placed in the runtime_output directory of the output
+RUNTIME_OUTPUT_MODES = ('copy', 'hardlink', 'move')
+
+# when only the report files are placed in runtime_output, the files kept and the
+# directories skipped
+RUNTIME_OUTPUT_REPORT_FILE_RE = re.compile(r'\.(tsv|tree|json|log)$')
+RUNTIME_OUTPUT_SKIPPED_DIRS = frozenset(['intermediate_results'])
+
+# records the completed stages in a checkpoint directory
+CHECKPOINT_MANIFEST = 'checkpoint.json'
+
+# lists the queries whose results came from the classification cache, which are not in the trees
+CACHED_ID_MAP_FILE = 'id_to_name-cached.map'
+
+_QUERY_ID_RE = re.compile(r'^id\d+$')
+
+# values that pd.read_csv treats as missing, or as numbers or booleans
+_TSV_NA_VALUES = frozenset([
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'])
+_INT_RE = re.compile(r'^[+-]?\d+$')
+_FLOAT_RE = re.compile(r'^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$')
+_TSV_BOOL_VALUES = {'True': True, 'TRUE': True, 'true': True,
+                    'False': False, 'FALSE': False, 'false': False}
 
 
 # timestamp
@@ -34,7 +86,14 @@ def run_gtdbtk(
         min_perc_aa: float,
         db_ver: int,
         keep_intermediates: int,
-        cpus: int) -> None:
+        cpus: int,
+        cpus_per_shard: int = 0,
+        cache: Optional[ClassificationCache] = None,
+        identified: Optional['IdentifiedSequences'] = None,
+        checkpoint_stages: bool = False,
+        runtime_output_mode: str = 'copy',
+        runtime_output_report_files_only: bool = False,
+        trees_required: bool = False) -> None:
     '''
     Run GTDB-tk on a set of sequences in FASTA format. Expects the 'gtdbtk' command to be on the
     system path.
@@ -52,6 +111,31 @@ def run_gtdbtk(
         directories in this directory may be deleted or overwritten.
     :param min_perc_aa: The mimimum sequence alignment in percent.
     :param cpus: the number of CPUs GTDB-tk should use.
+    :param cpus_per_shard: if > 0, split the sequences into shards and run one classify_wf
+        process per shard concurrently, each with this many CPUs. The number of shards is
+        cpus // cpus_per_shard, limited so that each shard has at least MIN_GENOMES_PER_SHARD
+        sequences. 0 runs a single classify_wf process over all the sequences.
+    :param cache: if provided, the results for sequences found in the cache are used rather
+        than running GTDB-tk on those sequences, and the results for the other sequences are
+        added to the cache. Sequences found in the cache do not appear in the output trees.
+    :param identified: if provided, the sequences have already been run through gtdbtk
+        identify by a StreamingIdentify, and align and classify are run over the combined
+        identify output instead of running classify_wf. The sequences argument is ignored.
+        If the StreamingIdentify was given a cache, its cache hits are used rather than
+        looking the sequences up again.
+    :param checkpoint_stages: run identify, align and classify as separate stages rather than
+        running classify_wf, recording each completed stage in a checkpoint manifest in a
+        directory under temp_dir keyed by the inputs. A re-run on the same inputs with the same
+        temp_dir resumes after the last completed stage. Not used when sharding or when
+        identified is provided.
+    :param runtime_output_mode: how the GTDB-tk output directory is placed in the runtime_output
+        directory in output_dir, one of RUNTIME_OUTPUT_MODES. 'hardlink' falls back to copying
+        files if the directories are on different filesystems. 'move' removes the files from
+        temp_dir, including any checkpoints.
+    :param runtime_output_report_files_only: only place the tables, trees and logs in
+        runtime_output, skipping the intermediate results and alignments.
+    :param trees_required: every sequence must be placed in the output trees, so results
+        are not taken from the cache, although new results are still added to it.
     '''
     # TODO input checking
     # TODO test logging, need to install an interceptor. Tested manually for now
@@ -61,81 +145,589 @@ def run_gtdbtk(
     # (which GTDB-tk will use to create temporary files) and then remap to the original,
     # potentially unsafe names.
     timestamp = now_ISOish()
-    temp_links = temp_dir / 'links' / timestamp
-    temp_links.mkdir(parents=True, exist_ok=True)
-    id_to_name = {}
-    with tempfile.NamedTemporaryFile(
-            mode='w',
-            prefix='gtdb_tk_file_input_',
-            suffix='.tmp',
-            delete=False,
-            dir=temp_dir) as tf:
+    if identified:
+        temp_links = identified.links_dir
+        id_to_name = dict(identified.id_to_name)
+        id_to_path = dict(identified.id_to_path)
+    else:
+        # unique, as a resumed run may reuse temp_dir within the same second
+        (temp_dir / 'links').mkdir(parents=True, exist_ok=True)
+        temp_links = Path(tempfile.mkdtemp(prefix=timestamp + '_', dir=temp_dir / 'links'))
+        id_to_name = {}
+        id_to_path = {}
         for i, path in enumerate(sorted(sequences)):
             id_ = f'id{i}'
             id_to_name[id_] = str(sequences[path]).replace('.gz','')
+            id_to_path[id_] = path
             os.symlink(path, temp_links / id_)
-            tf.write(str(temp_links / id_) + '\t' + id_ + '\n')
 
-    # set refdata location
-    os.environ['GTDBTK_DATA_PATH'] = os.path.join(os.sep, 'data','r'+str(db_ver))
+    # queries classified by an earlier run don't need to go through GTDB-tk again, unless
+    # they're needed in the trees
+    cache_keys = dict()
+    cached_rows = dict()
+    if identified and identified.cache_keys is not None:
+        if trees_required and identified.cached_rows:
+            raise ValueError('Sequences were taken from the classification cache before '
+                             + 'identify, but trees are required for all sequences')
+        cache_keys = dict(identified.cache_keys)
+        cached_rows = dict(identified.cached_rows or {})
+    elif cache:
+        for id_, path in id_to_path.items():
+            cache_keys[id_] = cache.get_key(path, db_ver, min_perc_aa)
+            if trees_required:
+                continue
+            entry = cache.get(cache_keys[id_])
+            if entry:
+                cached_rows[id_] = entry
+    if trees_required and cache:
+        logging.info('Trees are required for all queries, not using the classification cache')
+    elif cache_keys:
+        logging.info(f'{len(cached_rows)} of {len(id_to_name)} queries found in the classification cache')
+    run_ids = [id_ for id_ in id_to_name.keys() if id_ not in cached_rows]
+    run_id_to_name = {id_: id_to_name[id_] for id_ in run_ids}
+    batchfile = _write_batchfile(temp_dir, temp_links, run_ids)
+
+    _set_gtdbtk_data_path(db_ver)
+
+    # run first pass
+    shards = _get_num_shards(len(run_ids), cpus, cpus_per_shard)
+    checkpoint_dir = None
+    if checkpoint_stages and run_ids and not identified and shards == 1:
+        checkpoint_dir = _get_checkpoint_dir(temp_dir, id_to_path, run_ids, db_ver, min_perc_aa)
+        logging.info(f'Running GTDB-tk in checkpointed stages in {checkpoint_dir}')
 
     # set output dirs
-    temp_output = temp_dir / 'output' / timestamp
-    temp_trees_output = temp_dir / 'output_trees' / timestamp
+    if checkpoint_dir:
+        temp_output = checkpoint_dir
+        temp_trees_output = checkpoint_dir / 'skip_ani'
+    else:
+        temp_output = temp_dir / 'output' / timestamp
+        temp_trees_output = temp_dir / 'output_trees' / timestamp
     temp_output.mkdir(parents=True, exist_ok=True)
 
+    # refdata mounted mash db.  Must be generated during docker image registration init as /data is read-only at app runtime
+    mash_db_dir = os.path.join (os.sep, 'data' , 'r'+str(db_ver), 'mash')
+    mash_db_file = 'gtdb_ref_sketch.msh'
+    mash_db_path = os.path.join (mash_db_dir, mash_db_file)
+    if not os.path.exists (mash_db_path):
+        raise ValueError ('GTDB REF Genomes MASH DB not found.  Must generate during refdata initialization')
+
+    if not run_ids:
+        logging.info('All queries found in the classification cache, not running GTDB-tk')
+    elif identified:
+        _run_align_classify(gtdbtk_runner,
+                            identified.identify_dirs,
+                            run_ids,
+                            batchfile,
+                            temp_output,
+                            cpus,
+                            min_perc_aa,
+                            keep_intermediates,
+                            ['--mash_db', mash_db_path])
+    elif shards > 1:
+        _run_sharded_classify_wf(gtdbtk_runner,
+                                 temp_dir,
+                                 temp_links,
+                                 run_ids,
+                                 temp_output,
+                                 shards,
+                                 cpus_per_shard,
+                                 min_perc_aa,
+                                 keep_intermediates,
+                                 ['--mash_db', mash_db_path])
+    elif checkpoint_dir:
+        _run_checkpointed_stage(gtdbtk_runner, checkpoint_dir, 'identify',
+                                _identify_cmd(checkpoint_dir, batchfile, cpus))
+        _run_checkpointed_stage(gtdbtk_runner, checkpoint_dir, 'align',
+                                _align_cmd(checkpoint_dir, checkpoint_dir, cpus, min_perc_aa))
+        _run_checkpointed_stage(gtdbtk_runner, checkpoint_dir, 'classify',
+                                _classify_cmd(checkpoint_dir, checkpoint_dir, batchfile, cpus,
+                                              ['--mash_db', mash_db_path]))
+        if keep_intermediates != 1:
+            _remove_intermediates(checkpoint_dir)
+    else:
+        gtdbtk_cmd = _classify_wf_cmd(temp_output, batchfile, cpus, min_perc_aa,
+                                      keep_intermediates, ['--mash_db', mash_db_path])
+        _run_command(gtdbtk_runner, gtdbtk_cmd)
+
+    # Not all queries may be placed into trees (ANI step may filter).  Only those queries
+    # are re-run, and their rows are merged into the first pass results.
+    unplaced_ids = _get_ids_not_in_trees (temp_output, run_id_to_name)
+    if unplaced_ids:
+        logging.info(f'{len(unplaced_ids)} queries not placed in trees.  Running second pass with --skip_ani_screen ...')
+        unplaced_batchfile = _write_batchfile(temp_dir, temp_links, unplaced_ids)
+
+        gtdbtk_cmd = _classify_wf_cmd(temp_trees_output, unplaced_batchfile, cpus, min_perc_aa,
+                                      keep_intermediates, ['--skip_ani_screen', '--no_mash'])
+        # run second pass
+        temp_trees_output.mkdir(parents=True, exist_ok=True)
+        if checkpoint_dir:
+            _run_checkpointed_stage(gtdbtk_runner, checkpoint_dir, 'skip_ani', gtdbtk_cmd)
+        else:
+            _run_command(gtdbtk_runner, gtdbtk_cmd)
+        
+    results = _process_output_files(temp_output, temp_trees_output, output_dir, id_to_name,
+                                    cached_rows, runtime_output_mode,
+                                    runtime_output_report_files_only)
+    if cache and cache_keys:
+        _add_to_cache(cache, cache_keys, run_ids, output_dir)
+    return results
+
+
+# _add_to_cache()
+#
+def _add_to_cache(cache, cache_keys, run_ids, out_dir):
+    entries = {id_: dict() for id_ in run_ids}
+    classified_ids = dict()
+    for file_ in CACHED_TABLE_FILES:
+        path = out_dir / file_
+        if not path.is_file():
+            continue
+        with open (path, 'r') as table_h:
+            header = table_h.readline().rstrip('\n').split("\t")
+            for info_line in table_h:
+                row = info_line.rstrip('\n').split("\t")
+                if row[0] not in entries:
+                    continue
+                entries[row[0]][file_] = [header, row]
+                if file_.endswith('.summary.tsv'):
+                    classified_ids[row[0]] = True
+
+    # don't cache failures, they may be transient
+    for id_ in classified_ids:
+        cache.put(cache_keys[id_], entries[id_])
+    cache.evict()
+
+
+class IdentifiedSequences(NamedTuple):
+    '''
+    Sequences that have been run through gtdbtk identify by a StreamingIdentify.
+    '''
+
+    id_to_path: Dict[str, Path]
+    ''' A mapping from the GTDB-tk genome ID to the sequence file path. '''
+
+    id_to_name: Dict[str, str]
+    ''' A mapping from the GTDB-tk genome ID to the display name of the sequence. '''
+
+    links_dir: Path
+    ''' The directory containing links to the sequence files, named by genome ID. '''
+
+    identify_dirs: List[Path]
+    ''' The gtdbtk identify output directories, one per chunk of sequences. '''
+
+    cache_keys: Optional[Dict[str, str]] = None
+    ''' A mapping from the GTDB-tk genome ID to the classification cache key, if a cache
+    was used. '''
+
+    cached_rows: Optional[Dict[str, dict]] = None
+    ''' A mapping from the GTDB-tk genome ID to the classification cache entry for the
+    sequences found in the cache, which were not run through identify, if a cache was used. '''
+
+
+class StreamingIdentify:
+    '''
+    Runs gtdbtk identify (gene calling and marker gene search) on chunks of sequences while
+    the remaining sequences are still downloading. Pass add as the download callback, then
+    pass the result of finish to run_gtdbtk.
+
+    If given a classification cache, sequences found in the cache are not run through
+    identify. Don't provide a cache if all the sequences must be placed in the trees.
+    '''
+
+    def __init__(
+            self,
+            gtdbtk_runner: Callable[[List[str]], None],
+            temp_dir: Path,
+            db_ver: int,
+            cpus: int,
+            chunk_size: int,
+            cache: Optional[ClassificationCache] = None,
+            min_perc_aa: Optional[float] = None):
+        '''
+        Create the identify stage.
+
+        :param gtdbtk_runner: a callable that takes a list of arguments for GTDB-tk and
+            excutes the program with those arguments.
+        :param temp_dir: an extant temporary directory to use for processing.
+        :param db_ver: the GTDB version.
+        :param cpus: the number of CPUs GTDB-tk should use.
+        :param chunk_size: the number of sequences to run identify on at once.
+        :param cache: the classification cache, if any.
+        :param min_perc_aa: The mimimum sequence alignment in percent. Required with a cache.
+        '''
+        if chunk_size < 1:
+            raise ValueError('chunk_size must be > 0')
+        if cache and min_perc_aa is None:
+            raise ValueError('min_perc_aa is required with a cache')
+        self._gtdbtk_runner = gtdbtk_runner
+        self._temp_dir = temp_dir
+        self._cpus = cpus
+        self._chunk_size = chunk_size
+        self._cache = cache
+        self._db_ver = db_ver
+        self._min_perc_aa = min_perc_aa
+        timestamp = now_ISOish()
+        self._links_dir = temp_dir / 'links' / ('streamed_' + timestamp)
+        self._links_dir.mkdir(parents=True, exist_ok=True)
+        self._chunks_dir = temp_dir / 'identify_chunks' / timestamp
+        self._lock = threading.Lock()
+        self._id_to_path: Dict[str, Path] = {}
+        self._id_to_name: Dict[str, str] = {}
+        self._seen_paths: Set[Path] = set()
+        self._pending_ids: List[str] = []
+        self._cache_keys: Dict[str, str] = {}
+        self._cached_rows: Dict[str, dict] = {}
+        self._identify_dirs: List[Path] = []
+        self._futures: List[Future] = []
+        # identify gets all the cpus, so chunks run one at a time
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        _set_gtdbtk_data_path(db_ver)
+
+    def add(self, path: Path, name: str) -> None:
+        '''
+        Add a downloaded sequence. Thread safe.
+
+        :param path: the path to the FASTA file.
+        :param name: the display name for the file.
+        '''
+        with self._lock:
+            if path in self._seen_paths:
+                return
+            self._seen_paths.add(path)
+        # hashing the file for the cache key is slow, so do it outside the lock
+        cache_key = None
+        entry = None
+        if self._cache and self._min_perc_aa is not None:
+            cache_key = self._cache.get_key(path, self._db_ver, self._min_perc_aa)
+            entry = self._cache.get(cache_key)
+        with self._lock:
+            id_ = f'id{len(self._id_to_path)}'
+            self._id_to_path[id_] = path
+            self._id_to_name[id_] = str(name).replace('.gz','')
+            os.symlink(path, self._links_dir / id_)
+            if cache_key:
+                self._cache_keys[id_] = cache_key
+            if entry:
+                # already classified, no need to identify it
+                self._cached_rows[id_] = entry
+                return
+            self._pending_ids.append(id_)
+            if len(self._pending_ids) >= self._chunk_size:
+                self._submit_chunk()
+
+    def finish(self) -> IdentifiedSequences:
+        '''
+        Run identify on any remaining sequences and wait for all the chunks to complete.
+
+        :returns: the identified sequences.
+        '''
+        with self._lock:
+            if self._pending_ids:
+                self._submit_chunk()
+        self._executor.shutdown(wait=True)
+        for future in self._futures:
+            future.result()
+        if self._cache:
+            logging.info(f'{len(self._cached_rows)} of {len(self._id_to_name)} queries found '
+                         + 'in the classification cache, not run through identify')
+        return IdentifiedSequences(dict(self._id_to_path),
+                                   dict(self._id_to_name),
+                                   self._links_dir,
+                                   list(self._identify_dirs),
+                                   dict(self._cache_keys) if self._cache else None,
+                                   dict(self._cached_rows) if self._cache else None)
+
+    def _submit_chunk(self):
+        out_dir = self._chunks_dir / f'chunk{len(self._identify_dirs)}'
+        out_dir.mkdir(parents=True, exist_ok=True)
+        batchfile = _write_batchfile(self._temp_dir, self._links_dir, self._pending_ids)
+        self._pending_ids = []
+        gtdbtk_cmd = _identify_cmd(out_dir, batchfile, self._cpus)
+        self._identify_dirs.append(out_dir)
+        self._futures.append(self._executor.submit(_run_command, self._gtdbtk_runner, gtdbtk_cmd))
+
+
+# _run_command()
+#
+def _run_command(gtdbtk_runner, gtdbtk_cmd):
+    logging.info('Starting Command:\n' + ' '.join(gtdbtk_cmd))
+    gtdbtk_runner(gtdbtk_cmd)
+
+
+# _set_gtdbtk_data_path()
+#
+def _set_gtdbtk_data_path(db_ver):
+    # set refdata location
+    os.environ['GTDBTK_DATA_PATH'] = os.path.join(os.sep, 'data','r'+str(db_ver))
+
+
+# _run_align_classify()
+#
+def _run_align_classify(gtdbtk_runner,
+                        identify_dirs,
+                        run_ids,
+                        batchfile,
+                        temp_output,
+                        cpus,
+                        min_perc_aa,
+                        keep_intermediates,
+                        classify_args):
+    _merge_identify_outputs(identify_dirs, temp_output, set(run_ids))
+    _run_command(gtdbtk_runner, _align_cmd(temp_output, temp_output, cpus, min_perc_aa))
+    _run_command(gtdbtk_runner, _classify_cmd(temp_output, temp_output, batchfile, cpus,
+                                              classify_args))
+    if keep_intermediates != 1:
+        _remove_intermediates(temp_output)
+
+
+# _merge_identify_outputs()
+#
+def _merge_identify_outputs(identify_dirs, temp_output, keep_ids):
+    # combine the identify output from each chunk into a single identify directory that
+    # align can read.  Only the queries being classified are kept.
+    merged_identify = temp_output / 'identify'
+    merged_identify.mkdir(parents=True, exist_ok=True)
+    table_files = set()
+    for identify_dir in identify_dirs:
+        if (identify_dir / 'identify').is_dir():
+            table_files.update(f for f in os.listdir(identify_dir / 'identify')
+                               if f.endswith('.tsv'))
+    for file_ in sorted(table_files):
+        _merge_tables([identify_dir / 'identify' / file_ for identify_dir in identify_dirs],
+                      merged_identify / file_,
+                      keep_ids)
+
+    # the per genome gene calls and marker hits are moved, the chunks aren't needed again
+    for identify_dir in identify_dirs:
+        intermediates = identify_dir / 'identify' / 'intermediate_results'
+        if not intermediates.is_dir():
+            continue
+        for results_dir in intermediates.iterdir():
+            if not results_dir.is_dir():
+                continue
+            merged_results_dir = merged_identify / 'intermediate_results' / results_dir.name
+            merged_results_dir.mkdir(parents=True, exist_ok=True)
+            for genome_results in results_dir.iterdir():
+                if genome_results.name in keep_ids:
+                    shutil.move(str(genome_results), str(merged_results_dir / genome_results.name))
+
+
+# _write_batchfile()
+#
+def _write_batchfile(temp_dir, temp_links, ids):
+    with tempfile.NamedTemporaryFile(
+            mode='w',
+            prefix='gtdb_tk_file_input_',
+            suffix='.tmp',
+            delete=False,
+            dir=temp_dir) as tf:
+        for id_ in ids:
+            tf.write(str(temp_links / id_) + '\t' + id_ + '\n')
+    return tf.name
+
+
+# _classify_wf_cmd()
+#
+def _classify_wf_cmd(out_dir, batchfile, cpus, min_perc_aa, keep_intermediates, extra_args):
     gtdbtk_cmd = [
         'gtdbtk',
         'classify_wf',
-        '--out_dir', str(temp_output),
-        '--batchfile', tf.name,
+        '--out_dir', str(out_dir),
+        '--batchfile', batchfile,
         '--cpus', str(cpus),
         '--min_perc_aa', str(min_perc_aa)
     ]
     if keep_intermediates == 1:
         gtdbtk_cmd += ['--keep_intermediates']
+    return gtdbtk_cmd + extra_args
 
-    # refdata mounted mash db.  Must be generated during docker image registration init as /data is read-only at app runtime
-    mash_db_dir = os.path.join (os.sep, 'data' , 'r'+str(db_ver), 'mash')
-    mash_db_file = 'gtdb_ref_sketch.msh'
-    mash_db_path = os.path.join (mash_db_dir, mash_db_file)
-    if not os.path.exists (mash_db_path):
-        raise ValueError ('GTDB REF Genomes MASH DB not found.  Must generate during refdata initialization')
-    gtdbtk_cmd += ['--mash_db', mash_db_path]
-    
-    # run first pass
-    logging.info('Starting Command:\n' + ' '.join(gtdbtk_cmd))
-    gtdbtk_runner(gtdbtk_cmd)
 
-    # Not all queries may be placed into trees (ANI step may filter)
-    if not _all_ids_in_trees (temp_output, id_to_name):
-        logging.info('Not all queries placed in trees.  Running second pass with --skip_ani_screen ...')
-        temp_trees_output.mkdir(parents=True, exist_ok=True)
+# _identify_cmd()
+#
+def _identify_cmd(out_dir, batchfile, cpus):
+    return [
+        'gtdbtk',
+        'identify',
+        '--out_dir', str(out_dir),
+        '--batchfile', batchfile,
+        '--cpus', str(cpus)
+    ]
 
-        gtdbtk_cmd = [
-            'gtdbtk',
-            'classify_wf',
-            '--out_dir', str(temp_trees_output),
-            '--batchfile', tf.name,
-            '--cpus', str(cpus),
-            '--min_perc_aa', str(min_perc_aa),
-            '--skip_ani_screen',
-            '--no_mash'
-        ]
-        if keep_intermediates == 1:
-            gtdbtk_cmd += ['--keep_intermediates']
-        # run first pass
-        logging.info('Starting Command:\n' + ' '.join(gtdbtk_cmd))
-        gtdbtk_runner(gtdbtk_cmd)
-        
-    return _process_output_files(temp_output, temp_trees_output, output_dir, id_to_name)
+
+# _align_cmd()
+#
+def _align_cmd(identify_dir, out_dir, cpus, min_perc_aa):
+    return [
+        'gtdbtk',
+        'align',
+        '--identify_dir', str(identify_dir),
+        '--out_dir', str(out_dir),
+        '--cpus', str(cpus),
+        '--min_perc_aa', str(min_perc_aa)
+    ]
 
 
-# _all_ids_in_trees ()
+# _classify_cmd()
 #
-def _all_ids_in_trees (temp_output, id_to_name):
-    all_ids_found = True
+def _classify_cmd(align_dir, out_dir, batchfile, cpus, extra_args):
+    return [
+        'gtdbtk',
+        'classify',
+        '--batchfile', batchfile,
+        '--align_dir', str(align_dir),
+        '--out_dir', str(out_dir),
+        '--cpus', str(cpus)
+    ] + extra_args
+
 
+# _remove_intermediates()
+#
+def _remove_intermediates(out_dir):
+    # classify_wf removes the intermediate results unless run with --keep_intermediates.  The
+    # separate identify, align and classify commands leave them, so remove them the same way
+    for stage in ('identify', 'align', 'classify'):
+        rmtree(out_dir / stage / 'intermediate_results', ignore_errors=True)
+
+
+# _get_checkpoint_dir()
+#
+def _get_checkpoint_dir(temp_dir, id_to_path, run_ids, db_ver, min_perc_aa):
+    # keyed on the sequence contents rather than the paths so that a re-run of the same job,
+    # which downloads the sequences again, finds the checkpoints from the earlier run
+    h = hashlib.sha256()
+    h.update('\t'.join([os.environ.get('GTDBTK_VERSION', ''),
+                        str(db_ver),
+                        str(float(min_perc_aa))]).encode('utf-8'))
+    for id_ in run_ids:
+        h.update(('\t' + id_ + '\t' + get_file_sha256(id_to_path[id_])).encode('utf-8'))
+    return temp_dir / 'checkpoints' / h.hexdigest()
+
+
+# _run_checkpointed_stage()
+#
+def _run_checkpointed_stage(gtdbtk_runner, checkpoint_dir, stage, gtdbtk_cmd):
+    # each stage writes to checkpoint_dir/<stage>.  Completed stages are recorded in the
+    # manifest, and are skipped when the job is re-run after being interrupted
+    manifest_path = checkpoint_dir / CHECKPOINT_MANIFEST
+    completed = []
+    if manifest_path.exists():
+        with open(manifest_path) as m:
+            completed = json.load(m)['completed_stages']
+    if stage in completed:
+        logging.info(f'GTDB-tk {stage} stage completed by an earlier run, skipping')
+        return
+    # remove any partial output from an interrupted run of the stage
+    rmtree(checkpoint_dir / stage, ignore_errors=True)
+    (checkpoint_dir / stage).mkdir()
+    _run_command(gtdbtk_runner, gtdbtk_cmd)
+    completed.append(stage)
+    with tempfile.NamedTemporaryFile(
+            mode='w', dir=checkpoint_dir, suffix='.tmp', delete=False) as tf:
+        json.dump({'completed_stages': completed}, tf)
+    os.replace(tf.name, manifest_path)
+
+
+# _get_num_shards()
+#
+def _get_num_shards(num_seqs, cpus, cpus_per_shard):
+    if cpus_per_shard <= 0:
+        return 1
+    max_shards_by_cpus = int(cpus) // int(cpus_per_shard)
+    max_shards_by_seqs = num_seqs // MIN_GENOMES_PER_SHARD
+    return max(1, min(max_shards_by_cpus, max_shards_by_seqs))
+
+
+# _run_sharded_classify_wf()
+#
+def _run_sharded_classify_wf(gtdbtk_runner,
+                             temp_dir,
+                             temp_links,
+                             ids,
+                             temp_output,
+                             shards,
+                             cpus_per_shard,
+                             min_perc_aa,
+                             keep_intermediates,
+                             extra_args):
+    # contiguous chunks so the merged tables keep the id order of a single run.
+    # each shard is its own classify_wf subprocess, so threads are enough to schedule them
+    chunk_size = -(-len(ids) // shards)
+    shard_outputs = []
+    shard_cmds = []
+    for shard_i in range(shards):
+        shard_ids = ids[shard_i * chunk_size:(shard_i + 1) * chunk_size]
+        if not shard_ids:
+            break
+        shard_output = temp_output / 'shards' / f'shard{shard_i}'
+        shard_output.mkdir(parents=True, exist_ok=True)
+        shard_batchfile = _write_batchfile(temp_dir, temp_links, shard_ids)
+        shard_outputs.append(shard_output)
+        shard_cmds.append(_classify_wf_cmd(shard_output, shard_batchfile, cpus_per_shard,
+                                           min_perc_aa, keep_intermediates, extra_args))
+
+    logging.info(f'Running classify_wf over {len(ids)} queries in {len(shard_cmds)} shards')
+    with ThreadPoolExecutor(max_workers=len(shard_cmds)) as executor:
+        # list() to re-raise any shard failure
+        list(executor.map(lambda cmd: _run_command(gtdbtk_runner, cmd), shard_cmds))
+
+    _merge_shard_outputs(shard_outputs, temp_output)
+
+
+# _merge_shard_outputs()
+#
+def _merge_shard_outputs(shard_outputs, temp_output):
+    for file_, folder in SHARDED_TABLE_FILES.items():
+        _merge_tables([shard_output / folder / file_ for shard_output in shard_outputs],
+                      temp_output / folder / file_)
+
+    # trees cannot be merged, as each shard places its queries into its own copy of the
+    # reference tree.  Keep the first one found under the standard name and the rest under
+    # a per-shard name.
+    merged_classify = temp_output / 'classify'
+    merged_classify.mkdir(parents=True, exist_ok=True)
+    for shard_i, shard_output in enumerate(shard_outputs):
+        for tree in discover_trees(shard_output / 'classify'):
+            path = merged_classify / tree.name
+            if path.is_file():
+                path = merged_classify / get_tagged_tree_file_name(tree.name, f'shard{shard_i}')
+            copyfile(tree.path, path)
+
+
+# _merge_tables()
+#
+def _merge_tables(src_paths, dst_path, keep_ids=None):
+    # tables are concatenated under a single header.  If keep_ids is provided, only rows for
+    # those ids are kept.
+    header = None
+    out_buf = []
+    for src_path in src_paths:
+        if not src_path.is_file():
+            continue
+        with open (src_path, 'r') as src_h:
+            for line_i, info_line in enumerate(src_h):
+                info_line = info_line.rstrip('\n')
+                if line_i == 0:
+                    if header is None:
+                        header = info_line
+                        if keep_ids is None or not _QUERY_ID_RE.match(info_line.split("\t")[0]):
+                            out_buf.append(info_line)
+                            continue
+                    elif info_line == header:
+                        continue
+                if keep_ids is not None and info_line.split("\t")[0] not in keep_ids:
+                    continue
+                out_buf.append(info_line)
+    if header is None:
+        return
+    dst_path.parent.mkdir(parents=True, exist_ok=True)
+    with open (dst_path, 'w') as merged_h:
+        merged_h.write("\n".join(out_buf)+"\n")
+
+
+# _get_ids_not_in_trees ()
+#
+def _get_ids_not_in_trees (temp_output, id_to_name):
     ids_found = dict()
     for file_ in ['gtdbtk.ar53.summary.tsv', 'gtdbtk.bac120.summary.tsv']:
         summary_path = temp_output / 'classify' / file_
@@ -150,17 +742,18 @@ def _all_ids_in_trees (temp_output, id_to_name):
                     if pplacer_taxonomy != 'N/A':
                         ids_found[user_genome] = True
 
-    for qid in list(id_to_name.keys()):
-        if qid not in ids_found:
-            all_ids_found = False
-            break
-
-    return all_ids_found
+    return [qid for qid in id_to_name.keys() if qid not in ids_found]
 
 
 # _process_output_files()
 #
-def _process_output_files(temp_output, temp_trees_output, out_dir, id_to_name):
+def _process_output_files(temp_output,
+                          temp_trees_output,
+                          out_dir,
+                          id_to_name,
+                          cached_rows=None,
+                          runtime_output_mode='copy',
+                          runtime_output_report_files_only=False):
 
     classification = dict()
     summary_tables = dict()
@@ -175,11 +768,6 @@ def _process_output_files(temp_output, temp_trees_output, out_dir, id_to_name):
         path = out_dir / file_
         copyfile(tmppath, path)        
     """
-    sub_out_dir = Path(out_dir / 'runtime_output')
-    if os.path.isdir(sub_out_dir):  # only occurs during unit tests
-        rmtree(sub_out_dir)
-    copytree(temp_output, sub_out_dir, symlinks=True)
-
     # save id to name mapping as a file
     id_map_buf = []
     for id_ in sorted(id_to_name.keys()):
@@ -187,12 +775,12 @@ def _process_output_files(temp_output, temp_trees_output, out_dir, id_to_name):
     id_map_path = os.path.join(out_dir, 'id_to_name.map')
     with open (id_map_path, 'w') as file_h:
         file_h.write("\n".join(id_map_buf)+"\n")
+    if cached_rows:
+        with open (out_dir / CACHED_ID_MAP_FILE, 'w') as file_h:
+            for id_ in sorted(cached_rows.keys()):
+                file_h.write("\t".join([id_, id_to_name[id_]])+"\n")
     
     # make json files for html tables
-    tree_files = ['gtdbtk.ar53.classify.tree',
-                  'gtdbtk.bac120.classify.tree']
-    bb_tree_file = ['gtdbtk.backbone.bac120.classify.tree']
-
     base_files = ['gtdbtk.ar53.summary.tsv',
                   'gtdbtk.bac120.summary.tsv',
                   'gtdbtk.ar53.markers_summary.tsv',
@@ -203,27 +791,24 @@ def _process_output_files(temp_output, temp_trees_output, out_dir, id_to_name):
                    'gtdbtk.bac120.summary.tsv': 'classify',
                    'gtdbtk.ar53.markers_summary.tsv': 'identify',
                    'gtdbtk.bac120.markers_summary.tsv': 'identify',
-                   'gtdbtk.bac120.tree.mapping.tsv': 'classify',
-                   'gtdbtk.ar53.classify.tree': 'classify',
-                   'gtdbtk.bac120.classify.tree': 'classify',
-                   'gtdbtk.backbone.bac120.classify.tree': 'classify'
+                   'gtdbtk.bac120.tree.mapping.tsv': 'classify'
                   }
 
-    # copy tree files to output
-    extra_bac_tree_files = ['gtdbtk.backbone.bac120.classify.tree']
-    for i in range(10000):
-        subtree_file = 'gtdbtk.bac120.classify.tree.'+str(i)+'.tree'
-        extra_bac_tree_files.append(subtree_file)
-        file_folder[subtree_file] = 'classify'
-
-    for file_ in tree_files + bb_tree_file + extra_bac_tree_files:
-        treepath = temp_trees_output / file_folder[file_] / file_
-        tmppath = temp_output / file_folder[file_] / file_
-        path = out_dir / file_
-        if treepath.is_file():
-            copyfile(treepath, path)
-        elif tmppath.is_file():
-            copyfile(tmppath, path)
+    # copy tree files to output.  The runtime output is moved last, so link rather than
+    # move the trees
+    tree_mode = 'copy' if runtime_output_mode == 'copy' else 'hardlink'
+    first_pass_trees = discover_trees(temp_output / 'classify')
+    first_pass_tree_files = set(tree.name for tree in first_pass_trees)
+    for tree in first_pass_trees:
+        _place_file(tree.path, out_dir / tree.name, tree_mode)
+    for tree in discover_trees(temp_trees_output / 'classify'):
+        # second pass only has the queries missing from the first pass trees
+        if tree.name in first_pass_tree_files:
+            _place_file(tree.path,
+                        out_dir / get_tagged_tree_file_name(tree.name, SKIP_ANI_SOURCE),
+                        tree_mode)
+        else:
+            _place_file(tree.path, out_dir / tree.name, tree_mode)
 
     # merge summary tsv files            
     for file_ in base_files:
@@ -246,14 +831,27 @@ def _process_output_files(temp_output, temp_trees_output, out_dir, id_to_name):
         tree_buf = dict()
         if treepath.is_file():
             found_file = True
-            id_order = []
             with open (treepath, 'r') as treepath_h:
                 for info_line in treepath_h:
                     row = info_line.rstrip().split("\t")
                     tree_buf[row[0]] = row
-                    id_order.append(row[0])
+                    if row[0] not in tmp_buf:
+                        id_order.append(row[0])
                     num_cols = len(row)
 
+        # rows for queries found in the classification cache
+        for qid, entry in (cached_rows or dict()).items():
+            if file_ not in entry:
+                continue
+            (header, row) = entry[file_]
+            found_file = True
+            if not id_order:
+                tmp_buf[header[0]] = header
+                id_order.append(header[0])
+            tmp_buf[qid] = [qid] + row[1:]
+            id_order.append(qid)
+            num_cols = len(header)
+
         if not found_file:
             continue
         out_buf = []
@@ -273,6 +871,12 @@ def _process_output_files(temp_output, temp_trees_output, out_dir, id_to_name):
         with open (path, 'w') as summary_h:
             summary_h.write("\n".join(out_buf)+"\n")
 
+    # hand over all created output, after everything else has been read from temp_output
+    _place_runtime_output(temp_output,
+                          out_dir / 'runtime_output',
+                          runtime_output_mode,
+                          runtime_output_report_files_only)
+
     # load results
     for file_ in base_files:
                   # skip filtered for now, unused
@@ -284,41 +888,155 @@ def _process_output_files(temp_output, temp_trees_output, out_dir, id_to_name):
         else:
             if not file_.endswith('summary.tsv'):
                 continue
-            summary_df = pd.read_csv(path, sep='\t', encoding='utf-8')
             outfile = str(path) + '.json'
-            summary_json = '{"data": ' + summary_df.to_json(orient='records') + '}'
-            sj = json.loads(summary_json)
-            for item in sj['data']:
 
+            # return rest of summary table data
+            summary_tables[file_] = _summary_tsv_to_json(path, outfile, id_to_name,
+                                                         classification)
+
+    return (classification, summary_tables)
+
+
+# _place_runtime_output()
+#
+def _place_runtime_output(temp_output, sub_out_dir, mode, report_files_only):
+    if mode not in RUNTIME_OUTPUT_MODES:
+        raise ValueError(f'runtime_output_mode must be one of {RUNTIME_OUTPUT_MODES}')
+    if os.path.isdir(sub_out_dir):  # only occurs during unit tests
+        rmtree(sub_out_dir)
+    if mode == 'copy' and not report_files_only:
+        copytree(temp_output, sub_out_dir, symlinks=True)
+        return
+    if mode == 'move' and not report_files_only:
+        shutil.move(str(temp_output), str(sub_out_dir))
+        return
+    for dirpath, dirnames, filenames in os.walk(temp_output):
+        rel_dir = Path(dirpath).relative_to(temp_output)
+        if report_files_only:
+            dirnames[:] = [d for d in dirnames if d not in RUNTIME_OUTPUT_SKIPPED_DIRS]
+        (sub_out_dir / rel_dir).mkdir(parents=True, exist_ok=True)
+        # as copytree(symlinks=True), links are recreated rather than followed
+        for dir_ in [d for d in dirnames if os.path.islink(os.path.join(dirpath, d))]:
+            os.symlink(os.readlink(os.path.join(dirpath, dir_)), sub_out_dir / rel_dir / dir_)
+        for file_ in filenames:
+            if report_files_only and not RUNTIME_OUTPUT_REPORT_FILE_RE.search(file_):
+                continue
+            src = Path(dirpath) / file_
+            if src.is_symlink():
+                os.symlink(os.readlink(src), sub_out_dir / rel_dir / file_)
+            else:
+                _place_file(src, sub_out_dir / rel_dir / file_, mode)
+
+
+# _place_file()
+#
+def _place_file(src, dst, mode):
+    if mode == 'move':
+        shutil.move(str(src), str(dst))
+        return
+    if mode == 'hardlink':
+        if os.path.lexists(dst):
+            os.unlink(dst)
+        try:
+            os.link(src, dst)
+            return
+        except OSError as e:
+            # different filesystems, or links not supported.  Fall back to a copy
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+                raise
+    copyfile(src, dst)
+
+
+# _summary_tsv_to_json()
+#
+def _summary_tsv_to_json(path, outfile, id_to_name, classification):
+    # Converts the table row by row, writing each record as it goes, rather than round
+    # tripping the whole table through pandas and json.  The records match what
+    # pd.read_csv(...).to_json(orient='records') produced, as the report depends on it.
+    column_types = _get_tsv_column_types(path)
+    data = []
+    with open(path, 'r', encoding='utf-8') as tsv_h, open(outfile, 'w') as out:
+        header = tsv_h.readline().rstrip('\r\n').split('\t')
+        # Note: field 'Name' was changed to 'name'
+        id_key = None
+        if 'name' in header:
+            id_key = 'name'
+        elif 'user_genome' in header:
+            id_key = 'user_genome'
+        out.write('{"data": [')
+        for line_i, info_line in enumerate(tsv_h):
+            fields = info_line.rstrip('\r\n').split('\t')
+            item = dict()
+            for col_i, key in enumerate(header):
+                val = fields[col_i] if col_i < len(fields) else ''
+                val = _convert_tsv_value(val, column_types[col_i])
                 # no blank fields.  messes up datatables in index.html
-                for key in item.keys():
-                    #print ("RESULTS: k: '"+key+"' val: '"+str(item[key])+"'")  # DEBUG
-                    if not item.get(key):
-                        item[key] = '-'  # note: this resets data in sj
-
-                # reset id to assembly name
-                # Note: field 'Name' was changed to 'name'
-                #key = 'Name' if 'Name' in item else 'user_genome'
-                if 'name' in item:
-                    key = 'name'
-                elif 'user_genome' in item:
-                    key = 'user_genome'
-                else:
-                    continue
-                this_id = item[key]
+                item[key] = val if val else '-'
+
+            # reset id to assembly name
+            if id_key:
+                this_id = item[id_key]
                 if this_id not in id_to_name:
-                    raise ValueError ("missing "+this_id+" in id_to_name dict")
-                item[key] = id_to_name[this_id]  # note: this resets data in sj
+                    raise ValueError ("missing "+str(this_id)+" in id_to_name dict")
+                item[id_key] = id_to_name[this_id]
 
                 # store classification by assembly name
                 if 'classification' in item:
                     classification[id_to_name[this_id]] = item['classification']
-                
-            # rewrite with updated vals
-            with open(outfile, 'w') as out:
-                out.write(json.dumps(sj))
 
-            # return rest of summary table data
-            summary_tables[file_] = sj
+            out.write((', ' if line_i else '') + json.dumps(item))
+            data.append(item)
+        out.write(']}')
+    return {'data': data}
 
-    return (classification, summary_tables)
+
+# _get_tsv_column_types()
+#
+def _get_tsv_column_types(path):
+    # infer the column types as pandas does: int if all the values are ints and none are
+    # missing, float if all are numbers, bool if all are booleans, otherwise str
+    with open(path, 'r', encoding='utf-8') as tsv_h:
+        num_cols = len(tsv_h.readline().rstrip('\r\n').split('\t'))
+        is_int = [True] * num_cols
+        is_float = [True] * num_cols
+        is_bool = [True] * num_cols
+        has_na = [False] * num_cols
+        for info_line in tsv_h:
+            fields = info_line.rstrip('\r\n').split('\t')
+            for col_i in range(num_cols):
+                val = fields[col_i] if col_i < len(fields) else ''
+                if val in _TSV_NA_VALUES:
+                    has_na[col_i] = True
+                    continue
+                if is_float[col_i] and not _FLOAT_RE.match(val):
+                    is_int[col_i] = is_float[col_i] = False
+                elif is_int[col_i] and not _INT_RE.match(val):
+                    is_int[col_i] = False
+                if is_bool[col_i] and val not in _TSV_BOOL_VALUES:
+                    is_bool[col_i] = False
+    column_types = []
+    for col_i in range(num_cols):
+        if is_int[col_i] and not has_na[col_i]:
+            column_types.append(int)
+        elif is_float[col_i]:
+            column_types.append(float)
+        elif is_bool[col_i]:
+            column_types.append(bool)
+        else:
+            column_types.append(str)
+    return column_types
+
+
+# _convert_tsv_value()
+#
+def _convert_tsv_value(val, column_type):
+    if val in _TSV_NA_VALUES:
+        return None
+    if column_type is int:
+        return int(val)
+    if column_type is float:
+        # to_json writes 10 decimal places
+        return round(float(val), 10)
+    if column_type is bool:
+        return _TSV_BOOL_VALUES[val]
+    return val
@@ -3,6 +3,10 @@ Container for a set of KBase clients for KB-SDK modules. Given a url for the SDK
 and a token, initializes the client set.
 '''
 
+import threading
+
+from typing import Dict, Tuple
+
 from installed_clients.AssemblyUtilClient import AssemblyUtil
 from installed_clients.DataFileUtilClient import DataFileUtil
 from installed_clients.KBaseReportClient import KBaseReport
@@ -11,6 +15,11 @@ from installed_clients.WorkspaceClient import Workspace
 from installed_clients.SetAPIClient import SetAPI
 from installed_clients.AbstractHandleClient import AbstractHandle
 
+from kb_gtdbtk.core.object_cache import CachingDataFileUtil, CachingWorkspace, ObjectCache
+from kb_gtdbtk.core.object_info import ObjectInfoCache
+from kb_gtdbtk.core.object_names import WorkspaceNameIndex
+from kb_gtdbtk.core.shock_handles import ShockHandleOwner
+
 # DEV NOTES: This is not tested in travis and must be tested manually.
 
 
@@ -19,22 +28,36 @@ class KBClients:
     A set of clients for KB-SDK modules.
     '''
 
-    def __init__(self, callback_url: str, workspace_url: str, handle_srv_url: str, user_token: str):
+    def __init__(self, callback_url: str, workspace_url: str, handle_srv_url: str, user_token: str,
+                 object_cache_max_bytes: int = 256 * 1024 * 1024,
+                 handle_threads: int = 1,
+                 handle_retries: int = 0):
         '''
         Create the client set.
 
         :param callback_url: The url of the callback server.
         :param workspace_url: The url of the KBase workspace server.
         :param user_token: The user's token.
+        :param object_cache_max_bytes: The maximum total size of the workspace objects kept
+            for objects that are fetched more than once.
+        :param handle_threads: The maximum number of Shock nodes to take ownership of at once.
+        :param handle_retries: The number of times to retry taking ownership of a Shock node.
         '''
         # TODO check inputs aren't None or empty string
-        self._dfu = DataFileUtil(callback_url, token=user_token)
+        # the client set is created per job, so the caches last for the job
+        object_cache = ObjectCache(object_cache_max_bytes)
+        self._dfu = CachingDataFileUtil(DataFileUtil(callback_url, token=user_token), object_cache)
         self._au = AssemblyUtil(callback_url, token=user_token)
         self._mgu = MetagenomeUtils(callback_url, token=user_token)
         self._report = KBaseReport(callback_url, token=user_token)
-        self._ws = Workspace(workspace_url, token=user_token)
+        self._ws = CachingWorkspace(Workspace(workspace_url, token=user_token), object_cache)
         self._setAPI = SetAPI(callback_url, token=user_token)
         self._hs = AbstractHandle(handle_srv_url, token=user_token)
+        self._object_info = ObjectInfoCache(self._ws)
+        self._handle_owner = ShockHandleOwner(
+            self._hs, self._dfu, handle_threads, handle_retries)
+        self._name_indexes: Dict[Tuple[int, str], WorkspaceNameIndex] = {}
+        self._name_indexes_lock = threading.Lock()
 
     # Using methods rather than instance variables since create_autospec doesn't play nicely
     # with instance variables.
@@ -87,3 +110,29 @@ class KBClients:
         :returns: the client.
         '''
         return self._hs
+
+    def object_info(self):
+        '''
+        Get the batched, memoized workspace object info lookups for the job.
+        :returns: the object info cache.
+        '''
+        return self._object_info
+
+    def handle_owner(self):
+        '''
+        Get the batched, memoized Shock node ownership changes for the job.
+        :returns: the handle owner.
+        '''
+        return self._handle_owner
+
+    def name_index(self, wsid: int, prefix: str = ''):
+        '''
+        Get the index of the object names in a workspace for the job.
+        :param wsid: the ID of the workspace.
+        :param prefix: the prefix of the object names to index.
+        :returns: the name index.
+        '''
+        with self._name_indexes_lock:
+            if (wsid, prefix) not in self._name_indexes:
+                self._name_indexes[(wsid, prefix)] = WorkspaceNameIndex(self._ws, wsid, prefix)
+            return self._name_indexes[(wsid, prefix)]
@@ -5,10 +5,14 @@ Create a KBase Report for a GTDB-tk run.
 import uuid
 
 from shutil import copyfile
-from typing import Dict, List, Callable
+from typing import Dict, List, Callable, Optional
 from pathlib import Path
 
 from kb_gtdbtk.core.kb_client_set import KBClients
+from kb_gtdbtk.core.report_archive import build_report_archive
+
+
+ARCHIVE_NAME = 'GTDB-Tk_classify_wf.zip'
 
 
 def generate_report(
@@ -17,7 +21,9 @@ def generate_report(
         workspace_id: int,
         objects_created: List[Dict[str,str]],
         file_links: List[Dict[str,str]],
-        uuid_gen: Callable[[], uuid.UUID] = uuid.uuid4):
+        uuid_gen: Callable[[], uuid.UUID] = uuid.uuid4,
+        archive_include: Optional[List[str]] = None,
+        archive_exclude: Optional[List[str]] = None):
     '''
     Create a KBase report for a GTDB-tk run.
 
@@ -27,6 +33,9 @@ def generate_report(
     :param workspace_id: The ID of the workspace in which to save the report.
     :param objects_created: A list of objects_created: ref and descriptiom.
     :param file_links: A list of files_links: shock_id, name, and descriptiom.
+    :param archive_include: glob patterns of the files in gtdbtk_output_dir to put in the
+        output archive, relative to gtdbtk_output_dir. Defaults to all files.
+    :param archive_exclude: glob patterns of files or directories to leave out of the archive.
     '''
 
     # don't document uuid_gen, meant for testing only
@@ -34,13 +43,17 @@ def generate_report(
     report_name = 'GTDBTk_report_' + str(uuid_gen())
     copyfile(Path(__file__).parent / 'index.html', gtdbtk_output_dir / 'index.html')
 
-    upload_ret = clients.dfu().file_to_shock({'file_path': str(gtdbtk_output_dir),
-                                              'make_handle': 0,
-                                              'pack': 'zip'})
+    archive_path = gtdbtk_output_dir.parent / ARCHIVE_NAME
+    build_report_archive(gtdbtk_output_dir,
+                         archive_path,
+                         archive_include,
+                         archive_exclude)
+    upload_ret = clients.dfu().file_to_shock({'file_path': str(archive_path),
+                                              'make_handle': 0})
     
     output_file_archive = {
         'shock_id': upload_ret['shock_id'],
-        'name': 'GTDB-Tk_classify_wf.zip',
+        'name': ARCHIVE_NAME,
         'description': 'GTDB-Tk Classify WF output'
         }
     file_links.append (output_file_archive)
@@ -0,0 +1,188 @@
+'''
+A read only, memory mapped table of string rows keyed by a string, with a hash index for
+constant time lookups.
+
+The file is built once and then opened by any number of processes, which share the mapped
+pages via the OS page cache rather than each reading the table into memory.
+
+File layout, all integers little endian:
+
+    magic (8 bytes)
+    header length (uint64)
+    header (JSON): columns, number of rows, number of hash slots
+    hash slots (uint32 * slots): row index + 1, or 0 for an empty slot
+    the key column followed by each value column, each as
+        string end offsets (uint64 * rows) then the UTF-8 encoded strings
+'''
+
+import json
+import mmap
+import os
+import struct
+import tempfile
+
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+
+_MAGIC = b'KBMTAB01'
+_UINT64 = struct.Struct('<Q')
+
+_FNV_OFFSET = 0xcbf29ce484222325
+_FNV_PRIME = 0x100000001b3
+_MASK64 = 0xffffffffffffffff
+
+
+def _hash(key: bytes) -> int:
+    # FNV-1a, stable across processes unlike hash()
+    h = _FNV_OFFSET
+    for b in key:
+        h = ((h ^ b) * _FNV_PRIME) & _MASK64
+    return h
+
+
+def write_mmap_table(
+        path: Path,
+        columns: Sequence[str],
+        rows: Iterable[Tuple[str, Sequence[str]]]) -> None:
+    '''
+    Write a table file. The file is written to a temporary file and renamed into place, so
+    readers never see a partial table.
+
+    :param path: the path of the table file.
+    :param columns: the names of the value columns.
+    :param rows: the rows as (key, values) tuples, with a value for each column. If a key is
+        repeated, the first row is kept.
+    '''
+    keys: List[bytes] = []
+    values: List[List[bytes]] = [[] for _ in columns]
+    seen = set()
+    for key, row in rows:
+        if len(row) != len(columns):
+            raise ValueError(f'row for key {key} has {len(row)} values, expected {len(columns)}')
+        key_b = key.encode('utf-8')
+        if key_b in seen:
+            continue
+        seen.add(key_b)
+        keys.append(key_b)
+        for col_i, val in enumerate(row):
+            values[col_i].append(val.encode('utf-8'))
+
+    num_slots = 1
+    while num_slots < 2 * max(len(keys), 1):
+        num_slots *= 2
+    slots = [0] * num_slots
+    for row_i, key_b in enumerate(keys):
+        slot = _hash(key_b) & (num_slots - 1)
+        while slots[slot]:
+            slot = (slot + 1) & (num_slots - 1)
+        slots[slot] = row_i + 1
+
+    header = json.dumps({'columns': list(columns),
+                         'rows': len(keys),
+                         'slots': num_slots}).encode('utf-8')
+    path = Path(path)
+    with tempfile.NamedTemporaryFile(
+            mode='wb', dir=path.parent, suffix='.tmp', delete=False) as tf:
+        tf.write(_MAGIC)
+        tf.write(_UINT64.pack(len(header)))
+        tf.write(header)
+        tf.write(struct.pack(f'<{num_slots}I', *slots))
+        for column in [keys] + values:
+            end = 0
+            ends = []
+            for val_b in column:
+                end += len(val_b)
+                ends.append(end)
+            tf.write(struct.pack(f'<{len(ends)}Q', *ends))
+            for val_b in column:
+                tf.write(val_b)
+    # the table is shared by jobs running as other users
+    os.chmod(tf.name, 0o644)
+    os.replace(tf.name, path)
+
+
+class MmapTable(Mapping):
+    '''
+    A reader for a table file written by write_mmap_table. A mapping from the key to a tuple of
+    the row values.
+    '''
+
+    def __init__(self, path: Path):
+        '''
+        Open the table.
+
+        :param path: the path to the table file.
+        '''
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(_MAGIC)] != _MAGIC:
+            raise ValueError(f'{path} is not a table file')
+        pos = len(_MAGIC)
+        (header_len,) = _UINT64.unpack_from(self._mm, pos)
+        pos += _UINT64.size
+        header = json.loads(self._mm[pos:pos + header_len].decode('utf-8'))
+        pos += header_len
+        self.columns: List[str] = header['columns']
+        ''' The names of the value columns. '''
+        self._rows = header['rows']
+        self._slot_mask = header['slots'] - 1
+        view = memoryview(self._mm)
+        self._slots = view[pos:pos + 4 * header['slots']].cast('I')
+        pos += 4 * header['slots']
+        # (end offsets, start of the strings) for the key column then each value column
+        self._columns = []
+        for _ in range(len(self.columns) + 1):
+            ends = view[pos:pos + 8 * self._rows].cast('Q')
+            pos += 8 * self._rows
+            self._columns.append((ends, pos))
+            pos += ends[-1] if self._rows else 0
+
+    def _get_str(self, col_i, row_i):
+        (ends, start) = self._columns[col_i]
+        begin = ends[row_i - 1] if row_i else 0
+        return self._mm[start + begin:start + ends[row_i]].decode('utf-8')
+
+    def _find_row(self, key: str) -> Optional[int]:
+        key_b = key.encode('utf-8')
+        (ends, start) = self._columns[0]
+        slot = _hash(key_b) & self._slot_mask
+        while True:
+            row = self._slots[slot]
+            if not row:
+                return None
+            row_i = row - 1
+            begin = ends[row_i - 1] if row_i else 0
+            if self._mm[start + begin:start + ends[row_i]] == key_b:
+                return row_i
+            slot = (slot + 1) & self._slot_mask
+
+    def get_value(self, key: str, column: str) -> Optional[str]:
+        '''
+        Get a single value from a row.
+
+        :param key: the key for the row.
+        :param column: the name of the column.
+        :returns: the value, or None if the key is not in the table.
+        '''
+        row_i = self._find_row(key)
+        if row_i is None:
+            return None
+        return self._get_str(self.columns.index(column) + 1, row_i)
+
+    def __getitem__(self, key: str) -> Tuple[str, ...]:
+        row_i = self._find_row(key)
+        if row_i is None:
+            raise KeyError(key)
+        return tuple(self._get_str(col_i + 1, row_i) for col_i in range(len(self.columns)))
+
+    def __contains__(self, key) -> bool:
+        return isinstance(key, str) and self._find_row(key) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        for row_i in range(self._rows):
+            yield self._get_str(0, row_i)
+
+    def __len__(self) -> int:
+        return self._rows
@@ -0,0 +1,283 @@
+'''
+A compact Newick tree for the tree queries that don't need a full ete3 tree: leaf names,
+ancestors and writing the ladderized tree.
+
+The tree is stored as arrays indexed by node in preorder - parent index, branch length and
+offsets into a single string of node names - rather than as one Python object per node, and
+mirrors what ete3 does for trees read with
+ete3.Tree(path, quoted_node_names=True, format=1). The one difference is that comments in
+square brackets are dropped, where ete3 keeps them as part of the node name; GTDB-tk's trees
+don't have comments.
+'''
+
+import re
+
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+
+# ete3's default branch length and support for nodes without one
+_DEFAULT_DIST = 1.0
+_DEFAULT_SUPPORT = 1.0
+
+_TOKEN_RE = re.compile(r"'(?:[^']|'')*'|\[[^\]]*\]|:[^()\[\],;:]*|[(),;]|[^()\[\]',;:]+")
+
+# ete3 replaces these characters in unquoted names with '_'
+_ILLEGAL_NAME_CHARS_RE = re.compile(r'[:;(),\[\]\t\n\r=]')
+
+
+class NewickTree:
+    '''
+    A rooted tree read from Newick. Node 0 is the root and nodes are numbered in preorder.
+    '''
+
+    def __init__(self, parents: Sequence[int], names: Sequence[str], dists: Sequence[float]):
+        '''
+        Create a tree from per node arrays. Most code should use parse_newick or
+        read_newick instead.
+
+        :param parents: the index of each node's parent, with -1 for the root. The nodes must
+            be in preorder.
+        :param names: the name of each node, '' for an unnamed node.
+        :param dists: the branch length above each node.
+        '''
+        self._set(parents, names, dists)
+
+    def _set(self, parents, names, dists):
+        self.parents = np.asarray(parents, dtype=np.int32)
+        ''' The index of each node's parent, with -1 for the root. '''
+        self.dists = np.asarray(dists, dtype=np.float64)
+        ''' The branch length above each node. '''
+        name_ends = np.cumsum([len(n) for n in names], dtype=np.int64)
+        self._name_offsets = np.concatenate(([0], name_ends)).astype(np.int64)
+        self._names = ''.join(names)
+        if len(self.parents) != len(self.dists) or len(self.parents) != len(names):
+            raise ValueError('parents, names and dists must be the same length')
+        self._num_children = np.bincount(self.parents[1:], minlength=len(self.parents)) \
+            if len(self.parents) else np.zeros(0, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.parents)
+
+    def name(self, node: int) -> str:
+        '''
+        Get the name of a node.
+
+        :param node: the node index.
+        :returns: the name, '' for an unnamed node.
+        '''
+        return self._names[self._name_offsets[node]:self._name_offsets[node + 1]]
+
+    def names(self) -> List[str]:
+        '''
+        Get the names of all the nodes in preorder.
+
+        :returns: the names, '' for unnamed nodes.
+        '''
+        offsets = self._name_offsets.tolist()
+        return [self._names[offsets[i]:offsets[i + 1]] for i in range(len(self))]
+
+    def leaves(self) -> np.ndarray:
+        '''
+        Get the leaf nodes in preorder, the order ete3 returns leaves in.
+
+        :returns: the leaf node indexes.
+        '''
+        return np.flatnonzero(self._num_children == 0)
+
+    def leaf_names(self) -> List[str]:
+        '''
+        Get the leaf names in preorder, like ete3's get_leaf_names().
+
+        :returns: the leaf names.
+        '''
+        offsets = self._name_offsets.tolist()
+        return [self._names[offsets[i]:offsets[i + 1]] for i in self.leaves().tolist()]
+
+    def leaf_ancestors(self) -> List[Tuple[str, List[str]]]:
+        '''
+        Get the names of the ancestors of each leaf, like ete3's get_ancestors().
+
+        :returns: a list of (leaf name, ancestor names) tuples in preorder. The ancestor names
+            run from the leaf's parent to the root and include unnamed ancestors as ''.
+        '''
+        names = self.names()
+        parents = self.parents.tolist()
+        leaf_ancestors = []
+        for leaf in self.leaves().tolist():
+            ancestors = []
+            node = parents[leaf]
+            while node != -1:
+                ancestors.append(names[node])
+                node = parents[node]
+            leaf_ancestors.append((names[leaf], ancestors))
+        return leaf_ancestors
+
+    def ladderize(self) -> None:
+        '''
+        Sort the children of each node by their number of leaves, smallest first, keeping the
+        original order for ties, as ete3's ladderize() does. The tree is renumbered in its new
+        preorder.
+        '''
+        n = len(self)
+        if n < 3:
+            return
+        parents = self.parents.tolist()
+        sizes = (self._num_children == 0).astype(np.int64).tolist()
+        # children come after their parents in preorder
+        for node in range(n - 1, 0, -1):
+            sizes[parents[node]] += sizes[node]
+        # the children of each node, grouped by parent, ordered by size then original order
+        order = np.lexsort((np.arange(n), np.asarray(sizes), self.parents))[1:]
+        child_counts = self._num_children.tolist()
+        children = []
+        pos = 0
+        for node in range(n):
+            children.append(order[pos:pos + child_counts[node]].tolist())
+            pos += child_counts[node]
+        preorder: List[int] = []
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            preorder.append(node)
+            stack.extend(reversed(children[node]))
+        new_order = np.asarray(preorder, dtype=np.int64)
+        new_index = np.empty(n, dtype=np.int32)
+        new_index[new_order] = np.arange(n, dtype=np.int32)
+        old_parents = self.parents[new_order]
+        names = self.names()
+        self._set(np.where(old_parents >= 0, new_index[old_parents], -1),
+                  [names[i] for i in new_order.tolist()],
+                  self.dists[new_order])
+
+    def write(self) -> str:
+        '''
+        Write the tree as Newick, as ete3's write() does with its default format 0: leaf names
+        and branch lengths, and for internal nodes the support, which is always 1 for a tree
+        read with internal node names, in place of the name. The root's name and branch length
+        are not written.
+
+        :returns: the Newick string, terminated with ';'.
+        '''
+        n = len(self)
+        parents = self.parents.tolist()
+        dists = self.dists.tolist()
+        num_children = self._num_children.tolist()
+        names = self.names()
+        support = '%0.6g' % _DEFAULT_SUPPORT
+        out = []
+        open_nodes: List[int] = []
+        for node in range(n):
+            parent = parents[node]
+            while open_nodes and open_nodes[-1] != parent:
+                closed = open_nodes.pop()
+                out.append(')')
+                if closed != 0:
+                    out.append(support + ':' + ('%0.6g' % dists[closed]))
+            if parent >= 0 and node != parent + 1:
+                out.append(',')
+            if num_children[node]:
+                out.append('(')
+                open_nodes.append(node)
+            else:
+                out.append(_ILLEGAL_NAME_CHARS_RE.sub('_', names[node])
+                           + ':' + ('%0.6g' % dists[node]))
+        while open_nodes:
+            closed = open_nodes.pop()
+            out.append(')')
+            if closed != 0:
+                out.append(support + ':' + ('%0.6g' % dists[closed]))
+        out.append(';')
+        return ''.join(out)
+
+
+# parse_newick()
+#
+def parse_newick(newick: str) -> NewickTree:
+    '''
+    Parse a Newick string. Node names may be quoted, and internal nodes may be named.
+    Comments in square brackets are ignored.
+
+    :param newick: the Newick string.
+    :returns: the tree.
+    '''
+    parents: List[int] = []
+    names: List[str] = []
+    dists: List[float] = []
+    open_nodes: List[int] = []
+    current: Optional[int] = None
+    expecting_node = True
+
+    def add_node():
+        parents.append(open_nodes[-1] if open_nodes else -1)
+        names.append('')
+        dists.append(_DEFAULT_DIST)
+        return len(parents) - 1
+
+    for token in _TOKEN_RE.findall(newick):
+        first = token[0]
+        if first == '(':
+            if not expecting_node:
+                raise ValueError('Newick has an unexpected (')
+            current = add_node()
+            open_nodes.append(current)
+        elif first == ',' or first == ')':
+            if expecting_node:
+                add_node()
+            if first == ')':
+                if not open_nodes:
+                    raise ValueError('Newick has an unmatched )')
+                current = open_nodes.pop()
+                expecting_node = False
+                continue
+            if not open_nodes:
+                raise ValueError('Newick has more than one root')
+        elif first == ';':
+            break
+        elif first == '[':
+            continue
+        elif first == ':':
+            if expecting_node:
+                current = add_node()
+            # a node was just added or closed
+            assert current is not None
+            try:
+                dists[current] = float(token[1:])
+            except ValueError:
+                raise ValueError(f'Newick has an invalid branch length {token[1:]}') from None
+            expecting_node = False
+            continue
+        else:
+            if first == "'":
+                name = token[1:-1].replace("''", "'")
+            else:
+                name = token.strip()
+                if not name:
+                    continue
+            if expecting_node:
+                current = add_node()
+            assert current is not None
+            names[current] = name
+            expecting_node = False
+            continue
+        expecting_node = True
+    if open_nodes:
+        raise ValueError('Newick has an unmatched (')
+    if not parents:
+        raise ValueError('Newick has no nodes')
+    return NewickTree(parents, names, dists)
+
+
+# read_newick()
+#
+def read_newick(path: Union[str, Path]) -> NewickTree:
+    '''
+    Read a Newick file.
+
+    :param path: the path to the file.
+    :returns: the tree.
+    '''
+    with open(path, 'r') as f:
+        return parse_newick(f.read())
@@ -0,0 +1,198 @@
+'''
+A job scoped, read through cache of workspace objects, wrapped around the DataFileUtil and
+Workspace clients so that the objects a job fetches more than once, such as the input object,
+are only downloaded twice at most.
+'''
+
+import copy
+import re
+import threading
+
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+from installed_clients.DataFileUtilClient import DataFileUtil
+from installed_clients.WorkspaceClient import Workspace
+
+# a reference to a specific version of an object, or a reference path ending in one
+_VERSIONED_REF_RE = re.compile(r'(?:^|;)\s*\d+/\d+/\d+\s*$')
+
+# object specification keys for which the cache can build a key; others bypass the cache
+_CACHEABLE_SPEC_KEYS = {'ref', 'wsid', 'workspace', 'objid', 'name', 'ver', 'included'}
+
+_SIZE_I = 9
+
+# (reference, projection, method)
+CacheKey = Tuple[str, Optional[Tuple[str, ...]], str]
+
+# the methods whose results are cached.  DataFileUtil and the workspace return objects in
+# different forms, so the method is part of the key
+_DFU_GET_OBJECTS = 'DataFileUtil.get_objects'
+_WS_GET_OBJECTS2 = 'Workspace.get_objects2'
+
+
+class ObjectCache:
+    '''
+    Keeps workspace objects keyed by reference, projection and the method that fetched them.
+
+    An object is only stored the second time it is fetched, so objects that are only fetched
+    once cost nothing. Objects fetched by a reference without a version are dropped whenever
+    the job writes to the workspace, since the reference may then refer to a new version.
+    Objects are copied on the way out, so callers may modify them.
+    '''
+
+    def __init__(self, max_bytes: int):
+        '''
+        Create the cache.
+
+        :param max_bytes: the maximum total size, as reported by the workspace, of the cached
+            objects. The least recently used objects are dropped to stay under the limit.
+        '''
+        self._max_bytes = max_bytes
+        self._entries: 'OrderedDict[CacheKey, Tuple[int, dict]]' = OrderedDict()
+        self._bytes = 0
+        self._seen: Set[CacheKey] = set()
+        self._lock = threading.Lock()
+
+    def get(self, key: CacheKey) -> Optional[dict]:
+        '''
+        Get an object.
+
+        :param key: the key for the object, a (reference, projection, method) tuple.
+        :returns: a copy of the object, or None if it is not cached.
+        '''
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+        return copy.deepcopy(entry[1])
+
+    def put(self, key: CacheKey, obj: dict) -> None:
+        '''
+        Record that an object was fetched, storing a copy if it was fetched before.
+
+        :param key: the key for the object, a (reference, projection, method) tuple.
+        :param obj: the object data as returned by the workspace, including the info.
+        '''
+        size = obj['info'][_SIZE_I]
+        with self._lock:
+            if key not in self._seen:
+                self._seen.add(key)
+                return
+            if size > self._max_bytes or key in self._entries:
+                return
+        obj = copy.deepcopy(obj)
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = (size, obj)
+            self._bytes += size
+            while self._bytes > self._max_bytes:
+                (_, (old_size, _)) = self._entries.popitem(last=False)
+                self._bytes -= old_size
+
+    def invalidate_unversioned(self) -> None:
+        '''
+        Drop the objects fetched by references without a version.
+        '''
+        with self._lock:
+            for key in [k for k in self._entries if not _VERSIONED_REF_RE.search(k[0])]:
+                (size, _) = self._entries.pop(key)
+                self._bytes -= size
+            self._seen = {k for k in self._seen if _VERSIONED_REF_RE.search(k[0])}
+
+
+def _spec_key(spec: Dict, method: str) -> Optional[CacheKey]:
+    if not set(spec) <= _CACHEABLE_SPEC_KEYS:
+        return None
+    if 'ref' in spec:
+        ref = spec['ref']
+    else:
+        ws = spec.get('wsid', spec.get('workspace'))
+        obj = spec.get('objid', spec.get('name'))
+        if ws is None or obj is None:
+            return None
+        ref = f'{ws}/{obj}' + (f"/{spec['ver']}" if spec.get('ver') is not None else '')
+    included = tuple(spec['included']) if spec.get('included') is not None else None
+    return (str(ref), included, method)
+
+
+def _get_through_cache(cache, keys, fetch):
+    # keys may contain None for objects that can't be cached
+    results: List[Optional[dict]] = [cache.get(k) if k is not None else None for k in keys]
+    missing = [i for i, r in enumerate(results) if r is None]
+    if missing:
+        for i, obj in zip(missing, fetch(missing)):
+            results[i] = obj
+            if keys[i] is not None:
+                cache.put(keys[i], obj)
+    return {'data': results}
+
+
+class CachingDataFileUtil:
+    '''
+    A DataFileUtil client that fetches objects through an ObjectCache. Other methods are passed
+    to the client.
+    '''
+
+    def __init__(self, dfu: DataFileUtil, cache: ObjectCache):
+        self._dfu = dfu
+        self._cache = cache
+
+    def get_objects(self, params: Dict) -> Dict:
+        if set(params) != {'object_refs'}:
+            return self._dfu.get_objects(params)
+        refs = params['object_refs']
+        return _get_through_cache(
+            self._cache,
+            [(str(r), None, _DFU_GET_OBJECTS) for r in refs],
+            lambda missing: self._dfu.get_objects(
+                {'object_refs': [refs[i] for i in missing]})['data'])
+
+    def save_objects(self, params: Dict) -> List:
+        ret = self._dfu.save_objects(params)
+        self._cache.invalidate_unversioned()
+        return ret
+
+    def __getattr__(self, name):
+        return getattr(self._dfu, name)
+
+
+class CachingWorkspace:
+    '''
+    A Workspace client that fetches objects with get_objects2 through an ObjectCache. Other
+    methods are passed to the client.
+    '''
+
+    def __init__(self, ws: Workspace, cache: ObjectCache):
+        self._ws = ws
+        self._cache = cache
+
+    def get_objects2(self, params: Dict) -> Dict:
+        if set(params) != {'objects'}:
+            return self._ws.get_objects2(params)
+        specs = params['objects']
+        return _get_through_cache(
+            self._cache,
+            [_spec_key(s, _WS_GET_OBJECTS2) for s in specs],
+            lambda missing: self._ws.get_objects2(
+                {'objects': [specs[i] for i in missing]})['data'])
+
+    def save_objects(self, params: Dict) -> List:
+        ret = self._ws.save_objects(params)
+        self._cache.invalidate_unversioned()
+        return ret
+
+    def copy_object(self, params: Dict) -> List:
+        ret = self._ws.copy_object(params)
+        self._cache.invalidate_unversioned()
+        return ret
+
+    def __getattr__(self, name):
+        return getattr(self._ws, name)
+
+
+# a client that may or may not fetch objects through a cache
+AnyDataFileUtil = Union[DataFileUtil, CachingDataFileUtil]
+AnyWorkspace = Union[Workspace, CachingWorkspace]
@@ -0,0 +1,70 @@
+'''
+Batched, memoized workspace object info lookups.
+'''
+
+import re
+import threading
+
+from typing import Dict, List, Sequence
+
+from kb_gtdbtk.core.object_cache import AnyWorkspace
+
+# max number of objects to request from the workspace in one get_object_info3 call
+_WS_INFO_BATCH_SIZE = 1000
+
+# a reference to a specific version of an object, or a reference path ending in one, can
+# only ever refer to the same object so its info can be kept for the job
+_VERSIONED_REF_RE = re.compile(r'(?:^|;)\s*\d+/\d+/\d+\s*$')
+
+
+class ObjectInfoCache:
+    '''
+    Looks up workspace object info tuples in batches, keeping the info for references to
+    specific object versions for the lifetime of the cache, i.e. for a job.
+
+    References without a version, or by name, are looked up every time since the object they
+    refer to changes when a new version is saved.
+    '''
+
+    def __init__(self, ws: AnyWorkspace, batch_size: int = _WS_INFO_BATCH_SIZE):
+        '''
+        Create the cache.
+
+        :param ws: the workspace client.
+        :param batch_size: the maximum number of objects to request in one call.
+        '''
+        self._ws = ws
+        self._batch_size = batch_size
+        self._infos: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def get_infos(self, refs: Sequence[str]) -> List[list]:
+        '''
+        Get the object info tuples for workspace objects.
+
+        :param refs: the object references or reference paths.
+        :returns: the object info tuples in the same order as the references.
+        '''
+        with self._lock:
+            missing = list(dict.fromkeys(r for r in refs if r not in self._infos))
+        fetched: Dict[str, list] = {}
+        for chunk_start in range(0, len(missing), self._batch_size):
+            chunk = missing[chunk_start:chunk_start + self._batch_size]
+            infos = self._ws.get_object_info3({'objects': [{'ref': r} for r in chunk]})['infos']
+            fetched.update(zip(chunk, infos))
+        with self._lock:
+            for ref, info in fetched.items():
+                if _VERSIONED_REF_RE.search(ref):
+                    self._infos[ref] = info
+                # the resolved UPA is always a specific version
+                self._infos[f'{info[6]}/{info[0]}/{info[4]}'] = info
+            return [fetched[r] if r in fetched else self._infos[r] for r in refs]
+
+    def get_info(self, ref: str) -> list:
+        '''
+        Get the object info tuple for a workspace object.
+
+        :param ref: the object reference or reference path.
+        :returns: the object info tuple.
+        '''
+        return self.get_infos([ref])[0]
@@ -0,0 +1,103 @@
+'''
+An index of the names of the objects in a workspace, so the names can be checked without a
+workspace call per name.
+'''
+
+import threading
+
+from typing import Any, Dict, Iterable, List, Optional
+
+from kb_gtdbtk.core.object_cache import AnyWorkspace
+
+# max number of objects list_objects returns in one call
+_WS_LIST_LIMIT = 10000
+
+_OBJID_I = 0
+_NAME_I = 1
+
+# a workspace object info tuple, as returned by the workspace
+ObjectInfo = List[Any]
+
+
+class WorkspaceNameIndex:
+    '''
+    Knows the objects in a workspace with names starting with a prefix.
+
+    The workspace is listed in bulk on first use, and objects the job saves afterwards must be
+    added with add(), so the index is only valid for the lifetime of a job.
+    '''
+
+    def __init__(self, ws: AnyWorkspace, wsid: int, prefix: str = ''):
+        '''
+        Create the index.
+
+        :param ws: the workspace client.
+        :param wsid: the ID of the workspace.
+        :param prefix: the prefix of the object names to index.
+        '''
+        self._ws = ws
+        self._wsid = wsid
+        self._prefix = prefix
+        self._infos: Optional[Dict[str, ObjectInfo]] = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, ObjectInfo]:
+        # call with the lock held
+        if self._infos is not None:
+            return self._infos
+        infos: Dict[str, ObjectInfo] = {}
+        min_objid = 1
+        while True:
+            page = self._ws.list_objects({'ids': [self._wsid],
+                                          'minObjectID': min_objid,
+                                          'showHidden': 1,
+                                          'limit': _WS_LIST_LIMIT})
+            for info in page:
+                if info[_NAME_I].startswith(self._prefix):
+                    infos[info[_NAME_I]] = info
+            if len(page) < _WS_LIST_LIMIT:
+                break
+            min_objid = max(info[_OBJID_I] for info in page) + 1
+        self._infos = infos
+        return infos
+
+    def get_info(self, name: str) -> Optional[ObjectInfo]:
+        '''
+        Get the info for the latest version of an object.
+
+        :param name: the name of the object. Must start with the index prefix.
+        :returns: the object info tuple, or None if there is no object with the name.
+        '''
+        self._check_name(name)
+        with self._lock:
+            return self._load().get(name)
+
+    def get_free_name(self, names: Iterable[str]) -> Optional[str]:
+        '''
+        Find a name that is not yet used by an object.
+
+        :param names: the candidate names, in order of preference. Must start with the index
+            prefix.
+        :returns: the first unused name, or None if all the names are in use.
+        '''
+        with self._lock:
+            infos = self._load()
+            for name in names:
+                self._check_name(name)
+                if name not in infos:
+                    return name
+        return None
+
+    def add(self, info: ObjectInfo) -> None:
+        '''
+        Record that an object was saved.
+
+        :param info: the object info tuple for the saved object.
+        '''
+        self._check_name(info[_NAME_I])
+        with self._lock:
+            self._load()[info[_NAME_I]] = info
+
+    def _check_name(self, name: str) -> None:
+        if not name.startswith(self._prefix):
+            raise ValueError(f'Object name {name} does not start with {self._prefix}')
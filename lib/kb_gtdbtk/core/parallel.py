@@ -0,0 +1,61 @@
+'''
+Run I/O bound calls, e.g. KBase service requests, concurrently.
+'''
+
+import logging
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Sequence, TypeVar
+
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+
+def map_ordered(
+        func: Callable[[T], R],
+        items: Sequence[T],
+        max_workers: int,
+        retries: int = 0,
+        retry_delay: float = 1.0,
+        on_result: Optional[Callable[[R], None]] = None) -> List[R]:
+    '''
+    Apply a function to each item with a bounded pool of threads.
+
+    :param func: the function to apply.
+    :param items: the items to which the function will be applied.
+    :param max_workers: the maximum number of concurrent calls. 1 or less calls the function
+        on each item in turn in the calling thread.
+    :param retries: the number of times to retry a failed call for an item.
+    :param retry_delay: the delay in seconds before the first retry, doubled for each
+        subsequent retry.
+    :param on_result: a callable called with each result as soon as it is available, in the
+        thread that produced it. A failure in the callable is not retried.
+    :returns: the results, in the same order as the items.
+    :raises Exception: the exception from the first item, in item order, for which all the
+        attempts failed. The remaining calls are allowed to complete first.
+    '''
+    def call_with_retry(item):
+        delay = retry_delay
+        for attempt in range(retries + 1):
+            try:
+                return func(item)
+            except Exception as e:
+                if attempt == retries:
+                    raise
+                logging.info(f'Attempt {attempt + 1} failed, retrying in {delay}s: {e}')
+                time.sleep(delay)
+                delay *= 2
+
+    def call(item):
+        result = call_with_retry(item)
+        if on_result:
+            on_result(result)
+        return result
+
+    if max_workers <= 1 or len(items) <= 1:
+        return [call(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        futures = [executor.submit(call, item) for item in items]
+        return [f.result() for f in futures]
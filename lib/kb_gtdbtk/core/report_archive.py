@@ -0,0 +1,93 @@
+'''
+Build the zip archive of the GTDB-tk output for the report.
+
+Rather than asking DataFileUtil to zip the output directory, the archive is built locally so
+that what goes in it can be chosen and files that are already compressed are stored rather
+than compressed again.
+'''
+
+import fnmatch
+import os
+import zipfile
+
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+
+# members with these extensions are already compressed and are stored as is
+STORED_EXTENSIONS = ('.png', '.pdf', '.gz', '.zip', '.bz2', '.xz', '.msh')
+
+
+# build_report_archive()
+#
+def build_report_archive(
+        source_dir: Path,
+        archive_path: Path,
+        include: Optional[Sequence[str]] = None,
+        exclude: Optional[Sequence[str]] = None,
+        compresslevel: int = 6) -> List[str]:
+    '''
+    Zip the files in a directory.
+
+    :param source_dir: the directory to archive. Paths in the archive are relative to it.
+    :param archive_path: where to write the archive. Must not be inside source_dir.
+    :param include: glob patterns, matched against the path relative to source_dir, of the
+        files to archive. Defaults to all files.
+    :param exclude: glob patterns of files to leave out, applied after include. A pattern that
+        matches a directory leaves out the whole directory.
+    :param compresslevel: the zlib compression level.
+    :returns: the archived paths, in archive order.
+    '''
+    members = _list_members(Path(source_dir), include or ['*'], exclude or [])
+    with zipfile.ZipFile(archive_path, 'w', allowZip64=True) as zf:
+        for path, arcname in members:
+            if arcname.lower().endswith(STORED_EXTENSIONS):
+                zf.write(path, arcname, compress_type=zipfile.ZIP_STORED)
+            else:
+                zf.write(path, arcname, compress_type=zipfile.ZIP_DEFLATED,
+                         compresslevel=compresslevel)
+    return [arcname for _, arcname in members]
+
+
+def _list_members(source_dir: Path, include, exclude) -> List[Tuple[Path, str]]:
+    # symlinks are followed, unless they dangle or their target is archived anyway, as GTDB-tk
+    # links the genomes and intermediate files into several places. A linked directory that
+    # is already being walked, e.g. a link to a parent directory, is skipped
+    members = []
+    links = []
+    visited = {os.path.realpath(source_dir)}
+    for root, dirs, files in os.walk(source_dir, followlinks=True):
+        rel_root = Path(root).relative_to(source_dir)
+        kept_dirs = []
+        for d in sorted(dirs):
+            if _matches((rel_root / d).as_posix(), exclude):
+                continue
+            real = os.path.realpath(Path(root) / d)
+            if real in visited:
+                continue
+            visited.add(real)
+            kept_dirs.append(d)
+        dirs[:] = kept_dirs
+        for f in sorted(files):
+            arcname = (rel_root / f).as_posix()
+            if not _matches(arcname, include) or _matches(arcname, exclude):
+                continue
+            path = Path(root) / f
+            if not path.exists():  # dangling symlink
+                continue
+            members.append((path, arcname))
+            links.append(os.path.islink(path))
+    archived = {os.path.realpath(p) for (p, _), link in zip(members, links) if not link}
+    kept = []
+    for member, link in zip(members, links):
+        if link:
+            target = os.path.realpath(member[0])
+            if target in archived:
+                continue
+            archived.add(target)
+        kept.append(member)
+    return kept
+
+
+def _matches(arcname, patterns):
+    return any(fnmatch.fnmatchcase(arcname, p) for p in patterns)
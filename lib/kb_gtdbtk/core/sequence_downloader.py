@@ -3,11 +3,17 @@ Downloads sequence data from KBase services.
 '''
 
 import os
-from typing import Dict
+from typing import Callable, Dict, Optional
 from pathlib import Path
 from shutil import copyfile
 
 from kb_gtdbtk.core.kb_client_set import KBClients
+from kb_gtdbtk.core.parallel import map_ordered
+
+# max number of objects to request from the workspace in one get_objects2 call
+_WS_GET_OBJECTS_BATCH_SIZE = 1000
+
+_GENOME_ASSEMBLY_PATHS = ['/assembly_ref', '/contigset_ref']
 
 # DEV NOTES: This is tested by mocks, and so type changes will not be detected by the tests.
 # Type changes should be tested manually.
@@ -17,6 +23,9 @@ def download_sequence(
         upa: str,
         destination_dir: Path,
         clients: KBClients,
+        threads: int = 1,
+        retries: int = 0,
+        on_download: Optional[Callable[[Path, str], None]] = None,
         ) -> Dict[Path, str]:
     '''
     Download sequence data from KBase.
@@ -35,6 +44,11 @@ def download_sequence(
         downloaded.
     :param destination_dir: Where to store the files; must be an extant directory.
     :param clients: The KBase clients to use for the download operation.
+    :param threads: The maximum number of FASTA files to download concurrently for sets.
+    :param retries: The number of times to retry a failed FASTA file download.
+    :param on_download: A callable called with the file path and display name as each file
+        completes downloading, possibly from multiple threads, so that processing can start
+        before the download of the remaining files is complete.
     :returns: A mapping from a file path to a display name for the file (often, but not always,
         the filename).
     '''
@@ -51,6 +65,7 @@ def download_sequence(
     obj_type = obj_data['info'][2].split('-')[0]
 
     dd = destination_dir
+    on_download = on_download or (lambda path, name: None)
 
     if 'KBaseSets.GenomeSet' == obj_type:
         upas = [gsi['ref'] for gsi in obj_data['data']['items']]
@@ -64,48 +79,64 @@ def download_sequence(
         # could optimize out
         faf = clients.au().get_assembly_as_fasta(
             {'ref': upa, 'filename': str(_upa_to_path(dd, upa))})
+        on_download(Path(faf['path']), faf['assembly_name'])
         return {Path(faf['path']): faf['assembly_name']}
     elif 'KBaseSets.AssemblySet' == obj_type:
-        id_to_assy_info = {}
-        for item_upa in obj_data['data']['items']:
-            faf = clients.au().get_assembly_as_fasta(
-                {'ref': upa + ';' + item_upa['ref'],
-                 'filename': str(_upa_to_path(dd, item_upa['ref']))})
-            id_to_assy_info[Path(faf['path'])] = faf['assembly_name']
-        return id_to_assy_info
+        return _get_assemblies_as_fasta(
+            [(upa + ';' + item_upa['ref'], item_upa['ref'])
+             for item_upa in obj_data['data']['items']],
+            clients, dd, threads, retries, on_download)
     elif 'KBaseMetagenomes.BinnedContigs' == obj_type:
-        return _handle_binned_contigs(upa, clients, dd)
+        return _handle_binned_contigs(upa, clients, dd, on_download)
     else:
         raise ValueError(f'{obj_type} type is not supported')
 
-    return _process_genomes(upa, upas, clients, dd)
+    return _process_genomes(upa, upas, clients, dd, threads, retries, on_download)
+
+
+def _process_genomes(upa, upas, clients, dd, threads, retries, on_download):
+    # for single genomes, upa and genome_upa will be the same
+    genome_upas = [gu if gu == upa else upa + ';' + gu for gu in upas]
+
+    # only the assembly reference is needed from each genome, so don't pull the features etc.
+    # Batched to keep the number of workspace calls down for large sets.
+    target_upas = []
+    for chunk_start in range(0, len(genome_upas), _WS_GET_OBJECTS_BATCH_SIZE):
+        chunk = genome_upas[chunk_start:chunk_start + _WS_GET_OBJECTS_BATCH_SIZE]
+        genomes = clients.ws().get_objects2({'objects': [
+            {'ref': gu, 'included': _GENOME_ASSEMBLY_PATHS} for gu in chunk]})['data']
+        for genome in genomes:
+            genome_data = genome['data']
+            target_upas.append(genome_data.get('contigset_ref') or genome_data.get('assembly_ref'))
 
+    return _get_assemblies_as_fasta(
+        [(genome_upa + ';' + target_upa, target_upa)
+         for genome_upa, target_upa in zip(genome_upas, target_upas)],
+        clients, dd, threads, retries, on_download)
+
+
+def _get_assemblies_as_fasta(ref_paths, clients, dd, threads, retries, on_download):
+    # ref_paths is a list of (reference path to the assembly, assembly upa) tuples.
+    # Shock downloads are mostly latency, so run them concurrently.  Each assembly is only
+    # downloaded once, even if it's in the set more than once or shared by several genomes,
+    # so no two downloads write the same file
+    unique_ref_paths = {}
+    for ref, target_upa in ref_paths:
+        unique_ref_paths.setdefault(_upa_to_path(dd, target_upa), ref)
+
+    def get_fasta(path_ref):
+        (path, ref) = path_ref
+        return clients.au().get_assembly_as_fasta({'ref': ref, 'filename': str(path)})
 
-def _process_genomes(upa, upas, clients, dd):
     id_to_assy_info = {}
-    for genome_upa in upas:
-        # this could be sped up by batching the get_objects call
-        # does assy file util not take bulk calls?
-        # maybe doesn't matter since Shock doesn't handle bulk calls
-        # this could be optimized in other ways, e.g. putting the assembly ref in the object
-        # metadata so the whole object doesn't need to be fetched
-        if upa != genome_upa:  # for single genomes, upa and genome_upa will be the same
-            genome_upa = upa + ';' + genome_upa
-        # why not DFU here?
-        # for a single genome this is pulling the same data again. Could optimize here.
-        genome_data = clients.ws().get_objects2(
-            {'objects': [{'ref': genome_upa}]})['data'][0]['data']
-        target_upa = genome_data.get('contigset_ref') or genome_data.get('assembly_ref')
-        faf = clients.au().get_assembly_as_fasta({
-            'ref': genome_upa + ';' + target_upa,
-            'filename': str(_upa_to_path(dd, target_upa))
-            })
+    for faf in map_ordered(get_fasta, list(unique_ref_paths.items()), threads, retries=retries,
+                           on_result=lambda faf: on_download(
+                               Path(faf['path']), faf['assembly_name'])):
         id_to_assy_info[Path(faf['path'])] = faf['assembly_name']
-
     return id_to_assy_info
 
 
-def _handle_binned_contigs(upa, clients, target_dir):
+def _handle_binned_contigs(upa, clients, target_dir, on_download):
     # any CoaC issues here are in MetagenomeUtils
     ret = {}
     bin_file_dir = clients.mgu().binned_contigs_to_file(
@@ -120,6 +151,7 @@ def _handle_binned_contigs(upa, clients, target_dir):
             # Should I verify that the bins have contigs?
             # is it possible to have empty bins?
             ret[Path(fasta_path)] = fasta_fixed_ext
+            on_download(Path(fasta_path), fasta_fixed_ext)
         break  # not sure why this is necessary
     return ret
 
@@ -0,0 +1,86 @@
+'''
+Batched, concurrent taking of ownership of the Shock nodes behind workspace object handles.
+'''
+
+import threading
+
+from typing import Dict, Sequence
+
+from installed_clients.AbstractHandleClient import AbstractHandle
+
+from kb_gtdbtk.core.object_cache import AnyDataFileUtil
+from kb_gtdbtk.core.parallel import map_ordered
+
+# max number of handles to request from the handle service in one hids_to_handles call
+_HS_BATCH_SIZE = 1000
+
+
+class ShockHandleOwner:
+    '''
+    Makes the user the owner of the Shock nodes behind handles, so objects from other users
+    can be saved with the handles, and remembers the new handles for the lifetime of the
+    owner, i.e. for a job.
+    '''
+
+    def __init__(
+            self,
+            hs: AbstractHandle,
+            dfu: AnyDataFileUtil,
+            threads: int = 1,
+            retries: int = 0,
+            batch_size: int = _HS_BATCH_SIZE):
+        '''
+        Create the owner.
+
+        :param hs: the handle service client.
+        :param dfu: the DataFileUtil client.
+        :param threads: the maximum number of own_shock_node calls to make at once.
+        :param retries: the number of times to retry a failed own_shock_node call.
+        :param batch_size: the maximum number of handles to look up in one call.
+        '''
+        self._hs = hs
+        self._dfu = dfu
+        self._threads = threads
+        self._retries = retries
+        self._batch_size = batch_size
+        self._new_hids: Dict[str, str] = {}
+        self._new_hids_by_shock_id: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def own_handles(self, hids: Sequence[str]) -> Dict[str, str]:
+        '''
+        Take ownership of the Shock nodes behind handles.
+
+        :param hids: the handle IDs.
+        :returns: a mapping of each handle ID to the ID of a handle for the owned node.
+        '''
+        with self._lock:
+            missing = list(dict.fromkeys(h for h in hids if h not in self._new_hids))
+        shock_ids: Dict[str, str] = {}
+        for chunk_start in range(0, len(missing), self._batch_size):
+            chunk = missing[chunk_start:chunk_start + self._batch_size]
+            handles = self._hs.hids_to_handles(chunk)
+            # match the handles to the requested IDs by their own IDs, not their order
+            chunk_shock_ids = {h['hid']: h['id'] for h in handles}
+            missing_hids = [h for h in chunk if h not in chunk_shock_ids]
+            if missing_hids:
+                raise ValueError(
+                    'The handle service did not return handles for: '
+                    + ', '.join(str(h) for h in missing_hids))
+            shock_ids.update((h, chunk_shock_ids[h]) for h in chunk)
+        with self._lock:
+            to_own = list(dict.fromkeys(
+                s for s in shock_ids.values() if s not in self._new_hids_by_shock_id))
+        new_hids = map_ordered(self._own_shock_node, to_own, self._threads, self._retries)
+        with self._lock:
+            self._new_hids_by_shock_id.update(zip(to_own, new_hids))
+            for hid, shock_id in shock_ids.items():
+                new_hid = self._new_hids_by_shock_id[shock_id]
+                self._new_hids[hid] = new_hid
+                # the new handle is already for a node the user owns
+                self._new_hids[new_hid] = new_hid
+            return {h: self._new_hids[h] for h in hids}
+
+    def _own_shock_node(self, shock_id):
+        own_node_output = self._dfu.own_shock_node({'shock_id': shock_id, 'make_handle': 1})
+        return own_node_output['handle']['hid']
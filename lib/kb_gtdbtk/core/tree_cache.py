@@ -0,0 +1,118 @@
+'''
+A per process cache of what we read from Newick tree files, so a tree that is used by more
+than one step (e.g. the trimmed tree for both the report HTML and the saved Tree object) is
+only parsed once.
+
+Trees are read with the array backed parser in kb_gtdbtk.core.newick rather than ete3, and
+only compact results are kept: the leaf names, or the ladderized tree and its Newick.
+'''
+
+import os
+import threading
+
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, NamedTuple, Tuple, Union
+
+from kb_gtdbtk.core.newick import NewickTree, read_newick
+
+
+# trees from earlier jobs are dropped once the cache holds this many
+TREE_CACHE_MAX_ENTRIES = 64
+
+
+class _LadderizedTree(NamedTuple):
+    newick: str
+    tree: NewickTree
+
+
+_cache: 'OrderedDict[Tuple[str, bool], Tuple[Tuple[int, int], object]]' = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _read_leaf_names(path):
+    return read_newick(path).leaf_names()
+
+
+def _read_ladderized(path):
+    tree = read_newick(path)
+    tree.ladderize()
+    return _LadderizedTree(tree.write(), tree)
+
+
+def _get(path, ladderized):
+    path = str(path)
+    st = os.stat(path)
+    version = (st.st_mtime_ns, st.st_size)
+    key = (path, ladderized)
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None and cached[0] == version:
+            _cache.move_to_end(key)
+            return cached[1]
+    value = _read_ladderized(path) if ladderized else _read_leaf_names(path)
+    with _cache_lock:
+        _cache[key] = (version, value)
+        _cache.move_to_end(key)
+        while len(_cache) > TREE_CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+    return value
+
+
+# get_tree_leaf_names()
+#
+def get_tree_leaf_names(path: Union[str, Path]) -> List[str]:
+    '''
+    Get the leaf names of a tree in the order they appear in the file.
+
+    :param path: the path to the Newick file.
+    :returns: the leaf names.
+    '''
+    return list(_get(path, False))
+
+
+# get_ladderized_newick()
+#
+def get_ladderized_newick(path: Union[str, Path]) -> str:
+    '''
+    Get a tree ladderized and written as Newick, as ete3's write() would write it.
+
+    :param path: the path to the Newick file.
+    :returns: the Newick string, terminated with ';'.
+    '''
+    return _get(path, True).newick
+
+
+# get_ladderized_leaf_names()
+#
+def get_ladderized_leaf_names(path: Union[str, Path]) -> List[str]:
+    '''
+    Get the leaf names of a tree in ladderized order.
+
+    :param path: the path to the Newick file.
+    :returns: the leaf names.
+    '''
+    return _get(path, True).tree.leaf_names()
+
+
+# get_ladderized_leaf_ancestors()
+#
+def get_ladderized_leaf_ancestors(path: Union[str, Path]) -> List[Tuple[str, List[str]]]:
+    '''
+    Get the names of the ancestors of each leaf of a tree, with the leaves in ladderized order.
+
+    :param path: the path to the Newick file.
+    :returns: a list of (leaf name, ancestor names) tuples. The ancestor names run from the
+        leaf's parent to the root and include unnamed ancestors as ''.
+    '''
+    return _get(path, True).tree.leaf_ancestors()
+
+
+# clear_tree_cache()
+#
+def clear_tree_cache() -> None:
+    '''
+    Drop all cached trees.
+    '''
+    with _cache_lock:
+        _cache.clear()
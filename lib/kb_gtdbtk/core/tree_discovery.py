@@ -0,0 +1,142 @@
+'''
+Find the GTDB-tk classification trees present in a directory.
+'''
+
+import os
+import re
+
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+
+# GTDB-tk names its trees
+#   gtdbtk.<domain>.classify.tree
+#   gtdbtk.backbone.bac120.classify.tree
+#   gtdbtk.bac120.classify.tree.<subtree index>.tree
+# Trees that would overwrite another tree of the same name, e.g. from another shard or the
+# second pass, get a -<source> tag before the extension.
+_TREE_FILE_RE = re.compile(
+    r'^gtdbtk\.(?P<backbone>backbone\.)?(?P<domain>ar53|bac120)\.classify'
+    + r'(?:\.tree\.(?P<subtree>\d+))?(?:-(?P<source>shard\d+|skip_ani))?\.tree$')
+
+_TREE_EXT_RE = re.compile(r'\.tree$')
+
+# the source tag for trees from the second, skip ANI screen, pass
+SKIP_ANI_SOURCE = 'skip_ani'
+
+
+class TreeFile(NamedTuple):
+    '''
+    A GTDB-tk classification tree file.
+    '''
+
+    path: Path
+    ''' The path to the tree file. '''
+
+    domain: str
+    ''' The domain of the reference tree, either ar53 or bac120. '''
+
+    backbone: bool
+    ''' True if this is the bac120 backbone tree. '''
+
+    subtree: Optional[int]
+    ''' The index of the bac120 class level subtree, or None for a backbone or whole tree. '''
+
+    source: Optional[str]
+    '''
+    The tag of the run that produced the tree when the tree was renamed so as not to overwrite
+    a tree of the same name: 'shard<N>' for a classify_wf shard or 'skip_ani' for the second
+    pass. None for a tree with the name GTDB-tk gave it.
+    '''
+
+    @property
+    def name(self) -> str:
+        ''' The file name of the tree. '''
+        return self.path.name
+
+
+# discover_trees()
+#
+def discover_trees(tree_dir: Path) -> List[TreeFile]:
+    '''
+    Find the GTDB-tk classification trees in a directory with a single directory listing.
+
+    :param tree_dir: the directory to search. A missing directory contains no trees.
+    :returns: the trees, ordered as GTDB-tk output (archaeal tree, bacterial tree, backbone
+        tree, then the subtrees in index order) with the renamed trees last, ordered by source.
+    '''
+    if not os.path.isdir(tree_dir):
+        return []
+    trees = []
+    for file_ in os.listdir(tree_dir):
+        m = _TREE_FILE_RE.match(file_)
+        if not m:
+            continue
+        subtree = m.group('subtree')
+        trees.append(TreeFile(Path(tree_dir) / file_,
+                              m.group('domain'),
+                              bool(m.group('backbone')),
+                              int(subtree) if subtree is not None else None,
+                              m.group('source')))
+    return sorted(trees, key=_tree_sort_key)
+
+
+# get_tagged_tree_file_name()
+#
+def get_tagged_tree_file_name(file_: str, source: str) -> str:
+    '''
+    Get the name for a tree that would otherwise overwrite a tree of the same name.
+
+    :param file_: the name GTDB-tk gave the tree.
+    :param source: the tag for the run that produced the tree, 'shard<N>' or 'skip_ani'.
+    :returns: the new name.
+    '''
+    return _TREE_EXT_RE.sub(f'-{source}.tree', file_)
+
+
+# get_partial_tree_notes()
+#
+def get_partial_tree_notes(trees: Sequence[TreeFile]) -> Dict[str, str]:
+    '''
+    Describe the trees that hold only some of the queries placed into a reference tree, because
+    the queries were placed by separate runs, e.g. classify_wf shards or the second pass, each
+    into its own copy of the reference tree.
+
+    :param trees: the trees, as returned by discover_trees.
+    :returns: a mapping from the file name of each partial tree to a note for the report.
+    '''
+    groups: Dict[tuple, List[TreeFile]] = {}
+    for tree in trees:
+        groups.setdefault((tree.domain, tree.backbone, tree.subtree), []).append(tree)
+    notes = {}
+    for group in groups.values():
+        if len(group) < 2:
+            continue
+        for tree in group:
+            if tree.source is None:
+                origin = 'partial tree'
+            elif tree.source == SKIP_ANI_SOURCE:
+                origin = ('partial tree of the queries placed by the second pass, which skips '
+                          + 'the ANI screen')
+            else:
+                origin = 'partial tree of the queries in classify_wf shard ' + tree.source[
+                    len('shard'):]
+            others = ', '.join(t.name for t in group if t is not tree)
+            notes[tree.name] = f'{origin}; the other queries are in {others}'
+    return notes
+
+
+def _tree_sort_key(tree):
+    if tree.source is None:
+        source_key = (0, 0)
+    elif tree.source == SKIP_ANI_SOURCE:
+        source_key = (2, 0)
+    else:
+        source_key = (1, int(tree.source[len('shard'):]))
+    if tree.subtree is not None:
+        kind = 2
+    elif tree.backbone:
+        kind = 1
+    else:
+        kind = 0
+    return (source_key, kind, tree.domain, tree.subtree or 0)
@@ -12,7 +12,8 @@ from pathlib import Path
 from kb_gtdbtk.core.api_translation import get_gtdbtk_params
 from kb_gtdbtk.core.sequence_downloader import download_sequence
 from kb_gtdbtk.core.kb_client_set import KBClients
-from kb_gtdbtk.core.gtdbtk_runner import run_gtdbtk
+from kb_gtdbtk.core.gtdbtk_runner import run_gtdbtk, StreamingIdentify
+from kb_gtdbtk.core.classification_cache import ClassificationCache
 from kb_gtdbtk.core.krona_runner import run_krona_import_text
 from kb_gtdbtk.core.kb_report_generation import generate_report
 from kb_gtdbtk.core.genome_obj_update import copy_gtdb_species_reps, get_obj_type, check_obj_type_genome, check_obj_type_assembly, update_genome_assembly_objs_class, process_tree_files, save_gtdb_tree_objs
@@ -69,6 +70,37 @@ class kb_gtdbtk:
         self.ws_url = config['workspace-url']
         self.hs_url = config['handle-service-url']
         self.cpus = config['cpus']  # bigmem 32 cpus & 251 GB RAM.  new gtdb-tk needs less mem.
+        self.cpus_per_shard = int(config.get('gtdbtk_cpus_per_shard', 0))  # 0 = no sharding
+        self.download_threads = int(config.get('download_threads', 1))
+        self.download_retries = int(config.get('download_retries', 0))
+        self.upload_threads = int(config.get('upload_threads', 1))
+        self.upload_retries = int(config.get('upload_retries', 0))
+        self.object_cache_max_bytes = int(float(config.get('object_cache_max_mb', 256)) * 1024**2)
+        self.workspace_save_batch_size = int(config.get('workspace_save_batch_size', 50))
+        self.handle_threads = int(config.get('handle_threads', 1))
+        self.handle_retries = int(config.get('handle_retries', 0))
+        self.copy_threads = int(config.get('copy_threads', 1))
+        self.copy_retries = int(config.get('copy_retries', 0))
+        # max trees processed, and tree trimming processes run, at once
+        self.tree_threads = int(config.get('tree_threads', 1))
+        # comma separated glob patterns for the files in the output archive
+        self.report_archive_include = [
+            p.strip() for p in config.get('report_archive_include', '').split(',') if p.strip()]
+        self.report_archive_exclude = [
+            p.strip() for p in config.get('report_archive_exclude', '').split(',') if p.strip()]
+        # 0 = download everything before starting GTDB-tk
+        self.stream_identify_chunk_size = int(config.get('stream_identify_chunk_size', 0))
+        # 1 = run GTDB-tk in resumable identify/align/classify stages
+        self.checkpoint_stages = bool(int(config.get('gtdbtk_checkpoint_stages', 0)))
+        # copy, hardlink or move
+        self.runtime_output_mode = config.get('runtime_output_mode', 'copy')
+        self.runtime_output_report_files_only = bool(
+            int(config.get('runtime_output_report_files_only', 0)))
+        self.classification_cache = None
+        if config.get('classification_cache_dir'):
+            self.classification_cache = ClassificationCache(
+                Path(config['classification_cache_dir']),
+                int(float(config.get('classification_cache_max_gb', 10)) * 1024**3))
         self.genome_upas_map_file = config['genome_upas_map_file']
         
         logging.basicConfig(format='%(created)s %(levelname)s: %(message)s',
@@ -150,19 +182,14 @@ class kb_gtdbtk:
         fasta_path = self.shared_folder / 'fastas'
         fasta_path.mkdir(parents=True, exist_ok=True)
 
-        cli = KBClients(self.callback_url, self.ws_url, self.hs_url, ctx['token'])
-
-        path_to_filename = download_sequence(params.ref, fasta_path, cli)
-        for path, fn in path_to_filename.items():
-            print(fn, path)
+        cli = KBClients(self.callback_url, self.ws_url, self.hs_url, ctx['token'],
+                        self.object_cache_max_bytes, self.handle_threads, self.handle_retries)
 
         output_path = self.shared_folder / 'output'
         temp_output = self.shared_folder / 'temp_output'
         output_path.mkdir(parents=True, exist_ok=True)
         temp_output.mkdir(parents=True, exist_ok=True)
 
-        
-        ### Step 01: run GTDB-Tk Classify WF
         def runner(args):
             self.log(console, "Run gtdbtk classify_wf\n")
 
@@ -171,6 +198,32 @@ class kb_gtdbtk:
             # should print to stdout/stderr
             subprocess.run(args, check=True, env=env)
 
+        # cached results have no place in the trees, so don't use them if tree objects are
+        # saved.  The report trees leave them out and say so
+        top_query_obj_type = get_obj_type (params.ref, cli)
+        trees_required = bool(params.save_trees) and check_obj_type_genome (top_query_obj_type)
+
+        # start gene calling on the genomes that have arrived while the rest download
+        streaming_identify = None
+        if self.stream_identify_chunk_size > 0:
+            streaming_identify = StreamingIdentify(
+                runner,
+                temp_output,
+                params.db_ver,
+                self.cpus,
+                self.stream_identify_chunk_size,
+                None if trees_required else self.classification_cache,
+                params.min_perc_aa)
+
+        path_to_filename = download_sequence(params.ref, fasta_path, cli,
+                                             self.download_threads, self.download_retries,
+                                             streaming_identify.add if streaming_identify else None)
+        for path, fn in path_to_filename.items():
+            print(fn, path)
+        identified = streaming_identify.finish() if streaming_identify else None
+
+        
+        ### Step 01: run GTDB-Tk Classify WF
         (classification, summary_tables) = run_gtdbtk (runner,
                                                        path_to_filename,
                                                        output_path,
@@ -178,7 +231,14 @@ class kb_gtdbtk:
                                                        params.min_perc_aa,
                                                        params.db_ver,
                                                        params.keep_intermediates,
-                                                       self.cpus)
+                                                       self.cpus,
+                                                       self.cpus_per_shard,
+                                                       self.classification_cache,
+                                                       identified,
+                                                       self.checkpoint_stages,
+                                                       self.runtime_output_mode,
+                                                       self.runtime_output_report_files_only,
+                                                       trees_required)
 
 
         ### Step 02: Make Krona plot
@@ -188,7 +248,6 @@ class kb_gtdbtk:
         
         ### Step 03: Save Genome and/or Assembly objects with updated lineage
         objects_created = None
-        top_query_obj_type = get_obj_type (params.ref, cli)
         if check_obj_type_assembly (top_query_obj_type) or check_obj_type_genome (top_query_obj_type):
             self.log(console, "Update Genome and Assembly objects and lineage files")
             if params.db_ver == 207:
@@ -201,7 +260,8 @@ class kb_gtdbtk:
                                                                  params.overwrite_tax,
                                                                  str(params.db_ver),
                                                                  taxon_assignment_field,
-                                                                 cli)
+                                                                 cli,
+                                                                 self.workspace_save_batch_size)
 
         
         ### Step 04: copy over GTDB Species Rep Genomes to calling WS and make GenomeSets
@@ -211,7 +271,9 @@ class kb_gtdbtk:
                                                             params.ref,
                                                             self.genome_upas_map_file,
                                                             summary_tables,
-                                                            cli))
+                                                            cli,
+                                                            self.copy_threads,
+                                                            self.copy_retries))
         
 
         ### Step 05: process trees
@@ -222,7 +284,10 @@ class kb_gtdbtk:
                                          classification,
                                          str(params.db_ver),
                                          params.dendrogram_report,
-                                         cli)
+                                         cli,
+                                         self.tree_threads,
+                                         self.upload_threads,
+                                         self.upload_retries)
 
 
         ### Step 06: copy tree genomes and save tree object
@@ -233,7 +298,9 @@ class kb_gtdbtk:
                                                          output_path,
                                                          params.output_tree_basename,
                                                          self.genome_upas_map_file,
-                                                         cli))
+                                                         cli,
+                                                         self.copy_threads,
+                                                         self.copy_retries))
         
         
         ### Step 07: make report
@@ -242,7 +309,9 @@ class kb_gtdbtk:
                                  output_path,
                                  params.workspace_id,
                                  objects_created,
-                                 file_links)
+                                 file_links,
+                                 archive_include=self.report_archive_include,
+                                 archive_exclude=self.report_archive_exclude)
 
         #END run_kb_gtdbtk_classify_wf
 
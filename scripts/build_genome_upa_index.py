@@ -0,0 +1,15 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+
+from kb_gtdbtk.core.genome_upa_index import build_genome_upa_index  # noqa: E402
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: <program> <genome_upas_map_file> [<genome_upas_map_file> ...]")
+        print("Builds the memory mapped genome id to UPA index next to each file.")
+        sys.exit(1)
+    for genome_upas_map_file in sys.argv[1:]:
+        print("Indexing " + genome_upas_map_file)
+        build_genome_upa_index(genome_upas_map_file)
@@ -0,0 +1,23 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+
+from kb_gtdbtk.core.gtdb_metadata import (  # noqa: E402
+    build_gtdb_metadata_store,
+    get_gtdb_metadata_store_path
+)
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: <program> <gtdb_version>")
+        print("Builds the GTDB metadata store in /data/r<gtdb_version> from the ar53 and bac120")
+        print("metadata TSV files in that directory.")
+        sys.exit(1)
+    db_ver = int(sys.argv[1])
+    ver_dir = os.path.join(os.sep, 'data', 'r' + str(db_ver))
+    metadata_files = [os.path.join(ver_dir, 'ar53_metadata_r' + str(db_ver) + '.tsv'),
+                      os.path.join(ver_dir, 'bac120_metadata_r' + str(db_ver) + '.tsv')]
+    out_path = get_gtdb_metadata_store_path(db_ver)
+    print("Building GTDB metadata store " + str(out_path))
+    build_gtdb_metadata_store(metadata_files, out_path)
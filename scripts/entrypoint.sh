@@ -140,9 +140,19 @@ elif [ "${1}" = "init" ] ; then
     gunzip ${BAC_METADATA}
   fi
 
+  # build the indexed metadata stores.  Can't do later because /data read-only
+  cd /kb/module
+  for GTDB_VER_INT in 207 214 ; do
+    export metadata_store="/data/r${GTDB_VER_INT}/gtdb_metadata_r${GTDB_VER_INT}.idx"
+    if [[ ! -s ${metadata_store} && -s "/data/r${GTDB_VER_INT}/ar53_metadata_r${GTDB_VER_INT}.tsv" && -s "/data/r${GTDB_VER_INT}/bac120_metadata_r${GTDB_VER_INT}.tsv" ]] ; then
+	echo "Building GTDB metadata store for r"${GTDB_VER_INT}
+	python ./scripts/build_gtdb_metadata_store.py ${GTDB_VER_INT}
+    fi
+  done
+
   # don't repeat if refdata prepared
   cd /data
-  if [[ -d "r207/taxonomy" && -d "r207/fastani" && -d "r207/markers" && -s "r207/mash/gtdb_ref_sketch.msh" && -s "r207/ar53_metadata_r207.tsv" && -s "r207/bac120_metadata_r207.tsv" && -d "r214/taxonomy" && -d "r214/fastani" && -d "r214/markers" && -s "r214/mash/gtdb_ref_sketch.msh" && -s "r214/ar53_metadata_r214.tsv" && -s "r214/bac120_metadata_r214.tsv" ]] ;  then
+  if [[ -d "r207/taxonomy" && -d "r207/fastani" && -d "r207/markers" && -s "r207/mash/gtdb_ref_sketch.msh" && -s "r207/ar53_metadata_r207.tsv" && -s "r207/bac120_metadata_r207.tsv" && -s "r207/gtdb_metadata_r207.idx" && -d "r214/taxonomy" && -d "r214/fastani" && -d "r214/markers" && -s "r214/mash/gtdb_ref_sketch.msh" && -s "r214/ar53_metadata_r214.tsv" && -s "r214/bac120_metadata_r214.tsv" && -s "r214/gtdb_metadata_r214.idx" ]] ;  then
     touch __READY__
   else
     echo "init failed"
@@ -165,6 +175,9 @@ elif [ "${1}" = "init" ] ; then
     if [ ! -s "r207/bac120_metadata_r207.tsv" ] ; then
 	echo "missing r207/bac120_metadata_r207.tsv"
     fi
+    if [ ! -s "r207/gtdb_metadata_r207.idx" ] ; then
+	echo "missing r207/gtdb_metadata_r207.idx"
+    fi
     if [ ! -d "r214/taxonomy" ] ; then
 	echo "missing r214/taxonomy"
     fi
@@ -183,6 +196,9 @@ elif [ "${1}" = "init" ] ; then
     if [ ! -s "r214/bac120_metadata_r214.tsv" ] ; then
 	echo "missing r214/bac120_metadata_r214.tsv"
     fi
+    if [ ! -s "r214/gtdb_metadata_r214.idx" ] ; then
+	echo "missing r214/gtdb_metadata_r214.idx"
+    fi
 
   fi
 elif [ "${1}" = "bash" ] ; then
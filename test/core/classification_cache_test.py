@@ -0,0 +1,59 @@
+import os
+import tempfile
+import time
+
+from pathlib import Path
+from pytest import raises
+
+from kb_gtdbtk.core.classification_cache import ClassificationCache
+from core.test_utils import assert_exception_correct
+
+
+def _entry(id_):
+    return {'gtdbtk.bac120.summary.tsv': [['user_genome', 'classification'], [id_, 'd__foo']]}
+
+
+def test_get_put():
+    with tempfile.TemporaryDirectory(prefix='test_cache_get_put') as td:
+        cache = ClassificationCache(Path(td) / 'cache', 1024 * 1024)
+        with open(Path(td) / 'f.fa', 'w') as f:
+            f.write('>c\nACGT\n')
+
+        key = cache.get_key(Path(td) / 'f.fa', 214, 10)
+        assert cache.get(key) is None
+
+        cache.put(key, _entry('id3'))
+        assert cache.get(key) == _entry('id3')
+
+        # the key depends on the parameters as well as the file contents
+        assert cache.get_key(Path(td) / 'f.fa', 214, 10.0) == key
+        assert cache.get_key(Path(td) / 'f.fa', 207, 10) != key
+        assert cache.get_key(Path(td) / 'f.fa', 214, 50) != key
+
+
+def test_evict_least_recently_used():
+    with tempfile.TemporaryDirectory(prefix='test_cache_evict') as td:
+        cache_dir = Path(td) / 'cache'
+        entry_size = len('{"gtdbtk.bac120.summary.tsv": '
+                         '[["user_genome", "classification"], ["id0", "d__foo"]]}')
+        cache = ClassificationCache(cache_dir, entry_size * 2)
+
+        keys = ['aa' + str(i) * 62 for i in range(3)]
+        for i, key in enumerate(keys):
+            cache.put(key, _entry('id0'))
+            # make the put order visible to mtime based eviction
+            os.utime(cache_dir / 'aa' / (key + '.json'), (time.time() - 100 + i,) * 2)
+
+        # using the oldest entry makes it the most recently used
+        assert cache.get(keys[0]) == _entry('id0')
+        cache.evict()
+
+        assert cache.get(keys[0]) == _entry('id0')
+        assert cache.get(keys[1]) is None
+        assert cache.get(keys[2]) == _entry('id0')
+
+
+def test_fail_bad_size():
+    with raises(Exception) as got:
+        ClassificationCache(Path('foo'), 0)
+    assert_exception_correct(got.value, ValueError('max_bytes must be > 0'))
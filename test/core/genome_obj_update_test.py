@@ -0,0 +1,286 @@
+import os
+import subprocess
+import tempfile
+
+from pathlib import Path
+from threading import BoundedSemaphore
+from unittest.mock import create_autospec
+
+from kb_gtdbtk.core.genome_obj_update import (
+    _trim_tree, _upload_files_to_shock, _write_gtdb_tree_html_file, copy_gtdb_genome_objs, fix_unowned_shock_handles,
+    get_sp_rep_id_map_lines, process_genome_objs, save_objs_in_batches)
+from kb_gtdbtk.core.gtdb_metadata import GtdbMetadata, build_gtdb_metadata_store
+from kb_gtdbtk.core.kb_client_set import KBClients
+from kb_gtdbtk.core.object_names import WorkspaceNameIndex
+from installed_clients.DataFileUtilClient import DataFileUtil
+from installed_clients.WorkspaceClient import Workspace
+
+
+def _client_mocks():
+    clis = create_autospec(KBClients, spec_set=True, instance=True)
+    dfu = create_autospec(DataFileUtil, spec_set=True, instance=True)
+    clis.dfu.return_value = dfu
+    return clis
+
+
+def test_upload_files_to_shock():
+
+    with tempfile.TemporaryDirectory(prefix='test_upload_files_to_shock') as test_dir_str:
+        test_dir = Path(test_dir_str)
+        (test_dir / 'a.tree').write_text('(a,b);')
+        (test_dir / 'b.tree').write_text('(a,c);')
+        # same content as a.tree
+        (test_dir / 'c.map').write_text('(a,b);')
+        os.symlink(test_dir / 'b.tree', test_dir / 'd.tree')
+        upload_files = [{'path': str(test_dir / f), 'name': f, 'description': f + ' desc'}
+                        for f in ['a.tree', 'b.tree', 'c.map', 'd.tree', 'a.tree']]
+
+        clis = _client_mocks()
+        clis.dfu().file_to_shock.side_effect = lambda params: {
+            'shock_id': 'id_' + os.path.basename(params['file_path'])}
+
+        file_links = _upload_files_to_shock(upload_files, clis, threads=4)
+
+        assert file_links == [
+            {'shock_id': 'id_a.tree', 'name': 'a.tree', 'description': 'a.tree desc'},
+            {'shock_id': 'id_b.tree', 'name': 'b.tree', 'description': 'b.tree desc'},
+            {'shock_id': 'id_a.tree', 'name': 'c.map', 'description': 'c.map desc'},
+            {'shock_id': 'id_b.tree', 'name': 'd.tree', 'description': 'd.tree desc'},
+            {'shock_id': 'id_a.tree', 'name': 'a.tree', 'description': 'a.tree desc'},
+        ]
+        assert sorted(c.args[0]['file_path'] for c in clis.dfu().file_to_shock.call_args_list) \
+            == [str(test_dir / 'a.tree'), str(test_dir / 'b.tree')]
+        for c in clis.dfu().file_to_shock.call_args_list:
+            assert c.args[0]['make_handle'] == 0
+
+
+def test_write_gtdb_tree_html_file_cached_genomes():
+
+    with tempfile.TemporaryDirectory(prefix='test_write_gtdb_tree_html') as test_dir_str:
+        path = _write_gtdb_tree_html_file(test_dir_str, [], ['genome<1>', 'genome2'])
+
+        with open(path) as f:
+            html_text = f.read()
+        assert ('The classifications of 2 genome(s) were taken from the cache of earlier '
+                + 'runs, so they are not placed in the trees: genome&lt;1&gt;, genome2'
+                ) in html_text
+        assert 'there are no trees' in html_text
+
+        path = _write_gtdb_tree_html_file(test_dir_str, [])
+        with open(path) as f:
+            assert 'cache' not in f.read()
+
+
+class _FakeTrimProc:
+    running = 0
+    max_running = 0
+
+    def __init__(self, cmd, env=None):
+        _FakeTrimProc.running += 1
+        _FakeTrimProc.max_running = max(_FakeTrimProc.max_running, _FakeTrimProc.running)
+        self.returncode = 0
+
+    def wait(self):
+        _FakeTrimProc.running -= 1
+        return self.returncode
+
+
+def _trim_with_slots(monkeypatch, slots):
+    monkeypatch.setattr(subprocess, 'Popen', _FakeTrimProc)
+    _FakeTrimProc.max_running = 0
+    out_paths = _trim_tree('/out/gtdbtk.bac120.classify.tree', '/out/in.map', '/out/out.map',
+                           '/out/lineages.map', '214', slots)
+    assert out_paths == ['/out/gtdbtk.bac120.classify-proximals.tree',
+                         '/out/gtdbtk.bac120.classify-trimmed.tree']
+    return _FakeTrimProc.max_running
+
+
+def test_get_sp_rep_id_map_lines():
+
+    with tempfile.TemporaryDirectory(prefix='test_get_sp_rep_id_map_lines') as test_dir_str:
+        metadata_path = Path(test_dir_str) / 'bac120_metadata.tsv'
+        metadata_path.write_text(
+            'accession\tgtdb_taxonomy\tgtdb_representative\tgtdb_genome_representative\t'
+            + 'ncbi_organism_name\tncbi_taxonomy\n'
+            + 'RS_GCF_000001.1\td__Bacteria;s__Foo bar\tt\tRS_GCF_000001.1\tFoo bar\t-\n')
+        store_path = Path(test_dir_str) / 'gtdb_metadata.idx'
+        build_gtdb_metadata_store([metadata_path], store_path)
+
+        sp_rep_ids = ['GCF_000002.1', 'GCF_000001.1']
+        # without a store the lines have no lineage, as the trim script doesn't need one
+        assert get_sp_rep_id_map_lines(sp_rep_ids, None) == [
+            'GCF_000001.1\tGCF_000001.1', 'GCF_000002.1\tGCF_000002.1']
+        assert get_sp_rep_id_map_lines(sp_rep_ids, GtdbMetadata(store_path)) == [
+            'GCF_000001.1\tGCF_000001.1\td__Bacteria;s__Foo bar',
+            'GCF_000002.1\tGCF_000002.1\t-']
+
+
+def test_trim_tree_runs_trims_together_with_free_slots(monkeypatch):
+    slots = BoundedSemaphore(2)
+    assert _trim_with_slots(monkeypatch, slots) == 2
+    # all the slots are given back
+    assert slots.acquire(blocking=False) and slots.acquire(blocking=False)
+
+
+def test_trim_tree_runs_trims_in_turn_without_free_slots(monkeypatch):
+    slots = BoundedSemaphore(2)
+    # another tree holds a slot
+    slots.acquire()
+    assert _trim_with_slots(monkeypatch, slots) == 1
+    assert slots.acquire(blocking=False)
+    assert not slots.acquire(blocking=False)
+
+
+def _info(wsid, objid, ver, name, type_):
+    return [objid, name, type_, '', ver, 'user', wsid, 'ws', 'chksum', 100, {}]
+
+
+def test_process_genome_objs_saves_in_batches():
+    objs = {}
+    for i in range(1, 4):
+        objs[f'1/{i}/1'] = {'info': _info(1, i, 1, f'genome{i}', 'KBaseGenomes.Genome-17.0'),
+                            'data': {'assembly_ref': f'1/{i + 10}/1', 'taxonomy': 'Bacteria'}}
+        objs[f'1/{i + 10}/1'] = {
+            'info': _info(1, i + 10, 1, f'assembly{i}', 'KBaseGenomeAnnotations.Assembly-6.0'),
+            'data': {}}
+    genomeset = {'info': _info(1, 20, 1, 'gs', 'KBaseSets.GenomeSet-2.1'),
+                 'data': {'description': 'd',
+                          'items': [{'ref': f'1/{i}/1', 'label': ''} for i in range(1, 4)]}}
+    classification = {'assembly1': 'd__Bacteria;s__A a', 'assembly3': 'd__Bacteria;s__C c'}
+
+    clis = _client_mocks()
+    clis.dfu().get_objects.side_effect = lambda params: {
+        'data': [objs[r] for r in params['object_refs']]}
+    saved = []
+
+    def save_objects(params):
+        infos = []
+        for obj in params['objects']:
+            saved.append((obj['type'].split('.')[1], obj['name'], obj['data']))
+            infos.append(_info(params['id'], len(saved) + 100, 2, obj['name'], obj['type']))
+        return infos
+    clis.dfu().save_objects.side_effect = save_objects
+
+    objects_created = process_genome_objs(
+        5, genomeset, '1/20/1', [f'1/{i}/1' for i in range(1, 4)], classification, 0, '214',
+        'GTDB_R08-RS214', clis, save_batch_size=2)
+
+    # a get and a save each for the genomes and assemblies of each batch, and the set save
+    assert clis.dfu().get_objects.call_count == 4
+    assert [len(c.args[0]['objects']) for c in clis.dfu().save_objects.call_args_list] == \
+        [1, 1, 1, 1, 1]
+    assert [(t, n) for t, n, _ in saved] == [
+        ('Assembly', 'assembly1'), ('Genome', 'genome1'),
+        ('Assembly', 'assembly3'), ('Genome', 'genome3'), ('GenomeSet', 'gs')]
+    # the new assembly refs are patched into the genomes
+    assert saved[1][2]['assembly_ref'] == '5/101/2'
+    assert saved[1][2]['std_lineages']['gtdb']['taxon_id'] == 's__A a'
+    assert saved[1][2]['taxon_assignments'] == {'GTDB_R08-RS214': 'd__Bacteria;s__A a'}
+    assert saved[3][2]['assembly_ref'] == '5/103/2'
+    assert saved[4][2]['items'] == [{'label': '', 'ref': '5/102/2'},
+                                    {'label': '', 'ref': '1/2/1'},
+                                    {'label': '', 'ref': '5/104/2'}]
+    assert [o['ref'] for o in objects_created] == ['5/102/2', '5/104/2', '5/105/2']
+
+
+def test_save_objs_in_batches():
+    clis = _client_mocks()
+    clis.dfu().save_objects.side_effect = lambda params: [
+        _info(params['id'], i, 1, o['name'], o['type']) for i, o in enumerate(params['objects'])]
+    objects = [{'type': 'T', 'name': n, 'data': {}} for n in ['a', 'b', 'c', 'a', 'd', 'e']]
+
+    refs = save_objs_in_batches(5, objects, clis, batch_size=4)
+
+    assert [[o['name'] for o in c.args[0]['objects']]
+            for c in clis.dfu().save_objects.call_args_list] == [['a', 'b', 'c'], ['a', 'd', 'e']]
+    assert refs == ['5/0/1', '5/1/1', '5/2/1', '5/0/1', '5/1/1', '5/2/1']
+
+
+def test_process_genome_objs_skips_current_objs():
+    lineage = 'd__Bacteria;s__A a'
+    std_lineages = {'gtdb': {'lineage': lineage, 'source_ver': '214.1', 'taxon_id': 's__A a'}}
+    objs = {}
+    for i in range(1, 3):
+        objs[f'1/{i}/1'] = {
+            'info': _info(1, i, 1, f'genome{i}', 'KBaseGenomes.Genome-17.0'),
+            'data': {'assembly_ref': f'1/{i + 10}/1', 'taxonomy': lineage,
+                     'std_lineages': std_lineages,
+                     'taxon_assignments': {'GTDB_R08-RS214': lineage}}}
+        objs[f'1/{i + 10}/1'] = {
+            'info': _info(1, i + 10, 1, f'assembly{i}', 'KBaseGenomeAnnotations.Assembly-6.0'),
+            'data': {'std_lineages': std_lineages}}
+    # genome 2 was classified with another GTDB version but its assembly is current
+    objs['1/2/1']['data']['taxon_assignments'] = {'GTDB_R07-RS207': lineage}
+    genomeset = {'info': _info(1, 20, 1, 'gs', 'KBaseSets.GenomeSet-2.1'),
+                 'data': {'description': 'd',
+                          'items': [{'ref': f'1/{i}/1', 'label': ''} for i in range(1, 3)]}}
+    classification = {'assembly1': lineage, 'assembly2': lineage}
+
+    clis = _client_mocks()
+    clis.dfu().get_objects.side_effect = lambda params: {
+        'data': [objs[r] for r in params['object_refs']]}
+    clis.dfu().save_objects.side_effect = lambda params: [
+        _info(params['id'], 100 + i, 2, o['name'], o['type'])
+        for i, o in enumerate(params['objects'])]
+
+    objects_created = process_genome_objs(
+        5, genomeset, '1/20/1', ['1/1/1', '1/2/1'], classification, 1, '214',
+        'GTDB_R08-RS214', clis)
+
+    saves = [c.args[0]['objects'] for c in clis.dfu().save_objects.call_args_list]
+    assert [[o['name'] for o in objects] for objects in saves] == [['genome2'], ['gs']]
+    assert saves[0][0]['data']['assembly_ref'] == '1/12/1'
+    assert saves[0][0]['data']['taxon_assignments'] == {
+        'GTDB_R07-RS207': lineage, 'GTDB_R08-RS214': lineage}
+    assert saves[1][0]['data']['items'] == [{'label': '', 'ref': '1/1/1'},
+                                            {'label': '', 'ref': '5/100/2'}]
+    assert [o['ref'] for o in objects_created] == ['5/100/2', '5/100/2']
+
+    # nothing to write on a rerun of the whole set
+    objs['1/2/1']['data']['taxon_assignments']['GTDB_R08-RS214'] = lineage
+    clis.dfu().save_objects.reset_mock()
+    assert process_genome_objs(
+        5, genomeset, '1/20/1', ['1/1/1', '1/2/1'], classification, 1, '214',
+        'GTDB_R08-RS214', clis) == []
+    clis.dfu().save_objects.assert_not_called()
+
+
+def test_fix_unowned_shock_handles():
+    clis = _client_mocks()
+    clis.handle_owner().own_handles.side_effect = lambda hids: {h: 'new_' + h for h in hids}
+    objs_data = [{'genbank_handle_ref': 'h1', 'gff_handle_ref': 'h2'},
+                 {'gff_handle_ref': 'h3', 'other_ref': 'x'},
+                 {}]
+
+    assert fix_unowned_shock_handles('genome', objs_data, clis) == [
+        {'genbank_handle_ref': 'new_h1', 'gff_handle_ref': 'new_h2'},
+        {'gff_handle_ref': 'new_h3', 'other_ref': 'x'},
+        {}]
+    clis.handle_owner().own_handles.assert_called_once_with(['h1', 'h2', 'h3'])
+
+
+def test_copy_gtdb_genome_objs():
+    ws = create_autospec(Workspace, spec_set=True, instance=True)
+    ws.list_objects.return_value = [
+        _info(5, 1, 3, 'GTDB_SP_REP-RS_1.Genome', 'KBaseGenomes.Genome-17.0')]
+    ws.copy_object.side_effect = lambda params: _info(
+        params['to']['wsid'], params['from']['objid'] + 100, 1, params['to']['name'],
+        'KBaseGenomes.Genome-17.0')
+    src_upas = {'RS_1': '2/1/4', 'RS_2': '2/2/4', 'GB_3': '2/3/4'}
+    clis = _client_mocks()
+    clis.ws.return_value = ws
+    name_index = WorkspaceNameIndex(ws, 5, 'GTDB_SP_REP-')
+    clis.name_index.return_value = name_index
+    clis.object_info().get_info.side_effect = lambda upa: _info(
+        2, int(upa.split('/')[1]), 4, [k for k, v in src_upas.items() if v == upa][0] + '.Genome',
+        'KBaseGenomes.Genome-17.0')
+
+    genome_refs = copy_gtdb_genome_objs(
+        ['GB_3', 'query', 'RS_1', 'RS_2'], src_upas, 'GTDB_SP_REP-', 5, clis, copy_threads=4)
+
+    assert genome_refs == {'GB_3': '5/103/1', 'RS_1': '5/1/3', 'RS_2': '5/102/1'}
+    assert [c.args for c in clis.name_index.call_args_list] == [(5, 'GTDB_SP_REP-')]
+    assert sorted(c.args[0]['to']['name'] for c in ws.copy_object.call_args_list) == [
+        'GTDB_SP_REP-GB_3.Genome', 'GTDB_SP_REP-RS_2.Genome']
+    # the copies are added to the index
+    assert name_index.get_info('GTDB_SP_REP-RS_2.Genome')[0] == 102
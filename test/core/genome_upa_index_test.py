@@ -0,0 +1,36 @@
+import os
+import tempfile
+
+from pathlib import Path
+
+from kb_gtdbtk.core.genome_upa_index import (
+    build_genome_upa_index,
+    get_genome_upa_index_path,
+    has_current_genome_upa_index,
+    GenomeUpaIndex
+)
+
+
+def test_genome_upa_index():
+
+    with tempfile.TemporaryDirectory(prefix='test_genome_upa_index') as test_dir_str:
+        map_file = Path(test_dir_str) / 'Genome_UPAs-GTDB.tsv'
+        map_file.write_text('GCF_000002.1\t1/2/3\nGCA_000001.1\t4/5/6\n')
+        assert not has_current_genome_upa_index(map_file)
+
+        index_path = build_genome_upa_index(map_file)
+
+        assert index_path == get_genome_upa_index_path(map_file)
+        assert index_path == Path(test_dir_str) / 'Genome_UPAs-GTDB.tsv.idx'
+        assert has_current_genome_upa_index(map_file)
+        index = GenomeUpaIndex(index_path)
+        assert dict(index) == {'GCA_000001.1': '4/5/6', 'GCF_000002.1': '1/2/3'}
+        assert list(index) == ['GCA_000001.1', 'GCF_000002.1']
+        assert index['GCF_000002.1'] == '1/2/3'
+        assert 'GCF_000003.1' not in index
+        assert index.get('GCF_000003.1') is None
+
+        # a map file edited after the index was built makes the index stale
+        stat = os.stat(index_path)
+        os.utime(map_file, (stat.st_atime, stat.st_mtime + 10))
+        assert not has_current_genome_upa_index(map_file)
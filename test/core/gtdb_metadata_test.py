@@ -0,0 +1,80 @@
+import tempfile
+
+from pathlib import Path
+
+from pytest import raises
+
+from kb_gtdbtk.core.gtdb_metadata import (
+    build_gtdb_metadata_store,
+    get_gtdb_metadata,
+    get_gtdb_metadata_store_path,
+    GtdbMetadata
+)
+from kb_gtdbtk.core.mmap_table import MmapTable, write_mmap_table
+
+
+def test_mmap_table():
+
+    with tempfile.TemporaryDirectory(prefix='test_mmap_table') as test_dir_str:
+        table_path = Path(test_dir_str) / 'table.idx'
+        rows = [(f'key{i}', [f'a{i}', 'ü' * (i % 3)]) for i in range(1000)]
+        write_mmap_table(table_path, ['a', 'b'], rows + [('key1', ['dup', 'dup'])])
+
+        table = MmapTable(table_path)
+        assert table.columns == ['a', 'b']
+        assert len(table) == 1000
+        assert list(table) == [f'key{i}' for i in range(1000)]
+        assert table['key1'] == ('a1', 'ü')
+        assert table['key999'] == ('a999', '')
+        assert table.get_value('key500', 'b') == 'üü'
+        assert table.get_value('nokey', 'b') is None
+        assert 'key0' in table
+        assert 'nokey' not in table
+        with raises(KeyError):
+            table['nokey']
+
+        write_mmap_table(table_path, ['a'], [])
+        empty = MmapTable(table_path)
+        assert len(empty) == 0
+        assert empty.get('key1') is None
+
+        with raises(ValueError, match='row for key k has 1 values, expected 2'):
+            write_mmap_table(table_path, ['a', 'b'], [('k', ['v'])])
+
+
+def test_gtdb_metadata():
+
+    with tempfile.TemporaryDirectory(prefix='test_gtdb_metadata') as test_dir_str:
+        data_dir = Path(test_dir_str)
+        (data_dir / 'r214').mkdir()
+        assert get_gtdb_metadata(214, data_dir) is None
+        get_gtdb_metadata.cache_clear()
+
+        header = 'accession\tcheckm_completeness\tgtdb_taxonomy\tncbi_organism_name\n'
+        ar_file = data_dir / 'r214' / 'ar53_metadata_r214.tsv'
+        ar_file.write_text(header + 'GB_GCA_000001.1\t99.1\td__Archaea;p__A\tarc one\n')
+        bac_file = data_dir / 'r214' / 'bac120_metadata_r214.tsv'
+        bac_file.write_text(header
+                            + 'RS_GCF_000002.1\t98.0\td__Bacteria;p__B\tbac one\n'
+                            + 'RS_GCF_000003.1\t97.0\td__Bacteria;p__C\tbac two\n')
+
+        store_path = get_gtdb_metadata_store_path(214, data_dir)
+        build_gtdb_metadata_store([ar_file, bac_file], store_path,
+                                  ['gtdb_taxonomy', 'ncbi_organism_name'])
+
+        metadata = get_gtdb_metadata(214, data_dir)
+        assert metadata is get_gtdb_metadata(214, data_dir)
+        assert len(metadata) == 3
+        assert metadata.columns == ['gtdb_taxonomy', 'ncbi_organism_name']
+        assert metadata.get('GCA_000001.1') == {'gtdb_taxonomy': 'd__Archaea;p__A',
+                                                'ncbi_organism_name': 'arc one'}
+        assert metadata.get_value('RS_GCF_000003.1', 'ncbi_organism_name') == 'bac two'
+        assert metadata.get('GCF_000004.1') is None
+        assert 'GB_GCF_000002.1' in metadata
+        assert 'GCF_000004.1' not in metadata
+
+        with raises(ValueError, match='missing columns'):
+            build_gtdb_metadata_store([ar_file], store_path, ['ncbi_taxonomy'])
+        # the failed build does not clobber the store
+        assert len(GtdbMetadata(store_path)) == 3
+        get_gtdb_metadata.cache_clear()
@@ -5,7 +5,8 @@ import tempfile
 
 from pathlib import Path
 
-from kb_gtdbtk.core.gtdbtk_runner import run_gtdbtk
+from kb_gtdbtk.core.gtdbtk_runner import run_gtdbtk, StreamingIdentify, _summary_tsv_to_json
+from kb_gtdbtk.core.classification_cache import ClassificationCache
 
 logging.basicConfig(format='%(created)s %(levelname)s: %(message)s', level=logging.INFO)
 
@@ -135,3 +136,553 @@ def test_gtdbtk_run():
                 {'user_genome': 'somefile1.fasta', 'field1': 'fee', 'field2': 'fie'},
                 {'user_genome': 'somefile2.fasta', 'field1': 'fo', 'field2': 'fum'},
             ]}
+
+
+_SUMMARY_HEADER = ['user_genome', 'classification', 'fastani_reference', 'fastani_reference_radius', 'fastani_taxonomy', 'fastani_ani', 'fastani_af', 'closest_placement_reference', 'closest_placement_radius', 'closest_placement_taxonomy', 'closest_placement_ani', 'closest_placement_af', 'pplacer_taxonomy', 'classification_method', 'note', 'other_related_references', 'msa_percent', 'translation_table', 'red_value', 'warnings']
+
+
+def test_gtdbtk_run_sharded():
+
+    with tempfile.TemporaryDirectory(prefix='test_gtdbtk_run_sharded') as test_dir_str:
+        test_dir = Path(test_dir_str)
+        out_dir = test_dir / 'output'
+        out_dir.mkdir(parents=True, exist_ok=True)
+        temp_dir = test_dir / 'temp'
+        temp_dir.mkdir(parents=True, exist_ok=True)
+
+        commands = []
+
+        def runner(command):
+            commands.append(list(command))
+            assert '--skip_ani_screen' not in command
+            assert command[command.index('--cpus') + 1] == '8'
+
+            temp_out = command[3]
+            with open(command[5]) as bf:
+                ids = [line.rstrip().split('\t')[1] for line in bf]
+
+            temp_classify = Path(temp_out) / 'classify'
+            temp_classify.mkdir(parents=True, exist_ok=True)
+            temp_identify = Path(temp_out) / 'identify'
+            temp_identify.mkdir(parents=True, exist_ok=True)
+
+            with open(temp_classify / 'gtdbtk.bac120.summary.tsv', 'w') as t:
+                t.write('\t'.join(_SUMMARY_HEADER) + '\n')
+                for id_ in ids:
+                    t.write('\t'.join([id_, 'c_' + id_] + ['foo'] * 18) + '\n')
+            with open(temp_identify / 'gtdbtk.bac120.markers_summary.tsv', 'w') as t:
+                t.write('\t'.join(['user_genome', 'field1']) + '\n')
+                for id_ in ids:
+                    t.write('\t'.join([id_, 'fee']) + '\n')
+            with open(temp_classify / 'gtdbtk.bac120.classify.tree', 'w') as t:
+                t.write('(' + ','.join(ids) + ');\n')
+
+        sequences = {Path(f'/somepath{i:03}'): f'somefile{i:03}.fasta' for i in range(120)}
+
+        (classification, summary_tables) = run_gtdbtk(
+            runner, sequences, out_dir, temp_dir, 50.2, 214, 0, 16, cpus_per_shard=8)
+
+        # 16 cpus / 8 per shard
+        assert len(commands) == 2
+        assert len(set(c[3] for c in commands)) == 2
+
+        assert classification == {
+            f'somefile{i:03}.fasta': f'c_id{i}' for i in range(120)}
+        names = [item['user_genome']
+                 for item in summary_tables['gtdbtk.bac120.summary.tsv']['data']]
+        assert names == [f'somefile{i:03}.fasta' for i in range(120)]
+
+        with open(out_dir / 'gtdbtk.bac120.markers_summary.tsv.json') as j:
+            assert len(json.load(j)['data']) == 120
+
+        # the second shard's tree can't overwrite the first
+        assert (out_dir / 'gtdbtk.bac120.classify.tree').is_file()
+        assert (out_dir / 'gtdbtk.bac120.classify-shard1.tree').is_file()
+
+
+def test_gtdbtk_run_second_pass_only_unplaced():
+
+    with tempfile.TemporaryDirectory(prefix='test_gtdbtk_run_second_pass') as test_dir_str:
+        test_dir = Path(test_dir_str)
+        out_dir = test_dir / 'output'
+        out_dir.mkdir(parents=True, exist_ok=True)
+        temp_dir = test_dir / 'temp'
+        temp_dir.mkdir(parents=True, exist_ok=True)
+
+        batch_ids = []
+
+        def runner(command):
+            temp_out = command[3]
+            with open(command[5]) as bf:
+                ids = [line.rstrip().split('\t')[1] for line in bf]
+            batch_ids.append(ids)
+
+            temp_classify = Path(temp_out) / 'classify'
+            temp_classify.mkdir(parents=True, exist_ok=True)
+
+            with open(temp_classify / 'gtdbtk.bac120.summary.tsv', 'w') as t:
+                t.write('\t'.join(_SUMMARY_HEADER) + '\n')
+                for id_ in ids:
+                    if '--skip_ani_screen' in command:
+                        row = [id_, 'N/A'] + ['tree'] * 18
+                    elif id_ == 'id1':
+                        # classified by ANI, not placed
+                        row = [id_, 'ani'] + ['ani'] * 10 + ['N/A'] + ['ani'] * 7
+                    else:
+                        row = [id_, 'tree'] + ['tree'] * 18
+                    t.write('\t'.join(row) + '\n')
+            with open(temp_classify / 'gtdbtk.bac120.classify.tree', 'w') as t:
+                t.write('(' + ','.join(ids) + ');\n')
+
+        run_gtdbtk(
+            runner,
+            {Path('/somepath1'): 'somefile1.fasta',
+             Path('/somepath2'): 'somefile2.fasta',
+             Path('/somepath3'): 'somefile3.fasta',
+             },
+            out_dir,
+            temp_dir,
+            50.2,
+            214,
+            0,
+            16
+            )
+
+        assert batch_ids == [['id0', 'id1', 'id2'], ['id1']]
+
+        with open(out_dir / 'gtdbtk.bac120.summary.tsv.json') as j:
+            data = json.load(j)['data']
+        assert [d['user_genome'] for d in data] == [
+            'somefile1.fasta', 'somefile2.fasta', 'somefile3.fasta']
+        assert data[1]['classification'] == 'ani'
+        assert data[1]['pplacer_taxonomy'] == 'tree'
+
+        with open(out_dir / 'gtdbtk.bac120.classify.tree') as t:
+            assert t.read() == '(id0,id1,id2);\n'
+        with open(out_dir / 'gtdbtk.bac120.classify-skip_ani.tree') as t:
+            assert t.read() == '(id1);\n'
+
+
+def test_gtdbtk_run_with_cache():
+
+    with tempfile.TemporaryDirectory(prefix='test_gtdbtk_run_with_cache') as test_dir_str:
+        test_dir = Path(test_dir_str)
+        cache = ClassificationCache(test_dir / 'cache', 1024 * 1024)
+        fasta_dir = test_dir / 'fastas'
+        fasta_dir.mkdir()
+        for i in range(3):
+            with open(fasta_dir / f'f{i}.fa', 'w') as f:
+                f.write(f'>contig{i}\nACGT{"A" * i}\n')
+
+        batch_ids = []
+
+        def runner(command):
+            temp_out = command[3]
+            with open(command[5]) as bf:
+                batch = [line.rstrip().split('\t') for line in bf]
+            ids = [id_ for (_, id_) in batch]
+            batch_ids.append(ids)
+
+            temp_classify = Path(temp_out) / 'classify'
+            temp_classify.mkdir(parents=True, exist_ok=True)
+            temp_identify = Path(temp_out) / 'identify'
+            temp_identify.mkdir(parents=True, exist_ok=True)
+            with open(temp_classify / 'gtdbtk.bac120.summary.tsv', 'w') as t:
+                t.write('\t'.join(_SUMMARY_HEADER) + '\n')
+                for (link, id_) in batch:
+                    t.write('\t'.join([id_, 'c_' + os.readlink(link)] + ['foo'] * 18) + '\n')
+            with open(temp_identify / 'gtdbtk.bac120.markers_summary.tsv', 'w') as t:
+                t.write('\t'.join(['user_genome', 'field1']) + '\n')
+                for id_ in ids:
+                    t.write('\t'.join([id_, 'fee']) + '\n')
+
+        def run(sequences, run_no, trees_required=False):
+            out_dir = test_dir / f'output{run_no}'
+            out_dir.mkdir()
+            temp_dir = test_dir / f'temp{run_no}'
+            temp_dir.mkdir()
+            return run_gtdbtk(runner, sequences, out_dir, temp_dir, 50.2, 214, 0, 16,
+                              cache=cache, trees_required=trees_required)
+
+        (classification, _) = run({fasta_dir / 'f0.fa': 'f0.fa',
+                                   fasta_dir / 'f1.fa': 'f1.fa'}, 1)
+        assert batch_ids == [['id0', 'id1']]
+
+        # f0 and f1 are cached, only f2 needs classifying. The cached results keep their
+        # classification even though they now have different ids
+        (classification, summary_tables) = run({fasta_dir / 'f0.fa': 'f0.fa',
+                                                fasta_dir / 'f1.fa': 'f1.fa',
+                                                fasta_dir / 'f2.fa': 'f2.fa'}, 2)
+        assert batch_ids == [['id0', 'id1'], ['id2']]
+        assert classification == {
+            'f0.fa': 'c_' + str(fasta_dir / 'f0.fa'),
+            'f1.fa': 'c_' + str(fasta_dir / 'f1.fa'),
+            'f2.fa': 'c_' + str(fasta_dir / 'f2.fa'),
+        }
+        assert sorted(d['user_genome'] for d in summary_tables[
+            'gtdbtk.bac120.markers_summary.tsv']['data']) == ['f0.fa', 'f1.fa', 'f2.fa']
+        # the cached queries are listed for the report, as they're not in the trees
+        assert (test_dir / 'output2' / 'id_to_name-cached.map').read_text() == (
+            'id0\tf0.fa\nid1\tf1.fa\n')
+        assert not (test_dir / 'output1' / 'id_to_name-cached.map').exists()
+
+        # everything cached, GTDB-tk isn't run
+        (classification, _) = run({fasta_dir / 'f2.fa': 'f2.fa',
+                                   fasta_dir / 'f0.fa': 'f0.fa'}, 3)
+        assert len(batch_ids) == 2
+        assert classification == {
+            'f0.fa': 'c_' + str(fasta_dir / 'f0.fa'),
+            'f2.fa': 'c_' + str(fasta_dir / 'f2.fa'),
+        }
+
+        # everything cached, but the trees need all the genomes so GTDB-tk is run on them
+        (classification, _) = run({fasta_dir / 'f2.fa': 'f2.fa',
+                                   fasta_dir / 'f0.fa': 'f0.fa'}, 4, trees_required=True)
+        assert batch_ids == [['id0', 'id1'], ['id2'], ['id0', 'id1']]
+        assert classification == {
+            'f0.fa': 'c_' + str(fasta_dir / 'f0.fa'),
+            'f2.fa': 'c_' + str(fasta_dir / 'f2.fa'),
+        }
+
+
+def test_gtdbtk_run_streaming_identify():
+
+    with tempfile.TemporaryDirectory(prefix='test_gtdbtk_run_streaming') as test_dir_str:
+        test_dir = Path(test_dir_str)
+        out_dir = test_dir / 'output'
+        out_dir.mkdir(parents=True, exist_ok=True)
+        temp_dir = test_dir / 'temp'
+        temp_dir.mkdir(parents=True, exist_ok=True)
+
+        commands = []
+
+        def runner(command):
+            commands.append(command[:2])
+            args = dict(zip(command[2::2], command[3::2]))
+            if command[1] == 'identify':
+                with open(args['--batchfile']) as bf:
+                    ids = [line.rstrip().split('\t')[1] for line in bf]
+                identify = Path(args['--out_dir']) / 'identify'
+                for id_ in ids:
+                    genes = identify / 'intermediate_results' / 'marker_genes' / id_
+                    genes.mkdir(parents=True)
+                    (genes / (id_ + '_protein.faa')).touch()
+                with open(identify / 'gtdbtk.bac120.markers_summary.tsv', 'w') as t:
+                    t.write('\t'.join(['name', 'number_unique_genes']) + '\n')
+                    for id_ in ids:
+                        t.write('\t'.join([id_, '100']) + '\n')
+            elif command[1] == 'align':
+                # the chunks are merged into one identify dir
+                identify = Path(args['--identify_dir']) / 'identify'
+                assert sorted(os.listdir(identify / 'intermediate_results' / 'marker_genes')) == [
+                    'id0', 'id1', 'id2']
+                with open(identify / 'gtdbtk.bac120.markers_summary.tsv') as t:
+                    assert [line.split('\t')[0] for line in t] == ['name', 'id0', 'id1', 'id2']
+                assert args['--min_perc_aa'] == '50.2'
+            elif command[1] == 'classify':
+                assert args['--align_dir'] == args['--out_dir']
+                with open(args['--batchfile']) as bf:
+                    ids = [line.rstrip().split('\t')[1] for line in bf]
+                temp_classify = Path(args['--out_dir']) / 'classify'
+                temp_classify.mkdir(parents=True, exist_ok=True)
+                with open(temp_classify / 'gtdbtk.bac120.summary.tsv', 'w') as t:
+                    t.write('\t'.join(_SUMMARY_HEADER) + '\n')
+                    for id_ in ids:
+                        t.write('\t'.join([id_, 'c_' + id_] + ['tree'] * 18) + '\n')
+                with open(temp_classify / 'gtdbtk.bac120.classify.tree', 'w') as t:
+                    t.write('(' + ','.join(ids) + ');\n')
+            else:
+                assert 0, f'unexpected command {command}'
+
+        def identify(temp_dir):
+            streaming = StreamingIdentify(runner, temp_dir, 214, 16, 2)
+            streaming.add(Path('/somepath2'), 'somefile2.fasta.gz')
+            streaming.add(Path('/somepath1'), 'somefile1.fasta')
+            streaming.add(Path('/somepath1'), 'somefile1.fasta')  # duplicates are ignored
+            streaming.add(Path('/somepath3'), 'somefile3.fasta')
+            return streaming.finish()
+
+        identified = identify(temp_dir)
+        assert identified.id_to_name == {
+            'id0': 'somefile2.fasta', 'id1': 'somefile1.fasta', 'id2': 'somefile3.fasta'}
+        assert len(identified.identify_dirs) == 2
+
+        (classification, summary_tables) = run_gtdbtk(
+            runner, {}, out_dir, temp_dir, 50.2, 214, 0, 16, identified=identified)
+
+        assert commands == [['gtdbtk', 'identify'], ['gtdbtk', 'identify'],
+                            ['gtdbtk', 'align'], ['gtdbtk', 'classify']]
+        assert classification == {
+            'somefile2.fasta': 'c_id0',
+            'somefile1.fasta': 'c_id1',
+            'somefile3.fasta': 'c_id2',
+        }
+        # as for classify_wf, the intermediate results are removed unless they're kept
+        assert not (out_dir / 'runtime_output' / 'identify' / 'intermediate_results').exists()
+
+        out_dir_keep = test_dir / 'output_keep'
+        out_dir_keep.mkdir()
+        temp_dir_keep = test_dir / 'temp_keep'
+        temp_dir_keep.mkdir()
+        run_gtdbtk(runner, {}, out_dir_keep, temp_dir_keep, 50.2, 214, 1, 16,
+                   identified=identify(temp_dir_keep))
+        genes = out_dir_keep / 'runtime_output' / 'identify' / 'intermediate_results'
+        assert sorted(os.listdir(genes / 'marker_genes')) == ['id0', 'id1', 'id2']
+
+
+def test_gtdbtk_run_streaming_identify_with_cache():
+
+    with tempfile.TemporaryDirectory(prefix='test_gtdbtk_run_streaming_cache') as test_dir_str:
+        test_dir = Path(test_dir_str)
+        out_dir = test_dir / 'output'
+        out_dir.mkdir(parents=True, exist_ok=True)
+        temp_dir = test_dir / 'temp'
+        temp_dir.mkdir(parents=True, exist_ok=True)
+        fasta_dir = test_dir / 'fastas'
+        fasta_dir.mkdir()
+        for i in range(3):
+            with open(fasta_dir / f'f{i}.fa', 'w') as f:
+                f.write(f'>contig{i}\nACGT{"A" * i}\n')
+        cache = ClassificationCache(test_dir / 'cache', 1024 * 1024)
+        cache.put(cache.get_key(fasta_dir / 'f1.fa', 214, 50.2), {
+            'gtdbtk.bac120.summary.tsv': [_SUMMARY_HEADER, ['id7', 'c_cached'] + ['foo'] * 18]
+        })
+
+        identify_ids = []
+
+        def runner(command):
+            args = dict(zip(command[2::2], command[3::2]))
+            if command[1] == 'align':
+                return
+            with open(args['--batchfile']) as bf:
+                ids = [line.rstrip().split('\t')[1] for line in bf]
+            if command[1] == 'identify':
+                identify_ids.append(ids)
+                identify = Path(args['--out_dir']) / 'identify'
+                identify.mkdir(parents=True)
+                with open(identify / 'gtdbtk.bac120.markers_summary.tsv', 'w') as t:
+                    t.write('\t'.join(['name', 'number_unique_genes']) + '\n')
+                    for id_ in ids:
+                        t.write('\t'.join([id_, '100']) + '\n')
+            elif command[1] == 'classify':
+                temp_classify = Path(args['--out_dir']) / 'classify'
+                temp_classify.mkdir(parents=True, exist_ok=True)
+                with open(temp_classify / 'gtdbtk.bac120.summary.tsv', 'w') as t:
+                    t.write('\t'.join(_SUMMARY_HEADER) + '\n')
+                    for id_ in ids:
+                        t.write('\t'.join([id_, 'c_' + id_] + ['foo'] * 18) + '\n')
+
+        streaming = StreamingIdentify(runner, temp_dir, 214, 16, 1, cache, 50.2)
+        for i in range(3):
+            streaming.add(fasta_dir / f'f{i}.fa', f'f{i}.fa')
+        identified = streaming.finish()
+
+        # the cached genome isn't run through identify
+        assert identify_ids == [['id0'], ['id2']]
+        assert list(identified.cached_rows) == ['id1']
+
+        (classification, _) = run_gtdbtk(
+            runner, {}, out_dir, temp_dir, 50.2, 214, 0, 16, cache=cache, identified=identified)
+
+        assert classification == {
+            'f0.fa': 'c_id0',
+            'f1.fa': 'c_cached',
+            'f2.fa': 'c_id2',
+        }
+        # the new results are cached
+        assert cache.get(cache.get_key(fasta_dir / 'f2.fa', 214, 50.2)) is not None
+
+
+def test_gtdbtk_run_checkpoint_stages_resume():
+
+    with tempfile.TemporaryDirectory(prefix='test_gtdbtk_run_checkpoint') as test_dir_str:
+        test_dir = Path(test_dir_str)
+        temp_dir = test_dir / 'temp'
+        temp_dir.mkdir()
+        fasta_dir = test_dir / 'fastas'
+        fasta_dir.mkdir()
+        for i in range(2):
+            with open(fasta_dir / f'f{i}.fa', 'w') as f:
+                f.write(f'>contig{i}\nACGT{"A" * i}\n')
+
+        commands = []
+        fail_classify = [True]
+
+        def runner(command):
+            commands.append(command[1])
+            args = dict(zip(command[2::2], command[3::2]))
+            out_dir = Path(args['--out_dir'])
+            if command[1] == 'identify':
+                identify = out_dir / 'identify'
+                (identify / 'intermediate_results' / 'marker_genes').mkdir(parents=True)
+                (identify / 'gtdbtk.bac120.markers_summary.tsv').write_text(
+                    'name\tfield1\nid0\tfee\nid1\tfee\n')
+            elif command[1] == 'align':
+                assert (Path(args['--identify_dir']) / 'identify').is_dir()
+                (out_dir / 'align').mkdir(parents=True, exist_ok=True)
+            elif command[1] == 'classify':
+                assert (Path(args['--align_dir']) / 'align').is_dir()
+                temp_classify = out_dir / 'classify'
+                temp_classify.mkdir(parents=True, exist_ok=True)
+                assert not (temp_classify / 'partial').exists()
+                (temp_classify / 'partial').touch()
+                if fail_classify[0]:
+                    raise ValueError('preempted')
+                with open(temp_classify / 'gtdbtk.bac120.summary.tsv', 'w') as t:
+                    t.write('\t'.join(_SUMMARY_HEADER) + '\n')
+                    for id_ in ['id0', 'id1']:
+                        t.write('\t'.join([id_, 'c_' + id_] + ['tree'] * 18) + '\n')
+                with open(temp_classify / 'gtdbtk.bac120.classify.tree', 'w') as t:
+                    t.write('(id0,id1);\n')
+            else:
+                assert 0, f'unexpected command {command}'
+
+        def run(run_no, keep_intermediates=0):
+            out_dir = test_dir / f'output{run_no}'
+            out_dir.mkdir()
+            return run_gtdbtk(runner,
+                              {fasta_dir / 'f0.fa': 'f0.fa', fasta_dir / 'f1.fa': 'f1.fa'},
+                              out_dir, temp_dir, 50.2, 214, keep_intermediates, 16,
+                              checkpoint_stages=True)
+
+        try:
+            run(1)
+            assert 0, 'expected exception'
+        except ValueError as e:
+            assert str(e) == 'preempted'
+        assert commands == ['identify', 'align', 'classify']
+
+        # identify and align aren't re-run, and the partial classify output is removed
+        fail_classify[0] = False
+        (classification, _) = run(2)
+        assert commands == ['identify', 'align', 'classify', 'classify']
+        assert classification == {'f0.fa': 'c_id0', 'f1.fa': 'c_id1'}
+        [checkpoint_dir] = list((temp_dir / 'checkpoints').iterdir())
+        with open(checkpoint_dir / 'checkpoint.json') as m:
+            assert json.load(m) == {'completed_stages': ['identify', 'align', 'classify']}
+        # as for classify_wf, the intermediate results are removed unless they're kept
+        assert not (checkpoint_dir / 'identify' / 'intermediate_results').exists()
+        assert not (test_dir / 'output2' / 'runtime_output' / 'identify' /
+                    'intermediate_results').exists()
+
+
+def test_gtdbtk_run_checkpoint_stages_keep_intermediates():
+
+    with tempfile.TemporaryDirectory(prefix='test_gtdbtk_run_checkpoint') as test_dir_str:
+        test_dir = Path(test_dir_str)
+        out_dir = test_dir / 'output'
+        out_dir.mkdir()
+        temp_dir = test_dir / 'temp'
+        temp_dir.mkdir()
+        fasta_dir = test_dir / 'fastas'
+        fasta_dir.mkdir()
+        (fasta_dir / 'f0.fa').write_text('>contig0\nACGT\n')
+
+        def runner(command):
+            args = dict(zip(command[2::2], command[3::2]))
+            out = Path(args['--out_dir'])
+            (out / command[1] / 'intermediate_results').mkdir(parents=True, exist_ok=True)
+            if command[1] == 'classify':
+                with open(out / 'classify' / 'gtdbtk.bac120.summary.tsv', 'w') as t:
+                    t.write('\t'.join(_SUMMARY_HEADER) + '\n')
+                    t.write('\t'.join(['id0', 'c_id0'] + ['tree'] * 18) + '\n')
+                with open(out / 'classify' / 'gtdbtk.bac120.classify.tree', 'w') as t:
+                    t.write('(id0,ref);\n')
+
+        run_gtdbtk(runner, {fasta_dir / 'f0.fa': 'f0.fa'}, out_dir, temp_dir, 50.2, 214, 1, 16,
+                   checkpoint_stages=True)
+
+        [checkpoint_dir] = list((temp_dir / 'checkpoints').iterdir())
+        for stage in ['identify', 'align', 'classify']:
+            assert (checkpoint_dir / stage / 'intermediate_results').is_dir()
+            assert (out_dir / 'runtime_output' / stage / 'intermediate_results').is_dir()
+
+
+def test_summary_tsv_to_json_types():
+    # values are typed per column as pandas typed them, with missing and falsy values as '-'
+
+    with tempfile.TemporaryDirectory(prefix='test_summary_tsv_to_json') as test_dir_str:
+        tsv = Path(test_dir_str) / 'gtdbtk.bac120.summary.tsv'
+        with open(tsv, 'w') as t:
+            t.write('\n'.join([
+                '\t'.join(['user_genome', 'classification', 'fastani_ani', 'translation_table',
+                           'msa_percent', 'red_value', 'note', 'zeros', 'mixed']),
+                '\t'.join(['id0', 'd__Bacteria', '98.52', '11', '95', '0.123456789012', '',
+                           '0', '1']),
+                '\t'.join(['id1', 'N/A', 'N/A', '4', 'N/A', '0.5', 'some note', '0', 'a']),
+            ]) + '\n')
+        classification = dict()
+
+        ret = _summary_tsv_to_json(tsv, str(tsv) + '.json', {'id0': 'f0', 'id1': 'f1'},
+                                   classification)
+
+        expected = {'data': [
+            {'user_genome': 'f0', 'classification': 'd__Bacteria', 'fastani_ani': 98.52,
+             'translation_table': 11, 'msa_percent': 95.0, 'red_value': 0.123456789,
+             'note': '-', 'zeros': '-', 'mixed': '1'},
+            {'user_genome': 'f1', 'classification': '-', 'fastani_ani': '-',
+             'translation_table': 4, 'msa_percent': '-', 'red_value': 0.5,
+             'note': 'some note', 'zeros': '-', 'mixed': 'a'},
+        ]}
+        assert ret == expected
+        with open(str(tsv) + '.json') as j:
+            assert json.load(j) == expected
+        assert classification == {'f0': 'd__Bacteria', 'f1': '-'}
+
+
+def test_gtdbtk_run_runtime_output_modes():
+
+    temp_outputs = []
+
+    def runner(command):
+        temp_out = Path(command[3])
+        temp_outputs.append(temp_out)
+        with open(command[5]) as bf:
+            ids = [line.rstrip().split('\t')[1] for line in bf]
+        (temp_out / 'classify').mkdir(parents=True, exist_ok=True)
+        with open(temp_out / 'classify' / 'gtdbtk.bac120.summary.tsv', 'w') as t:
+            t.write('\t'.join(_SUMMARY_HEADER) + '\n')
+            for id_ in ids:
+                t.write('\t'.join([id_, 'c_' + id_] + ['tree'] * 18) + '\n')
+        (temp_out / 'classify' / 'gtdbtk.bac120.classify.tree').write_text('(id0);\n')
+        genes = temp_out / 'identify' / 'intermediate_results' / 'marker_genes' / 'id0'
+        genes.mkdir(parents=True)
+        (genes / 'id0_protein.faa').write_text('>g\nM\n')
+        (temp_out / 'align').mkdir()
+        (temp_out / 'align' / 'gtdbtk.bac120.msa.fasta.gz').write_bytes(b'msa')
+        (temp_out / 'gtdbtk.log').write_text('log\n')
+
+    with tempfile.TemporaryDirectory(prefix='test_gtdbtk_run_runtime_output') as test_dir_str:
+        test_dir = Path(test_dir_str)
+
+        def run(mode, report_files_only):
+            out_dir = test_dir / ('output_' + mode)
+            out_dir.mkdir()
+            temp_dir = test_dir / ('temp_' + mode)
+            temp_dir.mkdir()
+            run_gtdbtk(runner, {Path('/somepath1'): 'somefile1.fasta'}, out_dir, temp_dir,
+                       50.2, 214, 0, 16, runtime_output_mode=mode,
+                       runtime_output_report_files_only=report_files_only)
+            return (out_dir, temp_outputs[-1])
+
+        (out_dir, temp_output) = run('hardlink', True)
+        runtime_output = out_dir / 'runtime_output'
+        assert sorted(str(p.relative_to(runtime_output))
+                      for p in runtime_output.rglob('*') if p.is_file()) == [
+            'classify/gtdbtk.bac120.classify.tree',
+            'classify/gtdbtk.bac120.summary.tsv',
+            'gtdbtk.log',
+        ]
+        src_tree = temp_output / 'classify' / 'gtdbtk.bac120.classify.tree'
+        assert os.path.samefile(src_tree, out_dir / 'gtdbtk.bac120.classify.tree')
+        assert os.path.samefile(src_tree, runtime_output / 'classify' / src_tree.name)
+
+        (out_dir, temp_output) = run('move', False)
+        runtime_output = out_dir / 'runtime_output'
+        assert not temp_output.exists()
+        assert (runtime_output / 'align' / 'gtdbtk.bac120.msa.fasta.gz').read_bytes() == b'msa'
+        assert (runtime_output / 'identify' / 'intermediate_results' / 'marker_genes' / 'id0' /
+                'id0_protein.faa').is_file()
+        assert (out_dir / 'gtdbtk.bac120.classify.tree').read_text() == '(id0);\n'
+        with open(out_dir / 'gtdbtk.bac120.summary.tsv.json') as j:
+            assert json.load(j)['data'][0]['classification'] == 'c_id0'
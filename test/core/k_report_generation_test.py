@@ -1,18 +1,22 @@
 import uuid
 import tempfile
+import zipfile
 
 from pathlib import Path
 from unittest.mock import create_autospec
 
 from kb_gtdbtk.core.kb_report_generation import generate_report
 from kb_gtdbtk.core.kb_client_set import KBClients
+from installed_clients.DataFileUtilClient import DataFileUtil
 from installed_clients.KBaseReportClient import KBaseReport
 
 
 def _client_mocks():
     clis = create_autospec(KBClients, spec_set=True, instance=True)
+    dfu = create_autospec(DataFileUtil, spec_set=True, instance=True)
     report = create_autospec(KBaseReport, spec_set=True, instance=True)
 
+    clis.dfu.return_value = dfu
     clis.report.return_value = report
     return clis
 
@@ -21,8 +25,14 @@ def test_create_report():
     clis = _client_mocks()
 
     with tempfile.TemporaryDirectory(prefix='test_create_report') as test_dir_str:
-        test_dir = Path(test_dir_str)
+        test_dir = Path(test_dir_str) / 'output'
+        (test_dir / 'runtime_output' / 'intermediate_results').mkdir(parents=True)
+        (test_dir / 'gtdbtk.bac120.summary.json').write_text('{"data": []}')
+        (test_dir / 'tree-circle.PNG').write_bytes(b'png')
+        (test_dir / 'runtime_output' / 'gtdbtk.log').write_text('log')
+        (test_dir / 'runtime_output' / 'intermediate_results' / 'x.faa').write_text('>x')
 
+        clis.dfu().file_to_shock.return_value = {'shock_id': 'fake_shock_id'}
         clis.report().create_extended_report.return_value = {
             'ref': '78/5/1',
             'name': 'GTDBTk_report_bd5c9ba0-db2c-4c03-b2de-92d9c94ce51e'
@@ -30,10 +40,24 @@ def test_create_report():
 
         ret = generate_report(
             clis, test_dir, 78, None, [],
-            uuid_gen=lambda: uuid.UUID('bd5c9ba0-db2c-4c03-b2de-92d9c94ce51e'))
+            uuid_gen=lambda: uuid.UUID('bd5c9ba0-db2c-4c03-b2de-92d9c94ce51e'),
+            archive_exclude=['runtime_output/intermediate_results'])
 
         shock_id = ret['archive_shock_id']
-        
+        assert shock_id == 'fake_shock_id'
+        archive_path = Path(test_dir_str) / 'GTDB-Tk_classify_wf.zip'
+        clis.dfu().file_to_shock.assert_called_once_with(
+            {'file_path': str(archive_path), 'make_handle': 0})
+        with zipfile.ZipFile(archive_path) as z:
+            assert z.testzip() is None
+            assert [(i.filename, i.compress_type) for i in z.infolist()] == [
+                ('gtdbtk.bac120.summary.json', zipfile.ZIP_DEFLATED),
+                ('index.html', zipfile.ZIP_DEFLATED),
+                ('tree-circle.PNG', zipfile.ZIP_STORED),
+                ('runtime_output/gtdbtk.log', zipfile.ZIP_DEFLATED),
+            ]
+            assert z.read('runtime_output/gtdbtk.log') == b'log'
+
         assert ret == {
             'report_ref': '78/5/1',
             'report_name': 'GTDBTk_report_bd5c9ba0-db2c-4c03-b2de-92d9c94ce51e',
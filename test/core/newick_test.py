@@ -0,0 +1,66 @@
+from pytest import importorskip, raises
+
+from kb_gtdbtk.core.newick import parse_newick
+
+
+TEST_NEWICK = ("(('GB_GCA_1.1':0.1,(id1:0.25,'B; x':1e-7)'100.0:g__x':0.5)f__y:0.123456789,"
+               + "D:2,(E:1,F:1,G:1):0)root;")
+
+
+def test_parse_newick():
+    tree = parse_newick(TEST_NEWICK)
+
+    assert len(tree) == 11
+    assert tree.parents.tolist() == [-1, 0, 1, 1, 3, 3, 0, 0, 7, 7, 7]
+    assert tree.names() == ['root', 'f__y', 'GB_GCA_1.1', '100.0:g__x', 'id1', 'B; x', 'D', '',
+                            'E', 'F', 'G']
+    assert tree.name(3) == '100.0:g__x'
+    assert tree.dists.tolist() == [1.0, 0.123456789, 0.1, 0.5, 0.25, 1e-7, 2, 0, 1, 1, 1]
+    assert tree.leaves().tolist() == [2, 4, 5, 6, 8, 9, 10]
+    assert tree.leaf_names() == ['GB_GCA_1.1', 'id1', 'B; x', 'D', 'E', 'F', 'G']
+    assert tree.leaf_ancestors()[1] == ('id1', ['100.0:g__x', 'f__y', 'root'])
+    assert tree.leaf_ancestors()[3] == ('D', ['root'])
+
+    assert parse_newick('(,(a,b));').leaf_names() == ['', 'a', 'b']
+    assert parse_newick('A;').write() == 'A:1;'
+
+
+def test_parse_newick_comments():
+    # unlike ete3, which keeps them in the node name, comments are dropped
+    tree = parse_newick("(A[comment]:1,(B:2[&&NHX:x=1,y=2],C)[c]'D[x]':3)[root comment];")
+
+    assert tree.names() == ['', 'A', 'D[x]', 'B', 'C']
+    assert tree.dists.tolist() == [1.0, 1, 3, 2, 1.0]
+
+
+def test_ladderize_and_write():
+    tree = parse_newick(TEST_NEWICK)
+    tree.ladderize()
+
+    assert tree.leaf_names() == ['D', 'GB_GCA_1.1', 'id1', 'B; x', 'E', 'F', 'G']
+    assert tree.write() == ('(D:2,(GB_GCA_1.1:0.1,(id1:0.25,B_ x:1e-07)1:0.5)1:0.123457,'
+                            + '(E:1,F:1,G:1)1:0);')
+
+
+def test_parse_newick_fail():
+    for newick, err in [('((a,b);', 'Newick has an unmatched ('),
+                        ('(a,b));', 'Newick has an unmatched )'),
+                        ('(a,b),c;', 'Newick has more than one root'),
+                        ('(a:x,b);', 'Newick has an invalid branch length x'),
+                        (';', 'Newick has no nodes'),
+                        ]:
+        with raises(ValueError, match=err.replace('(', r'\(').replace(')', r'\)')):
+            parse_newick(newick)
+
+
+def test_matches_ete3():
+    ete3 = importorskip('ete3')
+
+    ete3_tree = ete3.Tree(TEST_NEWICK, quoted_node_names=True, format=1)
+    tree = parse_newick(TEST_NEWICK)
+    assert tree.leaf_names() == ete3_tree.get_leaf_names()
+    assert tree.leaf_ancestors() == [(leaf.name, [a.name for a in leaf.get_ancestors()])
+                                     for leaf in ete3_tree.get_leaves()]
+    ete3_tree.ladderize()
+    tree.ladderize()
+    assert tree.write() == ete3_tree.write()
@@ -0,0 +1,93 @@
+from unittest.mock import call, create_autospec
+
+from kb_gtdbtk.core.object_cache import CachingDataFileUtil, CachingWorkspace, ObjectCache
+from installed_clients.DataFileUtilClient import DataFileUtil
+from installed_clients.WorkspaceClient import Workspace
+
+
+def _obj(upa, size=10):
+    (wsid, objid, ver) = upa.split('/')
+    return {'info': [int(objid), 'name', 'KBaseSets.GenomeSet-1.0', 'date', int(ver), 'user',
+                     int(wsid), 'ws', 'md5', size, {}],
+            'data': {'items': [{'ref': '1/2/3'}]}}
+
+
+def test_dfu_get_objects():
+    dfu = create_autospec(DataFileUtil, spec_set=True, instance=True)
+    objs = {'1/1/1': _obj('1/1/1'), '1/2': _obj('1/2/5'), '1/3/1': _obj('1/3/1', 200)}
+    dfu.get_objects.side_effect = lambda params: {
+        'data': [objs[r] for r in params['object_refs']]}
+    cdfu = CachingDataFileUtil(dfu, ObjectCache(100))
+
+    for _ in range(3):
+        assert cdfu.get_objects({'object_refs': ['1/1/1', '1/2', '1/3/1']}) == {
+            'data': [objs['1/1/1'], objs['1/2'], objs['1/3/1']]}
+    # stored on the second fetch, apart from the object that is bigger than the cache
+    assert dfu.get_objects.call_args_list == [
+        call({'object_refs': ['1/1/1', '1/2', '1/3/1']}),
+        call({'object_refs': ['1/1/1', '1/2', '1/3/1']}),
+        call({'object_refs': ['1/3/1']}),
+    ]
+
+    # callers get their own copy
+    cdfu.get_objects({'object_refs': ['1/1/1']})['data'][0]['data']['items'].clear()
+    assert cdfu.get_objects({'object_refs': ['1/1/1']})['data'][0] == objs['1/1/1']
+
+    # a save drops the objects fetched without a version
+    dfu.get_objects.reset_mock()
+    cdfu.save_objects({'id': 1, 'objects': []})
+    dfu.save_objects.assert_called_once_with({'id': 1, 'objects': []})
+    cdfu.get_objects({'object_refs': ['1/1/1', '1/2']})
+    dfu.get_objects.assert_called_once_with({'object_refs': ['1/2']})
+
+    # other parameters bypass the cache
+    dfu.get_objects.reset_mock()
+    cdfu.get_objects({'object_refs': ['1/1/1'], 'ignore_errors': 1})
+    dfu.get_objects.assert_called_once_with({'object_refs': ['1/1/1'], 'ignore_errors': 1})
+
+
+def test_ws_get_objects2():
+    ws = create_autospec(Workspace, spec_set=True, instance=True)
+    ws.get_objects2.side_effect = lambda params: {
+        'data': [_obj('1/2/3') for _ in params['objects']]}
+    cws = CachingWorkspace(ws, ObjectCache(25))
+
+    specs = [{'ref': '1/2/3', 'included': ['/items']},
+             {'wsid': 1, 'objid': 2, 'ver': 3},
+             {'ref': '1/2/3', 'batch': True}]
+    for _ in range(3):
+        assert cws.get_objects2({'objects': specs}) == {'data': [_obj('1/2/3')] * 3}
+    assert ws.get_objects2.call_args_list == [call({'objects': specs})] * 2 + [
+        call({'objects': [specs[2]]})]
+
+    # the least recently used object is dropped to stay under the size limit
+    ws.get_objects2.reset_mock()
+    for _ in range(2):
+        cws.get_objects2({'objects': [{'ref': '4/5/6'}]})
+    cws.get_objects2({'objects': specs[:2]})
+    assert ws.get_objects2.call_args_list == [call({'objects': [{'ref': '4/5/6'}]})] * 2 + [
+        call({'objects': [specs[0]]})]
+
+    ws.copy_object.return_value = ['info']
+    assert cws.copy_object({'from': {'ref': '1/2/3'}, 'to': {'wsid': 1, 'name': 'x'}}) == ['info']
+    assert cws.get_object_info3 is ws.get_object_info3
+
+
+def test_dfu_and_ws_share_cache():
+    # the same object is returned in different forms by DataFileUtil and the workspace, so
+    # one client's results are never returned by the other
+    dfu = create_autospec(DataFileUtil, spec_set=True, instance=True)
+    dfu_obj = _obj('1/2/3')
+    dfu_obj['dfu'] = True
+    dfu.get_objects.return_value = {'data': [dfu_obj]}
+    ws = create_autospec(Workspace, spec_set=True, instance=True)
+    ws.get_objects2.return_value = {'data': [_obj('1/2/3')]}
+    cache = ObjectCache(100)
+    cdfu = CachingDataFileUtil(dfu, cache)
+    cws = CachingWorkspace(ws, cache)
+
+    for _ in range(3):
+        assert cdfu.get_objects({'object_refs': ['1/2/3']}) == {'data': [dfu_obj]}
+        assert cws.get_objects2({'objects': [{'ref': '1/2/3'}]}) == {'data': [_obj('1/2/3')]}
+    assert dfu.get_objects.call_count == 2
+    assert ws.get_objects2.call_count == 2
@@ -0,0 +1,50 @@
+from unittest.mock import call, create_autospec
+
+from kb_gtdbtk.core.object_info import ObjectInfoCache
+from installed_clients.WorkspaceClient import Workspace
+
+
+def _info(wsid, objid, ver, name):
+    return [objid, name, 'KBaseGenomes.Genome-1.0', 'date', ver, 'user', wsid, 'ws', 'md5', 10,
+            {}]
+
+
+INFOS = {'1/2/3': _info(1, 2, 3, 'g1'),
+         '1/4': _info(1, 4, 7, 'g2'),
+         '5/6/1;1/8/2': _info(1, 8, 2, 'a1'),
+         '1/9/1': _info(1, 9, 1, 'g3'),
+         }
+
+
+def _ws_mock():
+    ws = create_autospec(Workspace, spec_set=True, instance=True)
+    ws.get_object_info3.side_effect = lambda params: {
+        'infos': [INFOS[o['ref']] for o in params['objects']]}
+    return ws
+
+
+def test_get_infos_batches_and_memoizes():
+    ws = _ws_mock()
+    cache = ObjectInfoCache(ws, batch_size=2)
+
+    assert cache.get_infos(['1/2/3', '1/4', '1/2/3', '5/6/1;1/8/2']) == [
+        INFOS['1/2/3'], INFOS['1/4'], INFOS['1/2/3'], INFOS['5/6/1;1/8/2']]
+    assert ws.get_object_info3.call_args_list == [
+        call({'objects': [{'ref': '1/2/3'}, {'ref': '1/4'}]}),
+        call({'objects': [{'ref': '5/6/1;1/8/2'}]}),
+    ]
+
+    # versioned refs and the resolved UPAs are remembered, unversioned refs are not
+    ws.get_object_info3.reset_mock()
+    assert cache.get_info('1/2/3') == INFOS['1/2/3']
+    assert cache.get_info('1/4/7') == INFOS['1/4']
+    assert cache.get_info('5/6/1;1/8/2') == INFOS['5/6/1;1/8/2']
+    assert cache.get_info('1/8/2') == INFOS['5/6/1;1/8/2']
+    ws.get_object_info3.assert_not_called()
+
+    assert cache.get_infos(['1/4', '1/9/1']) == [INFOS['1/4'], INFOS['1/9/1']]
+    ws.get_object_info3.assert_called_once_with({'objects': [{'ref': '1/4'}, {'ref': '1/9/1'}]})
+
+    ws.get_object_info3.reset_mock()
+    assert cache.get_infos([]) == []
+    ws.get_object_info3.assert_not_called()
@@ -0,0 +1,54 @@
+from unittest.mock import call, create_autospec
+
+from pytest import raises
+
+from kb_gtdbtk.core.object_names import WorkspaceNameIndex
+from installed_clients.WorkspaceClient import Workspace
+from core.test_utils import assert_exception_correct
+
+
+def _info(objid, name):
+    return [objid, name, 'KBaseGenomes.Genome-17.0', 'date', 1, 'user', 5, 'ws', 'md5', 10, {}]
+
+
+def _ws_mock(names, page_size):
+    ws = create_autospec(Workspace, spec_set=True, instance=True)
+    infos = [_info(i + 1, n) for i, n in enumerate(names)]
+
+    def list_objects(params):
+        assert params['ids'] == [5]
+        assert params['showHidden'] == 1
+        return [i for i in infos if i[0] >= params['minObjectID']][:page_size]
+    ws.list_objects.side_effect = list_objects
+    return ws
+
+
+def test_name_index(monkeypatch):
+    monkeypatch.setattr('kb_gtdbtk.core.object_names._WS_LIST_LIMIT', 2)
+    ws = _ws_mock(['GTDB_SP_REP-a.Genome', 'query.Genome', 'GTDB_SP_REP-b.Genome',
+                   'GTDB_SP_REP-b-0.Genome', 'GTDB_SPX'], 2)
+    index = WorkspaceNameIndex(ws, 5, 'GTDB_SP_REP-')
+
+    assert index.get_info('GTDB_SP_REP-b.Genome') == _info(3, 'GTDB_SP_REP-b.Genome')
+    assert index.get_info('GTDB_SP_REP-c.Genome') is None
+    assert index.get_free_name(['GTDB_SP_REP-b.Genome', 'GTDB_SP_REP-b-0.Genome',
+                                'GTDB_SP_REP-b-1.Genome']) == 'GTDB_SP_REP-b-1.Genome'
+    assert index.get_free_name(['GTDB_SP_REP-a.Genome']) is None
+    assert ws.list_objects.call_args_list == [
+        call({'ids': [5], 'minObjectID': m, 'showHidden': 1, 'limit': 2}) for m in [1, 3, 5]]
+
+    index.add(_info(6, 'GTDB_SP_REP-c.Genome'))
+    assert index.get_info('GTDB_SP_REP-c.Genome') == _info(6, 'GTDB_SP_REP-c.Genome')
+    assert index.get_free_name(['GTDB_SP_REP-c.Genome', 'GTDB_SP_REP-c-0.Genome']) == \
+        'GTDB_SP_REP-c-0.Genome'
+    assert ws.list_objects.call_count == 3
+
+
+def test_name_index_rejects_other_names():
+    ws = _ws_mock([], 10)
+    index = WorkspaceNameIndex(ws, 5, 'GTDB_SP_REP-')
+
+    with raises(Exception) as got:
+        index.get_info('query.Genome')
+    assert_exception_correct(
+        got.value, ValueError('Object name query.Genome does not start with GTDB_SP_REP-'))
@@ -0,0 +1,80 @@
+import os
+import tempfile
+import zipfile
+
+from pathlib import Path
+
+from kb_gtdbtk.core.report_archive import build_report_archive
+
+
+def test_build_report_archive_symlinks():
+
+    with tempfile.TemporaryDirectory(prefix='test_build_report_archive') as test_dir_str:
+        test_dir = Path(test_dir_str)
+        source = test_dir / 'output'
+        (source / 'classify').mkdir(parents=True)
+        (source / 'links').mkdir()
+        (source / 'classify' / 'summary.tsv').write_text('user_genome\tclassification\n')
+        outside = test_dir / 'genome.fa'
+        outside.write_text('>contig\nACGT\n')
+
+        # a link to a file already in the archive, which is left out
+        os.symlink(source / 'classify' / 'summary.tsv', source / 'links' / 'summary.tsv')
+        # a dangling link, which is skipped
+        os.symlink(test_dir / 'nothere.fa', source / 'links' / 'dangling.fa')
+        # links to a file outside the archive, which is archived once
+        os.symlink(outside, source / 'links' / 'genome1.fa')
+        os.symlink(outside, source / 'links' / 'genome2.fa')
+
+        archive_path = test_dir / 'out.zip'
+        arcnames = build_report_archive(source, archive_path)
+
+        assert arcnames == ['classify/summary.tsv', 'links/genome1.fa']
+        with zipfile.ZipFile(archive_path) as z:
+            assert z.namelist() == arcnames
+            assert z.read('classify/summary.tsv') == b'user_genome\tclassification\n'
+            assert z.read('links/genome1.fa') == b'>contig\nACGT\n'
+
+
+def test_build_report_archive_link_to_excluded_file():
+
+    with tempfile.TemporaryDirectory(prefix='test_build_report_archive') as test_dir_str:
+        test_dir = Path(test_dir_str)
+        source = test_dir / 'output'
+        (source / 'intermediate_results').mkdir(parents=True)
+        (source / 'intermediate_results' / 'tree.tree').write_text('(a,b);')
+        os.symlink(source / 'intermediate_results' / 'tree.tree', source / 'tree.tree')
+
+        archive_path = test_dir / 'out.zip'
+        # the target isn't archived, so the link is
+        arcnames = build_report_archive(source, archive_path, exclude=['intermediate_results'])
+
+        assert arcnames == ['tree.tree']
+        with zipfile.ZipFile(archive_path) as z:
+            assert z.read('tree.tree') == b'(a,b);'
+
+
+def test_build_report_archive_linked_dirs():
+
+    with tempfile.TemporaryDirectory(prefix='test_build_report_archive') as test_dir_str:
+        test_dir = Path(test_dir_str)
+        source = test_dir / 'output'
+        source.mkdir()
+        outside = test_dir / 'genomes'
+        outside.mkdir()
+        (outside / 'genome.fa').write_text('>contig\nACGT\n')
+        (outside / 'plot.png').write_bytes(b'png')
+
+        # a linked directory outside the archive, which is archived
+        os.symlink(outside, source / 'genomes')
+        # a link back to the top of the archive, which would loop
+        os.symlink(source, source / 'genomes_loop')
+
+        archive_path = test_dir / 'out.zip'
+        arcnames = build_report_archive(source, archive_path)
+
+        assert arcnames == ['genomes/genome.fa', 'genomes/plot.png']
+        with zipfile.ZipFile(archive_path) as z:
+            assert z.read('genomes/genome.fa') == b'>contig\nACGT\n'
+            assert z.getinfo('genomes/genome.fa').compress_type == zipfile.ZIP_DEFLATED
+            assert z.getinfo('genomes/plot.png').compress_type == zipfile.ZIP_STORED
@@ -77,10 +77,7 @@ def _check_genomeset(type_, data):
                 {}
                 ],
              'data': {'contigset_ref': '45/21/89'}
-             }
-            ]
-         },
-        {'data': [
+             },
             {'info': [
                 5,
                 'myobj',
@@ -113,9 +110,10 @@ def _check_genomeset(type_, data):
 
     assert clis.dfu().get_objects.call_args_list == [(({'object_refs': ['34567/3/7']},), {})]
 
+    included = ['/assembly_ref', '/contigset_ref']
     assert clis.ws().get_objects2.call_args_list == [
-        (({'objects': [{'ref': '34567/3/7;1/2/3'}]},), {}),
-        (({'objects': [{'ref': '34567/3/7;4/5/6'}]},), {})]
+        (({'objects': [{'ref': '34567/3/7;1/2/3', 'included': included},
+                       {'ref': '34567/3/7;4/5/6', 'included': included}]},), {})]
 
     assert clis.au().get_assembly_as_fasta.call_args_list == [
         (({'ref': '34567/3/7;1/2/3;45/21/89', 'filename': 'somepath/or/other/45_21_89'},), {}),
@@ -152,7 +150,8 @@ def _check_genome(ref_key):
 
     clis.dfu().get_objects.return_value = obj_data
 
-    # duplicate call, could be optimized out with increase in code complexity
+    # duplicate call, could be optimized out with increase in code complexity. Only fetches
+    # the assembly ref though
     clis.ws().get_objects2.return_value = obj_data
 
     clis.au().get_assembly_as_fasta.return_value = {
@@ -164,7 +163,8 @@ def _check_genome(ref_key):
 
     assert clis.dfu().get_objects.call_args_list == [(({'object_refs': ['34567/3/7']},), {})]
 
-    assert clis.ws().get_objects2.call_args_list == [(({'objects': [{'ref': '34567/3/7'}]},), {})]
+    assert clis.ws().get_objects2.call_args_list == [(({'objects': [
+        {'ref': '34567/3/7', 'included': ['/assembly_ref', '/contigset_ref']}]},), {})]
 
     assert clis.au().get_assembly_as_fasta.call_args_list == [
         (({'ref': '34567/3/7;1/2/3', 'filename': 'somepath/or/other/1_2_3'},), {})]
@@ -369,3 +369,138 @@ def test_fail_bad_type():
         download_sequence('34567/3/7', Path('somepath/or/other'), clis)
     assert_exception_correct(
         got.value, ValueError('KBaseGenomes.GenomeComparison type is not supported'))
+
+
+def test_with_assemblyset_concurrent_with_retry():
+    clis = _client_mocks()
+
+    clis.dfu().get_objects.return_value = {
+        'data': [
+            {'info': [
+                3,
+                'myobj',
+                'KBaseSets.AssemblySet-1.0',
+                'ignored time',
+                7,
+                'someuser',
+                34567,
+                'some_workspace',
+                'md5 here',
+                416467216,
+                {}
+                ],
+             'data': {'items': [{'ref': f'1/{i}/3'} for i in range(10)]}
+             }
+        ]
+    }
+
+    failed = []
+
+    def get_fasta(params):
+        objid = params['ref'].split(';')[1].split('/')[1]
+        if objid == '4' and not failed:
+            failed.append(objid)
+            raise ConnectionError('connection reset')
+        return {'path': f'/path/to/file{objid}', 'assembly_name': f'assyname{objid}'}
+
+    clis.au().get_assembly_as_fasta.side_effect = get_fasta
+
+    downloaded = []
+
+    ret = download_sequence('34567/3/7', Path('somepath/or/other'), clis, threads=4, retries=1,
+                            on_download=lambda path, name: downloaded.append((path, name)))
+
+    # order of the results matches the set
+    assert list(ret.items()) == [
+        (Path(f'/path/to/file{i}'), f'assyname{i}') for i in range(10)]
+    # each file is reported once, as it completes
+    assert sorted(downloaded) == sorted(ret.items())
+    assert failed == ['4']
+    assert clis.au().get_assembly_as_fasta.call_count == 11
+
+
+def test_with_assemblyset_fail_after_retries():
+    clis = _client_mocks()
+
+    clis.dfu().get_objects.return_value = {
+        'data': [
+            {'info': [
+                3,
+                'myobj',
+                'KBaseSets.AssemblySet-1.0',
+                'ignored time',
+                7,
+                'someuser',
+                34567,
+                'some_workspace',
+                'md5 here',
+                416467216,
+                {}
+                ],
+             'data': {'items': [{'ref': '1/2/3'}, {'ref': '4/5/6'}]}
+             }
+        ]
+    }
+
+    clis.au().get_assembly_as_fasta.side_effect = ValueError('no such assembly')
+
+    with raises(Exception) as got:
+        download_sequence('34567/3/7', Path('somepath/or/other'), clis, threads=2, retries=1)
+    assert_exception_correct(got.value, ValueError('no such assembly'))
+    assert clis.au().get_assembly_as_fasta.call_count == 4
+
+
+def _assemblyset_get_objects(refs):
+    return {
+        'data': [
+            {'info': [
+                3,
+                'myobj',
+                'KBaseSets.AssemblySet-1.0',
+                'ignored time',
+                7,
+                'someuser',
+                34567,
+                'some_workspace',
+                'md5 here',
+                416467216,
+                {}
+                ],
+             'data': {'items': [{'ref': r} for r in refs]}
+             }
+        ]
+    }
+
+
+def test_with_assemblyset_duplicate_assemblies():
+    clis = _client_mocks()
+    clis.dfu().get_objects.return_value = _assemblyset_get_objects(['1/2/3', '4/5/6', '1/2/3'])
+    clis.au().get_assembly_as_fasta.side_effect = lambda params: {
+        'path': params['filename'], 'assembly_name': 'assy' + params['ref'][-5:]}
+
+    downloaded = []
+
+    ret = download_sequence('34567/3/7', Path('somepath'), clis, threads=4,
+                            on_download=lambda path, name: downloaded.append((path, name)))
+
+    # each file is downloaded and reported once
+    assert ret == {Path('somepath/1_2_3'): 'assy1/2/3', Path('somepath/4_5_6'): 'assy4/5/6'}
+    assert sorted(downloaded) == sorted(ret.items())
+    assert sorted(c[0][0]['ref'] for c in clis.au().get_assembly_as_fasta.call_args_list) == [
+        '34567/3/7;1/2/3', '34567/3/7;4/5/6']
+
+
+def test_with_assemblyset_on_download_fail_not_retried():
+    clis = _client_mocks()
+    clis.dfu().get_objects.return_value = _assemblyset_get_objects(['1/2/3'])
+    clis.au().get_assembly_as_fasta.return_value = {
+        'path': '/path/to/file', 'assembly_name': 'assyname'}
+
+    def on_download(path, name):
+        raise ValueError('identify failed')
+
+    with raises(Exception) as got:
+        download_sequence('34567/3/7', Path('somepath'), clis, threads=2, retries=2,
+                          on_download=on_download)
+    assert_exception_correct(got.value, ValueError('identify failed'))
+    assert clis.au().get_assembly_as_fasta.call_count == 1
@@ -0,0 +1,74 @@
+from unittest.mock import call, create_autospec
+
+from pytest import raises
+
+from kb_gtdbtk.core.shock_handles import ShockHandleOwner
+from installed_clients.AbstractHandleClient import AbstractHandle
+from installed_clients.DataFileUtilClient import DataFileUtil
+from core.test_utils import assert_exception_correct
+
+
+# handles h1 and h3 are for the same node
+SHOCK_IDS = {'h1': 's1', 'h2': 's2', 'h3': 's1', 'h4': 's4'}
+
+
+def _mocks():
+    hs = create_autospec(AbstractHandle, spec_set=True, instance=True)
+    dfu = create_autospec(DataFileUtil, spec_set=True, instance=True)
+    hs.hids_to_handles.side_effect = lambda hids: [{'id': SHOCK_IDS[h], 'hid': h} for h in hids]
+    dfu.own_shock_node.side_effect = lambda params: {
+        'shock_id': params['shock_id'] + '_own',
+        'handle': {'hid': 'new_' + params['shock_id']}}
+    return hs, dfu
+
+
+def test_own_handles_batches_and_memoizes():
+    hs, dfu = _mocks()
+    owner = ShockHandleOwner(hs, dfu, threads=4, batch_size=2)
+
+    assert owner.own_handles(['h1', 'h2', 'h1', 'h3']) == {
+        'h1': 'new_s1', 'h2': 'new_s2', 'h3': 'new_s1'}
+    assert hs.hids_to_handles.call_args_list == [call(['h1', 'h2']), call(['h3'])]
+    assert sorted(c.args[0]['shock_id'] for c in dfu.own_shock_node.call_args_list) == \
+        ['s1', 's2']
+    for c in dfu.own_shock_node.call_args_list:
+        assert c.args[0]['make_handle'] == 1
+
+    hs.hids_to_handles.reset_mock()
+    dfu.own_shock_node.reset_mock()
+    # known handles, and handles already made for the user, aren't looked up again
+    assert owner.own_handles(['h2', 'new_s1', 'h4']) == {
+        'h2': 'new_s2', 'new_s1': 'new_s1', 'h4': 'new_s4'}
+    hs.hids_to_handles.assert_called_once_with(['h4'])
+    dfu.own_shock_node.assert_called_once_with({'shock_id': 's4', 'make_handle': 1})
+
+
+def test_own_handles_empty():
+    hs, dfu = _mocks()
+    owner = ShockHandleOwner(hs, dfu)
+
+    assert owner.own_handles([]) == {}
+    hs.hids_to_handles.assert_not_called()
+    dfu.own_shock_node.assert_not_called()
+
+
+def test_own_handles_matches_handles_by_id():
+    hs, dfu = _mocks()
+    hs.hids_to_handles.side_effect = lambda hids: [
+        {'id': SHOCK_IDS[h], 'hid': h} for h in reversed(hids)]
+    owner = ShockHandleOwner(hs, dfu)
+
+    assert owner.own_handles(['h2', 'h4']) == {'h2': 'new_s2', 'h4': 'new_s4'}
+
+
+def test_own_handles_missing_handle():
+    hs, dfu = _mocks()
+    hs.hids_to_handles.side_effect = lambda hids: [
+        {'id': SHOCK_IDS[h], 'hid': h} for h in hids if h != 'h2']
+    owner = ShockHandleOwner(hs, dfu)
+
+    with raises(Exception) as got:
+        owner.own_handles(['h1', 'h2', 'h4'])
+    assert_exception_correct(
+        got.value, ValueError('The handle service did not return handles for: h2'))
+    dfu.own_shock_node.assert_not_called()
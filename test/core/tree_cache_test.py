@@ -0,0 +1,35 @@
+import os
+import tempfile
+
+from pathlib import Path
+
+from kb_gtdbtk.core.tree_cache import (
+    clear_tree_cache,
+    get_ladderized_leaf_ancestors,
+    get_ladderized_leaf_names,
+    get_ladderized_newick,
+    get_tree_leaf_names
+)
+
+
+def test_tree_cache():
+    with tempfile.TemporaryDirectory(prefix='test_tree_cache') as test_dir_str:
+        tree_path = Path(test_dir_str) / 'test.tree'
+        tree_path.write_text("(('A 1':1,(B:1,C:1)g__x:1)f__y:1,D:1);")
+
+        assert get_tree_leaf_names(tree_path) == ['A 1', 'B', 'C', 'D']
+        assert get_ladderized_leaf_names(tree_path) == ['D', 'A 1', 'B', 'C']
+        assert get_ladderized_leaf_ancestors(tree_path) == [
+            ('D', ['']),
+            ('A 1', ['f__y', '']),
+            ('B', ['g__x', 'f__y', '']),
+            ('C', ['g__x', 'f__y', '']),
+        ]
+        assert get_ladderized_newick(tree_path) == '(D:1,(A 1:1,(B:1,C:1)1:1)1:1);'
+
+        # a rewritten file is read again
+        stat = os.stat(tree_path)
+        tree_path.write_text("(E:1,F:1);")
+        os.utime(tree_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+        assert get_tree_leaf_names(tree_path) == ['E', 'F']
+        clear_tree_cache()
@@ -0,0 +1,76 @@
+import tempfile
+
+from pathlib import Path
+
+from kb_gtdbtk.core.tree_discovery import (
+    discover_trees, get_partial_tree_notes, get_tagged_tree_file_name)
+
+
+def test_discover_trees():
+
+    with tempfile.TemporaryDirectory(prefix='test_discover_trees') as test_dir_str:
+        test_dir = Path(test_dir_str)
+        for file_ in ['gtdbtk.bac120.classify.tree.10.tree',
+                      'gtdbtk.bac120.classify-skip_ani.tree',
+                      'gtdbtk.bac120.classify.tree.2.tree',
+                      'gtdbtk.bac120.classify.tree.2-shard10.tree',
+                      'gtdbtk.bac120.classify.tree.2-shard2.tree',
+                      'gtdbtk.backbone.bac120.classify.tree',
+                      'gtdbtk.bac120.classify.tree',
+                      'gtdbtk.ar53.classify.tree',
+                      # derived files and other output are ignored
+                      'gtdbtk.bac120.classify-trimmed.tree',
+                      'gtdbtk.bac120.classify-ITOL.tree',
+                      'gtdbtk.bac120.summary.tsv',
+                      ]:
+            (test_dir / file_).touch()
+
+        trees = discover_trees(test_dir)
+
+        assert [(t.name, t.domain, t.backbone, t.subtree, t.source) for t in trees] == [
+            ('gtdbtk.ar53.classify.tree', 'ar53', False, None, None),
+            ('gtdbtk.bac120.classify.tree', 'bac120', False, None, None),
+            ('gtdbtk.backbone.bac120.classify.tree', 'bac120', True, None, None),
+            ('gtdbtk.bac120.classify.tree.2.tree', 'bac120', False, 2, None),
+            ('gtdbtk.bac120.classify.tree.10.tree', 'bac120', False, 10, None),
+            ('gtdbtk.bac120.classify.tree.2-shard2.tree', 'bac120', False, 2, 'shard2'),
+            ('gtdbtk.bac120.classify.tree.2-shard10.tree', 'bac120', False, 2, 'shard10'),
+            ('gtdbtk.bac120.classify-skip_ani.tree', 'bac120', False, None, 'skip_ani'),
+        ]
+        assert trees[0].path == test_dir / 'gtdbtk.ar53.classify.tree'
+
+
+def test_discover_trees_missing_dir():
+    assert discover_trees(Path('/no/such/dir')) == []
+
+
+def test_get_tagged_tree_file_name():
+    assert get_tagged_tree_file_name('gtdbtk.bac120.classify.tree.2.tree', 'shard1') == (
+        'gtdbtk.bac120.classify.tree.2-shard1.tree')
+    assert get_tagged_tree_file_name('gtdbtk.ar53.classify.tree', 'skip_ani') == (
+        'gtdbtk.ar53.classify-skip_ani.tree')
+
+
+def test_get_partial_tree_notes():
+
+    with tempfile.TemporaryDirectory(prefix='test_get_partial_tree_notes') as test_dir_str:
+        test_dir = Path(test_dir_str)
+        for file_ in ['gtdbtk.ar53.classify.tree',
+                      'gtdbtk.bac120.classify.tree',
+                      'gtdbtk.bac120.classify-shard1.tree',
+                      'gtdbtk.bac120.classify-skip_ani.tree',
+                      ]:
+            (test_dir / file_).touch()
+
+        assert get_partial_tree_notes(discover_trees(test_dir)) == {
+            'gtdbtk.bac120.classify.tree':
+                'partial tree; the other queries are in gtdbtk.bac120.classify-shard1.tree, '
+                + 'gtdbtk.bac120.classify-skip_ani.tree',
+            'gtdbtk.bac120.classify-shard1.tree':
+                'partial tree of the queries in classify_wf shard 1; the other queries are in '
+                + 'gtdbtk.bac120.classify.tree, gtdbtk.bac120.classify-skip_ani.tree',
+            'gtdbtk.bac120.classify-skip_ani.tree':
+                'partial tree of the queries placed by the second pass, which skips the ANI '
+                + 'screen; the other queries are in gtdbtk.bac120.classify.tree, '
+                + 'gtdbtk.bac120.classify-shard1.tree',
+        }